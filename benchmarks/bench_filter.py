@@ -0,0 +1,117 @@
+"""
+Filter benchmark: old (b, a) filtfilt path vs cached SOS sosfiltfilt.
+
+Runs both on every recording in ekg_system/lab_data and prints, per file:
+  - time per filter_signal call (design + zero-phase filtering)
+  - max difference between the two outputs
+  - sensitivity: how far each output moves when the input is nudged by
+    ~1e-12 relative noise (a well-conditioned filter should barely move)
+  - design error: worst deviation of each form's frequency response from
+    the exact zero/pole/gain response
+
+Usage:
+    python benchmarks/bench_filter.py [--repeat 20] [--tile 1]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.signal import butter, filtfilt, freqz, freqz_zpk, sosfiltfilt, sosfreqz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ekg_system.filters import design_filter  # noqa: E402
+from ekg_system.loaders import read_csv_samples  # noqa: E402
+
+
+FS = 1000
+LOWCUT = 1.0
+HIGHCUT = 100.0
+ORDER = 4
+
+
+def old_path(x):
+    # what filter_signal did before: redesign in (b, a) form every call
+    nyquist = 0.5 * FS
+    b, a = butter(ORDER, [LOWCUT / nyquist, HIGHCUT / nyquist], btype="band")
+    return filtfilt(b, a, x)
+
+
+def new_path(x):
+    sos = design_filter(FS, LOWCUT, HIGHCUT, ORDER, "band", "sos")
+    return sosfiltfilt(sos, x)
+
+
+def time_call(fn, x, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def sensitivity(fn, x, y):
+    rng = np.random.default_rng(0)
+    nudged = x * (1.0 + 1e-12 * rng.standard_normal(len(x)))
+    return float(np.max(np.abs(fn(nudged) - y)) / np.max(np.abs(y)))
+
+
+def design_error():
+    nyquist = 0.5 * FS
+    wn = [LOWCUT / nyquist, HIGHCUT / nyquist]
+
+    z, p, k = butter(ORDER, wn, btype="band", output="zpk")
+    b, a = butter(ORDER, wn, btype="band", output="ba")
+    sos = butter(ORDER, wn, btype="band", output="sos")
+
+    w = np.linspace(0.01, np.pi, 4096)
+    _, h_ref = freqz_zpk(z, p, k, worN=w)
+    _, h_ba = freqz(b, a, worN=w)
+    _, h_sos = sosfreqz(sos, worN=w)
+
+    return float(np.max(np.abs(h_ba - h_ref))), float(np.max(np.abs(h_sos - h_ref)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per path")
+    parser.add_argument("--tile", type=int, default=1, help="repeat each recording N times")
+    args = parser.parse_args()
+
+    lab_data = os.path.join(os.path.dirname(__file__), "..", "ekg_system", "lab_data")
+    files = sorted(glob.glob(os.path.join(lab_data, "*.csv")))
+
+    err_ba, err_sos = design_error()
+    print(f"Design error vs zpk   ba: {err_ba:.2e}   sos: {err_sos:.2e}\n")
+
+    header = f"{'file':<20}{'samples':>10}{'old ms':>10}{'new ms':>10}{'speedup':>9}"
+    header += f"{'max diff':>11}{'sens old':>11}{'sens new':>11}"
+    print(header)
+    print("-" * len(header))
+
+    for path in files:
+        x = np.tile(read_csv_samples(path), args.tile)
+
+        y_old = old_path(x)
+        y_new = new_path(x)
+
+        t_old = time_call(old_path, x, args.repeat)
+        t_new = time_call(new_path, x, args.repeat)
+
+        diff = float(np.max(np.abs(y_old - y_new)) / np.max(np.abs(y_new)))
+
+        print(
+            f"{os.path.basename(path):<20}{len(x):>10}"
+            f"{t_old * 1000:>10.2f}{t_new * 1000:>10.2f}{t_old / t_new:>8.2f}x"
+            f"{diff:>11.2e}{sensitivity(old_path, x, y_old):>11.2e}"
+            f"{sensitivity(new_path, x, y_new):>11.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
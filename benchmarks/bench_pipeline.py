@@ -0,0 +1,311 @@
+"""
+Pipeline benchmark: speed and memory of every analysis stage.
+
+Builds fixed, seeded synthetic recordings (simulator.synthetic_ecg, one
+seed per minute of signal) for each duration x sampling rate, writes each
+one as .npy, .csv, .txt and .ekgb, and times:
+  - EKGProcessor.load_data for every format (CSV without the sidecar cache)
+  - filter_signal, detect_r_peaks, segment_waveforms
+  - ArrhythmiaDetector.generate_report
+  - MSP430Interface.decode_block on the packet stream (first 2**24 samples)
+
+Every stage is run once under tracemalloc for its peak memory (numpy
+allocations included), then --repeat more times untraced; the median
+time is reported, with throughput in samples/s. Results go to a JSON
+file; --compare checks them against a saved baseline and exits with
+status 1 if any stage got slower or bigger than --threshold allows.
+
+Datasets are generated once and kept in the cache dir (EKG_CACHE_DIR,
+default ~/.cache/ekg_system/bench). The 24 h / 8 kHz ones take a while
+and many GB, so the default run is small.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--durations 1m,10m] [--rates 1000,8000]
+        [--repeat 3] [--output results.json] [--compare baseline.json]
+        [--threshold 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ekg_system.arrhythmia_detector import ArrhythmiaDetector  # noqa: E402
+from ekg_system.capture import CaptureWriter  # noqa: E402
+from ekg_system.chunked import iter_chunks  # noqa: E402
+from ekg_system.loaders import csv_cache_dir  # noqa: E402
+from ekg_system.microcontroller import MSP430Interface  # noqa: E402
+from ekg_system.processor import EKGProcessor  # noqa: E402
+from ekg_system.simulator import encode_packets, mv_to_code, synthetic_ecg  # noqa: E402
+
+
+DURATIONS = {"1m": 60, "10m": 600, "1h": 3600, "24h": 86400}
+FORMATS = ("npy", "csv", "txt", "ekgb")
+DECODE_LIMIT = 1 << 24   # samples pushed through the packet decoder
+READ_SIZE = 4096         # bytes per serial read in MSP430Interface._read_loop
+SEED = 1234
+NOISE_FLOOR = 0.005      # seconds; smaller slowdowns are timer noise, never flagged
+FORMAT_VERSION = 2       # 2: dataset names carry the exact rate
+
+
+def dataset_name(duration, fs):
+    return f"{duration}@{fs}Hz"
+
+
+def make_dataset(folder, duration, fs):
+    """Write the seeded recording in every format (once); returns {format: path}."""
+    name = dataset_name(duration, fs).replace("@", "_")
+    paths = {fmt: os.path.join(folder, f"{name}.{fmt}") for fmt in FORMATS}
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    os.makedirs(folder, exist_ok=True)
+    seconds = DURATIONS[duration]
+    n = int(seconds * fs)
+    minute = 60 * fs
+
+    signal = np.lib.format.open_memmap(paths["npy"] + ".tmp", mode="w+", dtype=float, shape=(n,))
+    for i, (start, stop) in enumerate(iter_chunks(n, minute)):
+        chunk, _ = synthetic_ecg(fs, (stop - start) / fs, hr_bpm=500, seed=SEED + i)
+        signal[start:stop] = chunk[:stop - start]
+    signal.flush()
+
+    with open(paths["csv"] + ".tmp", "w") as csv_f, open(paths["txt"] + ".tmp", "w") as txt_f:
+        csv_f.write("time,value\n")
+        txt_f.write(f"---\nMammal:            mouse\nFs:                {fs}\n---\n")
+        for start, stop in iter_chunks(n, minute):
+            t = np.arange(start, stop) / fs
+            np.savetxt(csv_f, np.column_stack([t, signal[start:stop]]), fmt="%.6f,%.6f")
+            np.savetxt(txt_f, signal[start:stop], fmt="%.6f")
+
+    writer = CaptureWriter(paths["ekgb"] + ".tmp", fs=fs, gain=MSP430Interface.GAIN,
+                           vref=MSP430Interface.VREF, full_scale=MSP430Interface.FS)
+    writer.start()
+    for start, stop in iter_chunks(n, minute):
+        codes = mv_to_code(signal[start:stop])
+        writer.write(np.arange(start, stop, dtype=np.uint32), codes, codes // 2)
+    writer.close()
+
+    del signal
+    for fmt, path in paths.items():
+        os.replace(path + ".tmp", path)
+    return paths
+
+
+class Stage:
+    """Times one stage; peak memory is only measured when traced."""
+
+    def __init__(self, traced):
+        self.traced = traced
+
+    def __call__(self, fn, *args, **kwargs):
+        if self.traced:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        seconds = time.perf_counter() - t0
+
+        peak = tracemalloc.get_traced_memory()[1] - base if self.traced else None
+        return out, seconds, peak
+
+
+def decode_stream(packets):
+    # the decoder as _read_loop drives it: fixed-size reads, framing carry-over
+    buf = bytearray()
+    decoded = 0
+    for start in range(0, len(packets), READ_SIZE):
+        buf.extend(packets[start:start + READ_SIZE])
+        sample_ids, _, _, consumed = MSP430Interface.decode_block(buf)
+        if consumed:
+            del buf[:consumed]
+        decoded += len(sample_ids)
+    return decoded
+
+
+def run_once(paths, fs, traced):
+    """All stages once; returns {stage: (seconds, peak bytes or None, samples)}."""
+    stage = Stage(traced)
+    results = {}
+
+    for fmt in FORMATS:
+        processor = EKGProcessor(sampling_rate=fs)
+        _, seconds, peak = stage(processor.load_data, paths[fmt], cache=False)
+        results[f"load_{fmt}"] = (seconds, peak, len(processor.raw_data))
+
+    processor = EKGProcessor(sampling_rate=fs)
+    processor.load_data(paths["npy"])
+    n = len(processor.raw_data)
+
+    _, seconds, peak = stage(processor.filter_signal)
+    results["filter_signal"] = (seconds, peak, n)
+
+    peaks, seconds, peak = stage(processor.detect_r_peaks)
+    results["detect_r_peaks"] = (seconds, peak, n)
+
+    waves, seconds, peak = stage(processor.segment_waveforms)
+    results["segment_waveforms"] = (seconds, peak, n)
+
+    detector = ArrhythmiaDetector(sampling_rate=fs)
+    _, seconds, peak = stage(detector.generate_report, np.diff(peaks), waves, peaks)
+    results["generate_report"] = (seconds, peak, n)
+
+    m = min(n, DECODE_LIMIT)
+    codes = mv_to_code(processor.raw_data[:m])
+    packets = encode_packets(np.arange(m), codes, codes // 2)
+    decoded, seconds, peak = stage(decode_stream, packets)
+    if decoded != m:
+        raise RuntimeError(f"decoder returned {decoded} of {m} samples")
+    results["decode_packets"] = (seconds, peak, m)
+
+    return results
+
+
+def bench_dataset(paths, duration, fs, repeat):
+    tracemalloc.start()
+    try:
+        traced = run_once(paths, fs, traced=True)
+    finally:
+        tracemalloc.stop()
+
+    timings = [run_once(paths, fs, traced=False) for _ in range(repeat)]
+
+    rows = []
+    for name, (seconds, peak, samples) in traced.items():
+        times = [t[name][0] for t in timings] or [seconds]
+        median = float(np.median(times))
+        rows.append({
+            "dataset": dataset_name(duration, fs),
+            "duration_s": DURATIONS[duration],
+            "fs": fs,
+            "stage": name,
+            "samples": samples,
+            "seconds": median,
+            "samples_per_s": samples / median if median > 0 else None,
+            "peak_mem_mb": peak / 2**20,
+            "runs": len(times),
+        })
+    return rows
+
+
+def environment():
+    import scipy
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        "format": FORMAT_VERSION,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Rows that got slower or use more memory than baseline * (1 + threshold).
+    Slowdowns under NOISE_FLOOR seconds are not counted.
+    """
+    base = {(r["dataset"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+
+    header = f"{'dataset':<12}{'stage':<20}{'base s':>10}{'now s':>10}{'time':>9}{'base MB':>10}{'now MB':>10}{'mem':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+
+    for row in results:
+        old = base.get((row["dataset"], row["stage"]))
+        if old is None:
+            continue
+
+        d_time = row["seconds"] / old["seconds"] - 1 if old["seconds"] > 0 else 0.0
+        d_mem = row["peak_mem_mb"] / old["peak_mem_mb"] - 1 if old["peak_mem_mb"] > 0 else 0.0
+        flags = []
+        if d_time > threshold and row["seconds"] - old["seconds"] > NOISE_FLOOR:
+            flags.append("SLOWER")
+        if d_mem > threshold:
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append((row, flags))
+
+        print(
+            f"{row['dataset']:<12}{row['stage']:<20}{old['seconds']:>10.4f}{row['seconds']:>10.4f}"
+            f"{d_time * 100:>+8.1f}%{old['peak_mem_mb']:>10.1f}{row['peak_mem_mb']:>10.1f}"
+            f"{d_mem * 100:>+8.1f}%  {' '.join(flags)}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--durations", default="1m,10m", help=f"comma list of {','.join(DURATIONS)}")
+    parser.add_argument("--rates", default="1000,8000", help="comma list of sampling rates in Hz")
+    parser.add_argument("--repeat", type=int, default=3, help="untraced timed runs per dataset")
+    parser.add_argument("--data-dir", default=os.path.join(csv_cache_dir(), "bench"),
+                        help="where generated datasets are kept (default: %(default)s)")
+    parser.add_argument("--output", default="bench_pipeline.json", help="results JSON (default: %(default)s)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON to check against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown / memory growth vs baseline (default: %(default)s)")
+    args = parser.parse_args()
+
+    durations = [d.strip() for d in args.durations.split(",") if d.strip()]
+    unknown = [d for d in durations if d not in DURATIONS]
+    if unknown:
+        parser.error(f"unknown duration(s) {', '.join(unknown)}; choose from {', '.join(DURATIONS)}")
+    rates = [int(r) for r in args.rates.split(",") if r.strip()]
+
+    results = []
+    header = f"{'dataset':<12}{'stage':<20}{'samples':>12}{'seconds':>10}{'M samples/s':>13}{'peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for duration in durations:
+        for fs in rates:
+            paths = make_dataset(args.data_dir, duration, fs)
+            for row in bench_dataset(paths, duration, fs, args.repeat):
+                results.append(row)
+                rate = row["samples_per_s"] or 0.0
+                print(
+                    f"{row['dataset']:<12}{row['stage']:<20}{row['samples']:>12}"
+                    f"{row['seconds']:>10.4f}{rate / 1e6:>13.2f}{row['peak_mem_mb']:>10.1f}",
+                    flush=True,
+                )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
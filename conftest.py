@@ -0,0 +1,2 @@
+# Lets a plain `pytest` run from the repo root import ekg_system
+# (python -m pytest already has the working directory on sys.path).
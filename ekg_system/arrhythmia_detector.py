@@ -2,6 +2,8 @@
 # Used after Analyze button runs in the UI
 
 import numpy as np
+from collections import deque
+from collections.abc import Sequence
 from typing import Dict, List, Tuple
 from enum import Enum
 
@@ -25,6 +27,133 @@ class WaveformType(Enum):
     INVERTED_T = "T-wave Inversion"
 
 
+# rhythm rules in the order they're checked for each beat; the index is the
+# event "type" code stored in event tables
+EVENT_TYPES = [
+    ArrhythmiaType.TACHYCARDIA,
+    ArrhythmiaType.BRADYCARDIA,
+    ArrhythmiaType.IRREGULAR,
+    ArrhythmiaType.PREMATURE_BEAT,
+    ArrhythmiaType.PAUSE,
+]
+EVENT_CODES = {t: code for code, t in enumerate(EVENT_TYPES)}
+
+# waveform label codes used by classify_waveforms (0 = normal)
+WAVEFORM_TYPES = [
+    WaveformType.NORMAL,
+    WaveformType.WIDE_QRS,
+    WaveformType.ELEVATED_ST,
+    WaveformType.DEPRESSED_ST,
+    WaveformType.INVERTED_T,
+]
+
+# one row per flagged beat/rule. value is the number the description is
+# built from: HR (BPM) for rate events, deviation in SD for irregular,
+# RR (samples) for premature beats and pauses
+EVENT_DTYPE = np.dtype([("type", "u1"), ("beat", "<i8"), ("value", "<f8")])
+
+
+def describe_event(arr_type: ArrhythmiaType, value: float, sampling_rate: int) -> str:
+    # human readable text for one event, only built when something shows it
+    if arr_type == ArrhythmiaType.TACHYCARDIA:
+        return f"Heart rate: {value:.1f} BPM (elevated)"
+    if arr_type == ArrhythmiaType.BRADYCARDIA:
+        return f"Heart rate: {value:.1f} BPM (reduced)"
+    if arr_type == ArrhythmiaType.IRREGULAR:
+        return f"RR interval deviation: {value:.2f} SD"
+    if arr_type == ArrhythmiaType.PREMATURE_BEAT:
+        return "Premature beat detected with compensatory pause"
+    if arr_type == ArrhythmiaType.PAUSE:
+        return f"Pause detected: {value / sampling_rate * 1000:.1f} ms"
+    return arr_type.value
+
+
+class EventDetails(Sequence):
+    # list-like view of an event table that formats each
+    # {"type", "beat_number", "description"} dict only when it's accessed
+    def __init__(self, events: np.ndarray, sampling_rate: int):
+        self.events = events
+        self.sampling_rate = sampling_rate
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        code, beat, value = self.events[i]
+        arr_type = EVENT_TYPES[code]
+        return {
+            "type": arr_type.value,
+            "beat_number": int(beat),
+            "description": describe_event(arr_type, float(value), self.sampling_rate),
+        }
+
+
+class WaveformDetails(Sequence):
+    # list-like {"beat_number", "type"} view of the abnormal beats in a
+    # per-beat WAVEFORM_TYPES code array
+    def __init__(self, codes: np.ndarray):
+        self.beats = np.flatnonzero(codes)
+        self.codes = codes[self.beats]
+
+    def __len__(self):
+        return len(self.beats)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        return {
+            "beat_number": int(self.beats[i]),
+            "type": WAVEFORM_TYPES[self.codes[i]].value,
+        }
+
+
+def beat_matrix(waveforms) -> Tuple[np.ndarray, np.ndarray]:
+    # turns beats into an (n_beats, width) float matrix with every beat's
+    # samples starting at column 0, plus how many samples each row really
+    # has. Takes the masked matrix from EKGProcessor.segment_waveforms,
+    # a plain 2D array or the old list of variable-length slices
+    if isinstance(waveforms, np.ma.MaskedArray):
+        valid = ~np.ma.getmaskarray(waveforms)
+        data = np.ma.getdata(waveforms).astype(float)
+        n_beats, width = data.shape
+
+        # edge beats are masked on the left → shift them back to column 0
+        lengths = valid.sum(axis=1)
+        first = np.argmax(valid, axis=1)
+        cols = np.minimum(first[:, None] + np.arange(width), width - 1)
+        data = np.take_along_axis(data, cols, axis=1)
+
+    elif isinstance(waveforms, np.ndarray) and waveforms.ndim == 2:
+        data = waveforms.astype(float)
+        lengths = np.full(len(data), data.shape[1], dtype=np.intp)
+
+    else:
+        lengths = np.array([len(w) for w in waveforms], dtype=np.intp)
+        width = int(lengths.max()) if len(lengths) else 0
+        data = np.zeros((len(lengths), width))
+        if len(lengths):
+            data[np.arange(width) < lengths[:, None]] = np.concatenate(waveforms)
+
+    # zero past the end of each beat so window sums only see real samples
+    data[np.arange(data.shape[1]) >= lengths[:, None]] = 0
+    return data, lengths
+
+
+def _window_mean(data: np.ndarray, start: int, end: np.ndarray) -> np.ndarray:
+    # mean of data[i, start:end[i]] per row (nan where the window is empty)
+    stop = int(end.max()) if len(end) else start
+    if stop <= start:
+        return np.full(len(data), np.nan)
+
+    total = np.sum(data[:, start:stop], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return total / (end - start)
+
+
 class ArrhythmiaDetector:
     # simple arrhythmia rule checks tuned for mice (fast HR)
     def __init__(self, sampling_rate: int = 1000):
@@ -33,60 +162,66 @@ class ArrhythmiaDetector:
         self.normal_hr_range = (400, 700)
         self.tachycardia_threshold = 700
         self.bradycardia_threshold = 400
-        
-    def analyze_rhythm(self, rr_intervals: np.ndarray) -> List[Tuple[ArrhythmiaType, int, str]]:
-        # checks beat-to-beat timing differences
-        arrhythmias = []
-        
-        heart_rates = 60.0 * self.sampling_rate / rr_intervals
 
-        rr_mean = np.mean(rr_intervals)
-        rr_std = np.std(rr_intervals)
+    def streaming(self, window: int = 64) -> "StreamingRhythmAnalyzer":
+        # beat-by-beat version of analyze_rhythm for live / chunked data
+        return StreamingRhythmAnalyzer(self, window=window)
         
-        for i, (rr, hr) in enumerate(zip(rr_intervals, heart_rates)):
-            
-            # faster than usual → tachycardia
-            if hr > self.tachycardia_threshold:
-                arrhythmias.append((
-                    ArrhythmiaType.TACHYCARDIA,
-                    i,
-                    f"Heart rate: {hr:.1f} BPM (elevated)"
-                ))
-            
-            # slower → bradycardia
-            elif hr < self.bradycardia_threshold:
-                arrhythmias.append((
-                    ArrhythmiaType.BRADYCARDIA,
-                    i,
-                    f"Heart rate: {hr:.1f} BPM (reduced)"
-                ))
-
-            # really different timing from others → irregular
-            if abs(rr - rr_mean) > 2 * rr_std:
-                arrhythmias.append((
-                    ArrhythmiaType.IRREGULAR,
-                    i,
-                    f"RR interval deviation: {abs(rr - rr_mean) / rr_std:.2f} SD"
-                ))
-            
-            # quick beat followed by a long pause → premature beat pattern
-            if i < len(rr_intervals) - 1:
-                if rr < 0.7 * rr_mean and rr_intervals[i + 1] > 1.3 * rr_mean:
-                    arrhythmias.append((
-                        ArrhythmiaType.PREMATURE_BEAT,
-                        i,
-                        "Premature beat detected with compensatory pause"
-                    ))
-            
-            # very long gap → possible conduction block
-            if rr > 1.5 * rr_mean:
-                arrhythmias.append((
-                    ArrhythmiaType.PAUSE,
-                    i,
-                    f"Pause detected: {rr / self.sampling_rate * 1000:.1f} ms"
-                ))
-                
-        return arrhythmias
+    def analyze_rhythm_table(self, rr_intervals: np.ndarray) -> np.ndarray:
+        # checks beat-to-beat timing differences, every rule as one mask
+        # over the RR array. Returns an EVENT_DTYPE table ordered by beat,
+        # then by rule, i.e. the same order analyze_rhythm lists them in
+        rr = np.asarray(rr_intervals, dtype=float)
+        if len(rr) == 0:
+            return np.empty(0, dtype=EVENT_DTYPE)
+
+        heart_rates = 60.0 * self.sampling_rate / rr
+
+        rr_mean = np.mean(rr)
+        rr_std = np.std(rr)
+        deviation = np.abs(rr - rr_mean)
+
+        # faster than usual → tachycardia, slower → bradycardia
+        tachy = heart_rates > self.tachycardia_threshold
+        brady = ~tachy & (heart_rates < self.bradycardia_threshold)
+
+        # really different timing from others → irregular
+        irregular = deviation > 2 * rr_std
+
+        # quick beat followed by a long pause → premature beat pattern
+        premature = np.zeros(len(rr), dtype=bool)
+        premature[:-1] = (rr[:-1] < 0.7 * rr_mean) & (rr[1:] > 1.3 * rr_mean)
+
+        # very long gap → possible conduction block
+        pause = rr > 1.5 * rr_mean
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            irregular_sd = deviation / rr_std
+
+        rules = [
+            (tachy, heart_rates),
+            (brady, heart_rates),
+            (irregular, irregular_sd),
+            (premature, rr),
+            (pause, rr),
+        ]
+
+        beats = [np.flatnonzero(mask) for mask, _ in rules]
+        table = np.empty(sum(len(b) for b in beats), dtype=EVENT_DTYPE)
+        table["type"] = np.repeat(np.arange(len(rules)), [len(b) for b in beats])
+        table["beat"] = np.concatenate(beats)
+        table["value"] = np.concatenate([values[b] for (_, values), b in zip(rules, beats)])
+
+        return table[np.lexsort((table["type"], table["beat"]))]
+
+    def analyze_rhythm(self, rr_intervals: np.ndarray) -> List[Tuple[ArrhythmiaType, int, str]]:
+        # old list-of-tuples form, formats a description for every event;
+        # prefer analyze_rhythm_table on long recordings
+        events = self.analyze_rhythm_table(rr_intervals)
+        return [
+            (EVENT_TYPES[code], beat, describe_event(EVENT_TYPES[code], value, self.sampling_rate))
+            for code, beat, value in events.tolist()
+        ]
         
     def classify_waveform(self, waveform: np.ndarray, peak_idx: int) -> WaveformType:
         # looks at shape near the R-peak: width, ST, T-wave
@@ -125,26 +260,72 @@ class ArrhythmiaDetector:
                 return WaveformType.INVERTED_T
                 
         return WaveformType.NORMAL
+
+    def classify_waveforms(self, waveforms, peak_idx: int) -> np.ndarray:
+        # classify_waveform for every beat at once (same labels), returns
+        # one WAVEFORM_TYPES code per beat
+        data, lengths = beat_matrix(waveforms)
+        return self._classify_matrix(data, lengths, peak_idx)
+
+    def _classify_matrix(self, data: np.ndarray, lengths: np.ndarray, peak_idx: int) -> np.ndarray:
+        codes = np.zeros(len(lengths), dtype=np.uint8)
+        if len(lengths) == 0:
+            return codes
+
+        # too short to judge → stays normal
+        todo = lengths >= peak_idx + 50
+
+        # width around R wave
+        qrs_width = np.minimum(lengths, peak_idx + 30) - max(0, peak_idx - 30)
+        wide = todo & (qrs_width > 40)
+        codes[wide] = 1
+        todo &= ~wide
+        if not todo.any():
+            return codes
+
+        data, lengths = data[todo], lengths[todo]
+        rows = np.flatnonzero(todo)
+
+        valid = np.arange(data.shape[1]) < lengths[:, None]
+        peak = np.max(np.where(valid, data, -np.inf), axis=1)
+        baseline = np.mean(data[:, :max(1, peak_idx - 50)], axis=1)
+
+        # ST segment shift vs baseline
+        st_start = peak_idx + 30
+        st_end = np.minimum(lengths, peak_idx + 60)
+        st_shift = _window_mean(data, st_start, st_end) - baseline
+        has_st = st_end > st_start
+
+        elevated = has_st & (st_shift > 0.1 * peak)
+        depressed = has_st & ~elevated & (st_shift < -0.1 * peak)
+
+        # T-wave below zero
+        t_start = peak_idx + 60
+        t_end = np.minimum(lengths, peak_idx + 120)
+        inverted = (t_end > t_start) & (_window_mean(data, t_start, t_end) < -0.05 * peak)
+
+        sub = np.where(elevated, 2, np.where(depressed, 3, np.where(inverted, 4, 0)))
+        codes[rows] = sub
+        return codes
         
-    def generate_report(self, rr_intervals: np.ndarray, waveforms: List[np.ndarray], peaks: np.ndarray) -> Dict:
+    def generate_report(self, rr_intervals: np.ndarray, waveforms, peaks: np.ndarray) -> Dict:
         # bundles timing + waveform results into one report
-        arrhythmias = self.analyze_rhythm(rr_intervals)
-        
-        # classify any unusual shapes
-        waveform_classifications = []
-        window_size = len(waveforms[0]) // 2 if waveforms else 100
+        events = self.analyze_rhythm_table(rr_intervals)
         
-        for i, wf in enumerate(waveforms):
-            wf_type = self.classify_waveform(wf, window_size)
-            if wf_type != WaveformType.NORMAL:
-                waveform_classifications.append((i, wf_type))
+        # classify any unusual shapes, all beats in one go
+        data, lengths = beat_matrix(waveforms)
+        window_size = int(lengths[0]) // 2 if len(lengths) else 100
+        waveform_codes = self._classify_matrix(data, lengths, window_size)
+        waveform_details = WaveformDetails(waveform_codes)
 
         heart_rates = 60.0 * self.sampling_rate / rr_intervals
         
-        # count how often each rhythm issue shows up
-        arrhythmia_counts = {}
-        for arr_type, _, _ in arrhythmias:
-            arrhythmia_counts[arr_type.value] = arrhythmia_counts.get(arr_type.value, 0) + 1
+        # count how often each rhythm issue shows up (keys in order of
+        # first appearance, like the old per-event loop)
+        codes, first, counts = np.unique(events["type"], return_index=True, return_counts=True)
+        arrhythmia_counts = {
+            EVENT_TYPES[codes[k]].value: int(counts[k]) for k in np.argsort(first)
+        }
             
         # build UI-friendly result dictionary
         return {
@@ -153,26 +334,145 @@ class ArrhythmiaDetector:
             "hr_std": np.std(heart_rates),
             "min_heart_rate": np.min(heart_rates),
             "max_heart_rate": np.max(heart_rates),
-            "arrhythmias_detected": len(arrhythmias),
+            "arrhythmias_detected": len(events),
             "arrhythmia_counts": arrhythmia_counts,
-            "arrhythmia_details": [
-                {"type": a[0].value, "beat_number": a[1], "description": a[2]}
-                for a in arrhythmias
-            ],
-            "abnormal_waveforms": len(waveform_classifications),
-            "waveform_details": [
-                {"beat_number": idx, "type": wf.value}
-                for idx, wf in waveform_classifications
-            ]
+            # compact table; details are formatted only when looked at
+            "arrhythmia_events": events,
+            "arrhythmia_details": EventDetails(events, self.sampling_rate),
+            "abnormal_waveforms": len(waveform_details),
+            "waveform_codes": waveform_codes,
+            "waveform_details": waveform_details,
         }
         
     def label_beats(self, peaks: np.ndarray, rr_intervals: np.ndarray) -> List[str]:
         # returns a simple string label per beat (helps for debugging/plots)
-        labels = ["Normal"] * len(peaks)
-        arrhythmias = self.analyze_rhythm(rr_intervals)
-        
-        for arr_type, idx, _ in arrhythmias:
-            if idx < len(labels):
-                labels[idx] = arr_type.value
-                
-        return labels
+        labels = np.full(len(peaks), "Normal", dtype=object)
+        events = self.analyze_rhythm_table(rr_intervals)
+        events = events[events["beat"] < len(labels)]
+
+        # a later event on the same beat overwrites an earlier one
+        if len(events):
+            beats = events["beat"]
+            last = np.append(beats[1:] != beats[:-1], True)
+            names = np.array([t.value for t in EVENT_TYPES], dtype=object)
+            labels[beats[last]] = names[events["type"][last]]
+
+        return labels.tolist()
+
+
+class StreamingRhythmAnalyzer:
+    # analyze_rhythm for RR intervals that arrive one (or a few) at a time.
+    # The RR mean/std come from a rolling window of the last `window` beats
+    # (shifted running sums, so O(1) per beat and constant memory) instead
+    # of the whole recording. Events come out as soon as they are certain:
+    # rate, irregular and pause on the beat itself, premature beats one
+    # beat later once the compensatory pause is seen.
+    def __init__(self, detector: ArrhythmiaDetector, window: int = 64, min_beats: int = 8):
+        self.detector = detector
+        self.window = window
+        # rules based on RR statistics wait for this many beats of history
+        self.min_beats = min_beats
+        self.reset()
+
+    def reset(self):
+        self.beat_count = 0
+        self.last_peak = None
+
+        self._rr = deque(maxlen=self.window)
+        self._ref = None   # shift for the running sums (numerical stability)
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._since_refresh = 0
+
+        # (beat index, rr, rr mean) of the previous beat, for the premature check
+        self._prev = None
+
+    def skip(self):
+        # a gap in the stream: the next peak starts a new RR chain (an RR
+        # across the gap would span missed beats), the RR statistics stay
+        self.last_peak = None
+        self._prev = None
+
+    def _push(self, rr: float):
+        if self._ref is None:
+            self._ref = rr
+
+        if len(self._rr) == self.window:
+            old = self._rr[0] - self._ref
+            self._sum -= old
+            self._sum_sq -= old * old
+
+        self._rr.append(rr)
+        d = rr - self._ref
+        self._sum += d
+        self._sum_sq += d * d
+
+        # redo the sums from scratch now and then so rounding can't build up
+        self._since_refresh += 1
+        if self._since_refresh >= self.window:
+            vals = np.asarray(self._rr) - self._ref
+            self._sum = float(np.sum(vals))
+            self._sum_sq = float(np.sum(vals * vals))
+            self._since_refresh = 0
+
+    def stats(self) -> Tuple[float, float]:
+        # rolling (mean, std) of the RR intervals in the window
+        n = len(self._rr)
+        mean = self._sum / n
+        var = max(0.0, self._sum_sq / n - mean * mean)
+        return self._ref + mean, float(np.sqrt(var))
+
+    def add(self, rr: float) -> List[Tuple[ArrhythmiaType, int, str]]:
+        # feed one RR interval (in samples), get the events it confirms
+        det = self.detector
+        events = []
+
+        i = self.beat_count
+        self.beat_count += 1
+        rr = float(rr)
+
+        self._push(rr)
+        rr_mean, rr_std = self.stats()
+        ready = len(self._rr) >= self.min_beats
+
+        # previous beat was early and this one is the compensatory pause
+        if self._prev is not None:
+            p_i, p_rr, p_mean = self._prev
+            if p_rr < 0.7 * p_mean and rr > 1.3 * p_mean:
+                events.append(self._event(ArrhythmiaType.PREMATURE_BEAT, p_i, p_rr))
+        self._prev = (i, rr, rr_mean) if ready else None
+
+        hr = 60.0 * det.sampling_rate / rr
+
+        if hr > det.tachycardia_threshold:
+            events.append(self._event(ArrhythmiaType.TACHYCARDIA, i, hr))
+        elif hr < det.bradycardia_threshold:
+            events.append(self._event(ArrhythmiaType.BRADYCARDIA, i, hr))
+
+        if ready:
+            # a zero SD (clamped variance) leaves only rounding in rr - rr_mean
+            if rr_std > 0 and abs(rr - rr_mean) > 2 * rr_std:
+                events.append(self._event(ArrhythmiaType.IRREGULAR, i, abs(rr - rr_mean) / rr_std))
+
+            if rr > 1.5 * rr_mean:
+                events.append(self._event(ArrhythmiaType.PAUSE, i, rr))
+
+        return events
+
+    def _event(self, arr_type: ArrhythmiaType, beat: int, value: float) -> Tuple[ArrhythmiaType, int, str]:
+        return (arr_type, beat, describe_event(arr_type, value, self.detector.sampling_rate))
+
+    def add_many(self, rr_intervals: np.ndarray) -> List[Tuple[ArrhythmiaType, int, str]]:
+        events = []
+        for rr in np.asarray(rr_intervals, dtype=float).tolist():
+            events.extend(self.add(rr))
+        return events
+
+    def add_peaks(self, peaks: np.ndarray) -> List[Tuple[ArrhythmiaType, int, str]]:
+        # same, from absolute R-peak sample indices (e.g. OnlinePeakDetector)
+        events = []
+        for p in np.asarray(peaks).tolist():
+            if self.last_peak is not None:
+                events.extend(self.add(p - self.last_peak))
+            self.last_peak = p
+        return events
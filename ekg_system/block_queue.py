@@ -0,0 +1,159 @@
+import threading
+from collections import deque
+
+
+class BlockQueue:
+    """
+    Bounded hand-off of sample blocks between the serial reader thread
+    and a consumer (the live view's plot timer). The bound is in samples,
+    not blocks, so memory stays fixed however the reads are sized.
+
+    When a block doesn't fit, `policy` decides:
+      - "drop_oldest": discard queued blocks from the front (the display
+        wants the newest data; a block bigger than the whole queue keeps
+        only its last max_samples)
+      - "drop_newest": discard the incoming block
+      - "block": wait up to put_timeout seconds for the consumer to make
+        room, then drop the incoming block. The reader must never wait
+        long, or the device's serial buffer overflows instead.
+
+    Every put and drop is counted; stats() returns the counters and the
+    high-water mark (most samples ever queued at once).
+
+        q = BlockQueue(5000)
+        q.put(sample_ids, ch1, ch2)       # reader thread
+        for sids, ch1, ch2 in q.drain():  # consumer
+            ...
+    """
+
+    POLICIES = ("drop_oldest", "drop_newest", "block")
+
+    def __init__(self, max_samples, policy="drop_oldest", put_timeout=0.1):
+        if max_samples <= 0:
+            raise ValueError("max_samples must be positive")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, expected one of {self.POLICIES}")
+
+        self.max_samples = int(max_samples)
+        self.policy = policy
+        self.put_timeout = put_timeout
+
+        self._blocks = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.blocks_in = 0
+        self.samples_in = 0
+        self.blocks_out = 0
+        self.samples_out = 0
+        self.dropped_blocks = 0
+        self.dropped_samples = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return self._size
+
+    def _drop(self, n_samples):
+        self.dropped_blocks += 1
+        self.dropped_samples += n_samples
+
+    def put(self, *columns):
+        """
+        Queue one block (equal-length arrays, e.g. sample_ids, ch1, ch2).
+        Returns how many samples the overflow policy dropped for it.
+        """
+        n = len(columns[0])
+        if n == 0:
+            return 0
+
+        with self._cond:
+            self.blocks_in += 1
+            self.samples_in += n
+            dropped = 0
+
+            if n > self.max_samples:
+                if self.policy != "drop_oldest":
+                    self._drop(n)
+                    return n
+                # only the tail of an oversized block can ever fit
+                cut = n - self.max_samples
+                columns = tuple(c[cut:] for c in columns)
+                self.dropped_samples += cut
+                dropped += cut
+                n = self.max_samples
+
+            if self.policy == "block" and self._size + n > self.max_samples:
+                self._cond.wait_for(
+                    lambda: self._size + n <= self.max_samples, timeout=self.put_timeout
+                )
+
+            if self._size + n > self.max_samples:
+                if self.policy == "drop_oldest":
+                    while self._size + n > self.max_samples:
+                        old = self._blocks.popleft()
+                        self._size -= len(old[0])
+                        self._drop(len(old[0]))
+                        dropped += len(old[0])
+                else:
+                    self._drop(n)
+                    return dropped + n
+
+            self._blocks.append(columns)
+            self._size += n
+            self.high_water = max(self.high_water, self._size)
+            self._cond.notify_all()
+
+        return dropped
+
+    def get(self, timeout=None):
+        """The oldest block, waiting up to timeout seconds; None if there is none."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._blocks, timeout=timeout):
+                return None
+            return self._take()
+
+    def drain(self, max_samples=None):
+        """Every queued block (or whole blocks up to max_samples), oldest first, without waiting."""
+        out = []
+        with self._cond:
+            taken = 0
+            while self._blocks:
+                n = len(self._blocks[0][0])
+                if max_samples is not None and out and taken + n > max_samples:
+                    break
+                out.append(self._take())
+                taken += n
+        return out
+
+    def _take(self):
+        block = self._blocks.popleft()
+        n = len(block[0])
+        self._size -= n
+        self.blocks_out += 1
+        self.samples_out += n
+        self._cond.notify_all()
+        return block
+
+    def clear(self):
+        """Empty the queue and zero the counters (a new acquisition)."""
+        with self._cond:
+            self._blocks.clear()
+            self._size = 0
+            self._reset_counters()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": self._size,
+                "max_samples": self.max_samples,
+                "high_water": self.high_water,
+                "blocks_in": self.blocks_in,
+                "samples_in": self.samples_in,
+                "blocks_out": self.blocks_out,
+                "samples_out": self.samples_out,
+                "dropped_blocks": self.dropped_blocks,
+                "dropped_samples": self.dropped_samples,
+            }
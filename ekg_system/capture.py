@@ -0,0 +1,271 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+CAPTURE_EXT = ".ekgb"
+
+
+class CaptureWriter:
+    """
+    Writes live MSP430 samples to a compact binary capture file on a
+    background thread.
+
+    File layout (little endian):
+      [0:64]   header
+                 magic        8s   b"EKGCAP01"
+                 version      u16
+                 header_size  u16
+                 fs           f64  sampling rate (Hz)
+                 gain         f64  ADS1292R PGA gain
+                 vref         f64  reference voltage (V)
+                 full_scale   u32  ADC full-scale code (2**23 - 1)
+                 start_time   f64  unix time the capture was opened
+                 (zero padded to header_size)
+      [64:]    records, RECORD_DTYPE (sample_id u32, ch1 i32, ch2 i32)
+
+    ch1/ch2 are raw ADC codes, codes_to_mv() turns them into millivolts
+    with the gain/vref stored in the header.
+
+    The header is fsync'd before any samples are written and records are
+    only ever appended as whole blocks, so after a crash the file is
+    still readable; read_capture() ignores a trailing partial record.
+
+        w = CaptureWriter(path, fs=1000, gain=6, vref=2.42)
+        w.start()
+        w.write(sample_ids, ch1, ch2)   # any thread, never blocks
+        w.close()
+    """
+
+    MAGIC = b"EKGCAP01"
+    VERSION = 1
+    HEADER_SIZE = 64
+    HEADER = struct.Struct("<8sHHdddId")
+
+    RECORD_DTYPE = np.dtype([
+        ("sample_id", "<u4"),
+        ("ch1", "<i4"),
+        ("ch2", "<i4"),
+    ])
+
+    def __init__(self, path, fs, gain, vref, full_scale=(2**23 - 1),
+                 csv_path=None, flush_interval=1.0):
+        self.path = path
+        self.fs = fs
+        self.gain = gain
+        self.vref = vref
+        self.full_scale = full_scale
+        self.csv_path = csv_path
+        self.flush_interval = flush_interval
+
+        self.samples_written = 0
+        self.error = None
+
+        self._q = queue.SimpleQueue()
+        self._thread = None
+        self._f = None
+        self._csv_f = None
+
+    def start(self):
+        self._f = open(self.path, "wb")
+        header = self.HEADER.pack(
+            self.MAGIC,
+            self.VERSION,
+            self.HEADER_SIZE,
+            float(self.fs),
+            float(self.gain),
+            float(self.vref),
+            int(self.full_scale),
+            time.time(),
+        )
+        self._f.write(header.ljust(self.HEADER_SIZE, b"\0"))
+        self._sync()
+
+        if self.csv_path:
+            self._csv_f = open(self.csv_path, "w", newline="")
+            self._csv_f.write("sample_id,ch1,ch2\n")
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, sample_ids, ch1, ch2):
+        """
+        Queue one block of samples (raw ADC codes) for writing. Raises
+        RuntimeError once the writer is closed or its thread has failed,
+        instead of queuing samples that would never reach the file.
+        """
+        if self.error is not None:
+            raise RuntimeError(f"Capture writer failed: {self.error}") from self.error
+        if self._thread is None or not self._thread.is_alive():
+            raise RuntimeError("Capture writer is not running")
+
+        block = np.empty(len(sample_ids), dtype=self.RECORD_DTYPE)
+        block["sample_id"] = sample_ids
+        block["ch1"] = ch1
+        block["ch2"] = ch2
+        self._q.put(block)
+
+    def close(self):
+        """Write everything still queued, flush to disk and close."""
+        if self._thread is None:
+            return
+
+        self._q.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _sync(self):
+        self._f.flush()
+        try:
+            os.fsync(self._f.fileno())
+        except OSError:
+            pass
+
+    def _run(self):
+        last_flush = time.monotonic()
+        done = False
+
+        try:
+            while not done:
+                blocks = []
+                try:
+                    item = self._q.get(timeout=self.flush_interval)
+                    while True:
+                        if item is None:
+                            done = True
+                            break
+                        blocks.append(item)
+                        item = self._q.get_nowait()
+                except queue.Empty:
+                    pass
+
+                if blocks:
+                    records = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+                    self._f.write(records.tobytes())
+                    self.samples_written += len(records)
+
+                    if self._csv_f:
+                        self._write_csv(records)
+
+                now = time.monotonic()
+                if done or now - last_flush >= self.flush_interval:
+                    self._sync()
+                    if self._csv_f:
+                        self._csv_f.flush()
+                    last_flush = now
+
+        except Exception as err:
+            self.error = err
+
+        finally:
+            self._f.close()
+            if self._csv_f:
+                self._csv_f.close()
+
+    def _write_csv(self, records):
+        scale = {"gain": self.gain, "vref": self.vref, "full_scale": self.full_scale}
+        rows = np.column_stack([
+            records["sample_id"],
+            codes_to_mv(records["ch1"], scale),
+            codes_to_mv(records["ch2"], scale),
+        ])
+        np.savetxt(self._csv_f, rows, fmt=["%d", "%.6f", "%.6f"], delimiter=",")
+
+
+def mv_per_code(header):
+    """Millivolts per ADC code for the gain/vref recorded in a header."""
+    return (1000.0 * header["vref"]) / (header["gain"] * header["full_scale"])
+
+
+def codes_to_mv(codes, header):
+    """ADC codes to millivolts using the gain/vref recorded in a header."""
+    return np.asarray(codes, dtype=float) * mv_per_code(header)
+
+
+def lead_codes(records):
+    """
+    ch1 and ch2 of a record array as one (n, 2) int32 array. It is a
+    strided view (ch2 sits right after ch1 in every record), so on a
+    memory-mapped capture nothing is read until it is indexed.
+    """
+    ch1 = records["ch1"]
+    return np.lib.stride_tricks.as_strided(
+        ch1, shape=(len(records), 2), strides=(ch1.strides[0], ch1.itemsize), writeable=False
+    )
+
+
+def read_capture_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(CaptureWriter.HEADER_SIZE)
+
+    if len(raw) < CaptureWriter.HEADER.size:
+        raise ValueError("File too short for a capture header")
+
+    magic, version, header_size, fs, gain, vref, full_scale, start_time = (
+        CaptureWriter.HEADER.unpack_from(raw)
+    )
+
+    if magic != CaptureWriter.MAGIC:
+        raise ValueError("Not an EKG capture file")
+
+    return {
+        "version": version,
+        "header_size": header_size,
+        "fs": fs,
+        "gain": gain,
+        "vref": vref,
+        "full_scale": full_scale,
+        "start_time": start_time,
+    }
+
+
+def read_capture(path, mmap=False):
+    """
+    Return (header, records) for a capture written by CaptureWriter.
+    With mmap=True records is a read-only np.memmap over the file.
+    """
+    header = read_capture_header(path)
+
+    size = os.path.getsize(path) - header["header_size"]
+    count = max(0, size) // CaptureWriter.RECORD_DTYPE.itemsize
+
+    if mmap:
+        if count == 0:
+            return header, np.empty(0, dtype=CaptureWriter.RECORD_DTYPE)
+        records = np.memmap(
+            path,
+            dtype=CaptureWriter.RECORD_DTYPE,
+            mode="r",
+            offset=header["header_size"],
+            shape=(count,),
+        )
+        return header, records
+
+    with open(path, "rb") as f:
+        f.seek(header["header_size"])
+        records = np.fromfile(f, dtype=CaptureWriter.RECORD_DTYPE, count=count)
+
+    return header, records
+
+
+def export_csv(path, csv_path):
+    """Convert a binary capture to the old sample_id,ch1,ch2 (mV) CSV."""
+    header, records = read_capture(path)
+
+    rows = np.column_stack([
+        records["sample_id"],
+        codes_to_mv(records["ch1"], header),
+        codes_to_mv(records["ch2"], header),
+    ])
+    np.savetxt(
+        csv_path,
+        rows,
+        fmt=["%d", "%.6f", "%.6f"],
+        delimiter=",",
+        header="sample_id,ch1,ch2",
+        comments="",
+    )
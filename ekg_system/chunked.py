@@ -0,0 +1,255 @@
+# Out-of-core helpers for recordings that stay on disk (memory-mapped).
+# EKGProcessor switches to these when raw_data is a LazyArray, so a
+# multi-hour recording is only ever touched one chunk at a time.
+
+import tempfile
+
+import numpy as np
+from scipy.signal import find_peaks, sosfilt, sosfilt_zi
+
+
+DEFAULT_CHUNK = 1 << 20  # samples per chunk
+
+
+class LazyArray:
+    """
+    Read-only float view of an on-disk array (np.memmap or a field of a
+    memory-mapped record array). Nothing is read until it is indexed;
+    every index returns a regular float ndarray scaled by `scale`.
+    """
+
+    def __init__(self, base, scale=1.0, dtype=float):
+        self.base = base
+        self.scale = scale
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    @property
+    def ndim(self):
+        return self.base.ndim
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, key):
+        out = np.asarray(self.base[key], dtype=self.dtype)
+        if self.scale != 1.0:
+            out = out * self.scale
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        # full materialization, only for callers that really want it
+        out = self[...]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+
+def is_lazy(x):
+    return isinstance(x, (LazyArray, np.memmap))
+
+
+def iter_chunks(n, chunk=DEFAULT_CHUNK, cancel=None):
+    """
+    Yield (start, stop) covering range(n) in steps of chunk. cancel (e.g.
+    a workers.CancelToken) has its check() called before every chunk, so
+    a long loop stops within one chunk of being cancelled.
+    """
+    for start in range(0, n, chunk):
+        if cancel is not None:
+            cancel.check()
+        yield start, min(n, start + chunk)
+
+
+def empty_like_on_disk(shape, dtype=float):
+    """Scratch array backed by an anonymous temp file instead of RAM."""
+    return np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode="w+", shape=shape)
+
+
+def sosfiltfilt_padlen(sos):
+    """Default edge padding scipy.signal.sosfiltfilt uses for this filter."""
+    ntaps = 2 * len(sos) + 1
+    ntaps -= min(int((sos[:, 2] == 0).sum()), int((sos[:, 5] == 0).sum()))
+    return 3 * ntaps
+
+
+def chunked_sosfiltfilt(sos, x, chunk=DEFAULT_CHUNK, out=None, cancel=None):
+    """
+    Same result as scipy.signal.sosfiltfilt(sos, x) along axis 0 (default
+    odd padding), computed one chunk at a time by carrying sosfilt state
+    across chunk boundaries. The output goes to `out` (a temp-file
+    memmap by default), so memory use is O(chunk).
+    """
+    n = len(x)
+    edge = sosfiltfilt_padlen(sos)
+    if n <= edge:
+        raise ValueError(
+            f"The length of the input vector x must be greater than padlen, which is {edge}."
+        )
+
+    if out is None:
+        out = empty_like_on_disk(x.shape)
+
+    zi = sosfilt_zi(sos).reshape((len(sos), 2) + (1,) * (len(x.shape) - 1))
+
+    # odd extensions, built from the first/last edge + 1 samples only
+    head = np.asarray(x[:edge + 1], dtype=float)
+    tail = np.asarray(x[n - edge - 1:], dtype=float)
+    left = 2 * head[0] - head[edge:0:-1]
+    right = 2 * tail[-1] - tail[-2::-1]
+
+    # forward pass: left extension, signal, right extension
+    _, z = sosfilt(sos, left, axis=0, zi=zi * left[0])
+    for start, stop in iter_chunks(n, chunk, cancel):
+        out[start:stop], z = sosfilt(sos, np.asarray(x[start:stop], dtype=float), axis=0, zi=z)
+    right_y, _ = sosfilt(sos, right, axis=0, zi=z)
+
+    # backward pass: start from the end of the extended forward output
+    _, z = sosfilt(sos, right_y[::-1], axis=0, zi=zi * right_y[-1])
+    for start, stop in reversed(list(iter_chunks(n, chunk))):
+        if cancel is not None:
+            cancel.check()
+        y, z = sosfilt(sos, np.asarray(out[start:stop])[::-1], axis=0, zi=z)
+        out[start:stop] = y[::-1]
+
+    return out
+
+
+def chunked_abs_percentile(x, q, chunk=DEFAULT_CHUNK, bins=1 << 16, cancel=None):
+    """
+    Exact np.percentile(np.abs(x), q) (linear interpolation) without
+    loading x: a histogram pass finds the bins holding the two order
+    statistics needed, then only the values in those bins are sorted.
+    """
+    n = len(x)
+    if n == 0:
+        raise ValueError("Cannot take a percentile of an empty array")
+
+    top = 0.0
+    for start, stop in iter_chunks(n, chunk, cancel):
+        top = max(top, float(np.max(np.abs(x[start:stop]))))
+
+    if top == 0.0:
+        return 0.0
+
+    def bin_of(v):
+        return np.minimum((v * (bins / top)).astype(np.int64), bins - 1)
+
+    counts = np.zeros(bins, dtype=np.int64)
+    for start, stop in iter_chunks(n, chunk, cancel):
+        counts += np.bincount(bin_of(np.abs(x[start:stop])), minlength=bins)
+
+    rank = (n - 1) * (q / 100.0)
+    lo = int(np.floor(rank))
+    hi = min(lo + 1, n - 1)
+
+    cum = np.cumsum(counts)
+    b_lo = int(np.searchsorted(cum, lo, side="right"))
+    b_hi = int(np.searchsorted(cum, hi, side="right"))
+    below = int(cum[b_lo - 1]) if b_lo > 0 else 0
+
+    picked = []
+    for start, stop in iter_chunks(n, chunk, cancel):
+        v = np.abs(x[start:stop])
+        b = bin_of(v)
+        picked.append(v[(b >= b_lo) & (b <= b_hi)])
+
+    vals = np.sort(np.concatenate(picked))
+    v_lo = vals[lo - below]
+    v_hi = vals[hi - below]
+    return float(v_lo + (rank - lo) * (v_hi - v_lo))
+
+
+def chunked_find_peaks(envelope, n, height, distance, chunk=DEFAULT_CHUNK, margin=None,
+                       cancel=None):
+    """
+    find_peaks(height=..., distance=...) over a length-n detection signal
+    in overlapping chunks, same result as a single pass. `envelope(start,
+    stop)` returns that signal for a sample range. Each chunk is extended
+    by `margin` samples on both sides and only peaks inside the chunk are
+    kept; distance suppression that chains further than that across a
+    chunk boundary is redone by resolve_peak_seams.
+    """
+    if margin is None:
+        margin = 4 * max(1, int(distance))
+
+    found = []
+    spans = list(iter_chunks(n, chunk))
+
+    for start, stop in spans:
+        if cancel is not None:
+            cancel.check()
+        lo = max(0, start - margin)
+        hi = min(n, stop + margin)
+
+        peaks, _ = find_peaks(envelope(lo, hi), height=height, distance=distance)
+        peaks = peaks + lo
+        found.append(peaks[(peaks >= start) & (peaks < stop)])
+
+    if not found:
+        return np.empty(0, dtype=np.intp)
+
+    seams = [start for start, _ in spans[1:]]
+    return resolve_peak_seams(np.concatenate(found), seams, envelope, n, height, distance, margin)
+
+
+def _seam_cluster(envelope, n, seam, height, distance, width):
+    # candidates (local maxima above height) closer than distance to their
+    # neighbour suppress each other in chains; a run of them bounded by
+    # gaps >= distance is independent of everything else. Returns (first,
+    # last, peaks) of the run straddling seam, peaks being what a single
+    # pass keeps inside it, or None when no run crosses the seam. The
+    # window grows until both ends of the run are inside it
+    while True:
+        lo, hi = max(0, seam - width), min(n, seam + width)
+        x = envelope(lo, hi)
+        candidates = find_peaks(x, height=height)[0] + lo
+
+        split = int(np.searchsorted(candidates, seam))
+        if split == 0 or split == len(candidates):
+            return None
+        if candidates[split] - candidates[split - 1] >= distance:
+            return None
+
+        # break b sits between candidates b and b + 1
+        breaks = np.flatnonzero(np.diff(candidates) >= distance)
+        left = breaks[breaks < split - 1]
+        right = breaks[breaks >= split]
+
+        if (len(left) or lo == 0) and (len(right) or hi == n):
+            first = candidates[left[-1] + 1] if len(left) else candidates[0]
+            last = candidates[right[0]] if len(right) else candidates[-1]
+            peaks = find_peaks(x, height=height, distance=distance)[0] + lo
+            return first, last, peaks[(peaks >= first) & (peaks <= last)]
+
+        width *= 2
+
+
+def resolve_peak_seams(peaks, seams, envelope, n, height, distance, margin):
+    """
+    Make chunk-wise find_peaks output (sorted peaks, each chunk searched
+    with `margin` samples of overlap) equal to a single pass: at every
+    seam (chunk start) the chain of candidates crossing it is searched
+    again as a whole. Usually that is one small find_peaks per seam; on
+    dense input where candidates keep chaining, the window grows with
+    the chain. (Candidates of exactly equal height are the exception:
+    find_peaks orders those with an unstable sort, so even two single
+    passes over different spans can pick differently among them.)
+    """
+    done = -1
+    for seam in seams:
+        if seam <= done:
+            continue  # inside a run already resolved
+
+        cluster = _seam_cluster(envelope, n, seam, height, distance, max(margin, int(distance)))
+        if cluster is None:
+            continue
+
+        first, last, exact = cluster
+        i = np.searchsorted(peaks, first)
+        j = np.searchsorted(peaks, last, side="right")
+        peaks = np.concatenate([peaks[:i], exact, peaks[j:]])
+        done = last
+
+    return peaks
@@ -0,0 +1,310 @@
+# Headless batch analysis: the same load -> filter -> detect ->
+# generate_report steps the Analyze button runs, over whole folders of
+# recordings on a process pool.
+#
+#     ekg-system data/cohort_a data/extra.ekgb -o results/ --workers 8
+#
+# Writes results/<recording>.json per recording and results/summary.csv
+# (or .parquet with --summary summary.parquet) with one row per recording.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from ekg_system.arrhythmia_detector import ArrhythmiaDetector, ArrhythmiaType
+from ekg_system.capture import CAPTURE_EXT
+from ekg_system.evaluation import is_annotation_file
+from ekg_system.processor import EKGProcessor
+
+
+RECORDING_EXTS = (".csv", ".txt", ".npy", CAPTURE_EXT)
+
+# one count column per rhythm issue
+ARRHYTHMIA_COLUMNS = [t.value for t in ArrhythmiaType if t != ArrhythmiaType.NORMAL]
+
+SUMMARY_COLUMNS = [
+    "file", "status", "error", "samples", "duration_s", "beats",
+    "mean_heart_rate", "hr_std", "min_heart_rate", "max_heart_rate",
+    "arrhythmias_detected", "abnormal_waveforms",
+] + ARRHYTHMIA_COLUMNS + ["elapsed_s"]
+
+
+def find_recordings(paths):
+    """
+    Files given directly plus every recording under the given folders,
+    sorted. R-peak annotation files in those folders are not recordings.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(
+                    os.path.join(root, name) for name in sorted(files)
+                    if name.lower().endswith(RECORDING_EXTS) and not is_annotation_file(name)
+                )
+        elif os.path.isfile(path):
+            found.append(path)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+
+    # same file named twice (folder + explicit path) only runs once
+    seen = set()
+    unique = []
+    for path in found:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def report_names(paths):
+    """Output name per recording: the file stem, made unique with a path hash."""
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    counts = Counter(stems)
+    names = []
+    for path, stem in zip(paths, stems):
+        if counts[stem] > 1:
+            digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+            stem = f"{stem}-{digest}"
+        names.append(stem)
+    return names
+
+
+def _jsonable(obj):
+    # numpy scalars/arrays and the lazy report sequences -> plain JSON types
+    if isinstance(obj, dict):
+        return {str(k): _jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, Sequence) and not isinstance(obj, str):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def analyze_recording(path, options):
+    """
+    load -> filter -> detect -> generate_report for one file. Returns the
+    report as JSON-ready data; raises on unreadable files or too few beats.
+    """
+    processor = EKGProcessor(sampling_rate=options["sampling_rate"])
+    processor.load_data(path, mmap=options["mmap"], multichannel=options["fuse"])
+
+    processor.filter_signal(options["lowcut"], options["highcut"])
+    peaks = processor.detect_r_peaks(
+        options["height_factor"], options["distance_ms"], fuse=options["fuse"]
+    )
+
+    if peaks is None or len(peaks) < 2:
+        raise RuntimeError("Not enough peaks detected to calculate BPM")
+
+    # a .ekgb capture brings its own sampling rate
+    fs = processor.sampling_rate
+    rr = np.diff(peaks)
+    waves = processor.segment_waveforms()
+    report = ArrhythmiaDetector(fs).generate_report(rr, waves, peaks)
+
+    report = {
+        "file": os.path.abspath(path),
+        "samples": len(processor.raw_data),
+        "duration_s": len(processor.raw_data) / fs,
+        "settings": options,
+        **report,
+        "peaks": peaks,
+    }
+    # the structured table duplicates arrhythmia_details in JSON
+    report.pop("arrhythmia_events", None)
+    report.pop("waveform_codes", None)
+    return _jsonable(report)
+
+
+def summary_row(report):
+    row = {col: report.get(col) for col in SUMMARY_COLUMNS}
+    row.update(dict.fromkeys(ARRHYTHMIA_COLUMNS, 0))
+    row.update(report["arrhythmia_counts"])
+    row["beats"] = report["total_beats"]
+    row["status"] = "ok"
+    return row
+
+
+def _run_one(task):
+    # worker: analyze one recording, write its JSON, return its summary row
+    path, json_path, options = task
+    t0 = time.perf_counter()
+
+    try:
+        report = analyze_recording(path, options)
+        tmp = json_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp, json_path)
+        row = summary_row(report)
+    except Exception as err:
+        row = dict.fromkeys(SUMMARY_COLUMNS)
+        row.update(status="error", error=f"{type(err).__name__}: {err}")
+
+    row["file"] = path
+    row["elapsed_s"] = time.perf_counter() - t0
+    return row
+
+
+def write_summary(rows, path):
+    """Summary table as CSV, or Parquet for a .parquet path (needs pyarrow)."""
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    # counts stay integers even with failed (empty) rows in the table
+    counts = ["samples", "beats", "arrhythmias_detected", "abnormal_waveforms"] + ARRHYTHMIA_COLUMNS
+    df = df.astype({col: "Int64" for col in counts})
+
+    if path.lower().endswith(".parquet"):
+        try:
+            df.to_parquet(path, index=False)
+            return path
+        except ImportError:
+            path = os.path.splitext(path)[0] + ".csv"
+            print(f"Parquet support not installed, writing {path} instead", file=sys.stderr)
+
+    df.to_csv(path, index=False)
+    return path
+
+
+class Progress:
+    """One stderr line per finished recording with running throughput."""
+
+    def __init__(self, total, quiet=False, stream=sys.stderr):
+        self.total = total
+        self.quiet = quiet
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self.samples = 0
+        self.t0 = time.perf_counter()
+
+    def update(self, row):
+        self.done += 1
+        if row["status"] == "ok":
+            self.samples += row["samples"] or 0
+        else:
+            self.failed += 1
+
+        if self.quiet:
+            return
+
+        elapsed = max(time.perf_counter() - self.t0, 1e-9)
+        rate = self.samples / elapsed
+        left = (self.total - self.done) * elapsed / self.done
+
+        if row["status"] == "ok":
+            what = f"{row['beats']} beats, HR {row['mean_heart_rate']:.1f} BPM"
+        else:
+            what = f"FAILED ({row['error']})"
+
+        print(
+            f"[{self.done}/{self.total}] {os.path.basename(row['file'])}: {what} "
+            f"in {row['elapsed_s']:.1f} s | {rate / 1e6:.2f} M samples/s, ~{left:.0f} s left",
+            file=self.stream,
+            flush=True,
+        )
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.t0
+        print(
+            f"{self.done - self.failed}/{self.total} recordings analyzed, {self.failed} failed, "
+            f"{self.samples} samples in {elapsed:.1f} s "
+            f"({self.samples / max(elapsed, 1e-9) / 1e6:.2f} M samples/s)",
+            file=self.stream,
+            flush=True,
+        )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ekg-system",
+        description="Batch R-peak and arrhythmia analysis of EKG recordings "
+                    "(.csv, .txt, .npy, .ekgb files or folders of them).",
+    )
+    parser.add_argument("paths", nargs="+", help="recordings or folders to search")
+    parser.add_argument("-o", "--output", default="ekg_results", help="output folder (default: %(default)s)")
+    parser.add_argument("--summary", default="summary.csv",
+                        help="summary file name inside the output folder, .csv or .parquet (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--fs", type=float, default=1000, help="sampling rate in Hz (default: %(default)s)")
+    parser.add_argument("--lowcut", type=float, default=1.0, help="band-pass low corner in Hz (default: %(default)s)")
+    parser.add_argument("--highcut", type=float, default=100.0, help="band-pass high corner in Hz (default: %(default)s)")
+    parser.add_argument("--height-factor", type=float, default=1.2, help="peak threshold factor (default: %(default)s)")
+    parser.add_argument("--distance-ms", type=float, default=80, help="minimum peak spacing in ms (default: %(default)s)")
+    parser.add_argument("--fuse", action="store_true", help="load every lead and detect on the fused envelope")
+    parser.add_argument("--mmap", action="store_true", help="memory-map .npy/.ekgb files (long recordings)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no per-recording progress lines")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        paths = find_recordings(args.paths)
+    except FileNotFoundError as err:
+        print(err, file=sys.stderr)
+        return 2
+
+    if not paths:
+        print("No recordings found", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output, exist_ok=True)
+
+    options = {
+        "sampling_rate": args.fs,
+        "lowcut": args.lowcut,
+        "highcut": args.highcut,
+        "height_factor": args.height_factor,
+        "distance_ms": args.distance_ms,
+        "fuse": args.fuse,
+        "mmap": args.mmap,
+    }
+    tasks = [
+        (path, os.path.join(args.output, f"{name}.json"), options)
+        for path, name in zip(paths, report_names(paths))
+    ]
+
+    workers = min(args.workers or os.cpu_count() or 1, len(tasks))
+    progress = Progress(len(tasks), quiet=args.quiet)
+    rows = []
+
+    if workers == 1:
+        for task in tasks:
+            rows.append(_run_one(task))
+            progress.update(rows[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_one, task) for task in tasks]
+            for future in as_completed(futures):
+                rows.append(future.result())
+                progress.update(rows[-1])
+
+    # input order, not completion order
+    order = {path: i for i, path in enumerate(paths)}
+    rows.sort(key=lambda row: order[row["file"]])
+
+    summary = write_summary(rows, os.path.join(args.output, args.summary))
+    progress.finish()
+    print(f"Summary written to {summary}", file=sys.stderr)
+
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,3 @@
-import numpy as np
 import pyqtgraph as pg
 
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton
@@ -6,6 +5,8 @@ from PySide6.QtCore import QSize
 
 import qtawesome as qta
 
+from ekg_system.pyramid import MinMaxPyramid
+
 
 def style_ecg_plot(plot_widget):
     plot_widget.setBackground("w")
@@ -20,12 +21,51 @@ def style_ecg_plot(plot_widget):
     plot_widget.showGrid(x=True, y=True, alpha=0.12)
 
 
+class DecimatedCurve:
+    """
+    A plot curve fed from a MinMaxPyramid. Whenever the x range or the
+    plot size changes it redraws only the visible part, at about one
+    min/max pair per pixel, so the cost does not grow with the length of
+    the recording. Call detach() before clearing the plot.
+    """
+
+    def __init__(self, plot_widget, pyramid, fs, pen=None):
+        self.plot = plot_widget
+        self.pyramid = pyramid
+        self.fs = fs
+
+        self.curve = plot_widget.plot(pen=pen)
+
+        view_box = plot_widget.getViewBox()
+        view_box.sigXRangeChanged.connect(self.refresh)
+        view_box.sigResized.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self, *args):
+        xmin, xmax = self.plot.viewRange()[0]
+        # the view box has no real width until the widget is first shown
+        pixels = max(int(self.plot.getViewBox().width()), 400)
+
+        x, y = self.pyramid.view(xmin * self.fs, xmax * self.fs, pixels)
+        self.curve.setData(x / self.fs, y)
+
+    def detach(self):
+        view_box = self.plot.getViewBox()
+        view_box.sigXRangeChanged.disconnect(self.refresh)
+        view_box.sigResized.disconnect(self.refresh)
+
+
 class ClinicalPGView(QWidget):
 
-    def __init__(self, parent=None, signal=None, fs=1000, window_sec=30):
+    def __init__(self, parent=None, signal=None, fs=1000, window_sec=30, pyramid=None):
         super().__init__(parent)
 
+        # pass a prebuilt pyramid for long recordings, building it is O(n)
+        if pyramid is None:
+            pyramid = MinMaxPyramid.build(signal)
+
         self.signal = signal
+        self.pyramid = pyramid
         self.fs = fs
         self.window_sec = window_sec
 
@@ -39,21 +79,21 @@ class ClinicalPGView(QWidget):
         self.plot.setLabel("left", "Amplitude (mV)")
         style_ecg_plot(self.plot)
 
-        t = np.arange(len(signal)) / fs
-        self.curve = self.plot.plot(
-            t,
-            signal,
+        self.duration = len(signal) / fs
+        end = min(self.window_sec, self.duration)
+        self.plot.setXRange(0, end)
+
+        self.curve = DecimatedCurve(
+            self.plot,
+            pyramid,
+            fs,
             pen=pg.mkPen(color="black", width=2)
         )
 
-        self.sig_min = float(np.min(signal))
-        self.sig_max = float(np.max(signal))
+        self.sig_min = pyramid.min
+        self.sig_max = pyramid.max
         self.plot.setYRange(self.sig_min, self.sig_max)
 
-        self.duration = len(signal) / fs
-        end = min(self.window_sec, self.duration)
-        self.plot.setXRange(0, end)
-
         self.plot.sigRangeChanged.connect(self._fix_bounds)
 
         nav_layout = QHBoxLayout()
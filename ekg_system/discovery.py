@@ -0,0 +1,305 @@
+# Finding the MSP430 board without blocking anyone.
+#
+# A port is "the board" when it streams a SYNC-framed packet within the
+# probe timeout. Candidate ports (likely USB serial / TI devices first)
+# are probed concurrently, so a machine with many ports costs one probe
+# timeout instead of one per port. The last port that worked is kept in
+# the cache dir and tried on its own first, which is the common case of
+# plugging the same board back in.
+#
+# PortWatcher runs discovery on a background thread: while no board is
+# connected it watches the port list, probes new ports right away and
+# retries old ones every few seconds; once connected it only watches for
+# the port (or the reader thread) going away. Connect / disconnect are
+# reported through callbacks, which LivePGView turns into Qt signals.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ekg_system.loaders import csv_cache_dir
+
+
+PROBE_TIMEOUT = 1.5     # seconds a port gets to show a packet
+PROBE_WORKERS = 16      # probes mostly wait on I/O
+LAST_PORT_FILE = "last_port"
+
+# substrings of the port description / hwid that look like the board
+PREFERRED_DESC = ("usb serial", "msp", "ti", "texas instruments")
+PREFERRED_HWID = ("1cbe", "2047")
+
+
+def list_devices():
+    """Device names of the serial ports present right now, likely boards first."""
+    from serial.tools import list_ports
+
+    preferred = []
+    others = []
+
+    for p in list_ports.comports():
+        desc = (p.description or "").lower()
+        hwid = (p.hwid or "").lower()
+
+        if any(s in desc for s in PREFERRED_DESC) or any(s in hwid for s in PREFERRED_HWID):
+            preferred.append(p.device)
+        else:
+            others.append(p.device)
+
+    return preferred + others
+
+
+def last_port_path():
+    return os.path.join(csv_cache_dir(), LAST_PORT_FILE)
+
+
+def load_last_port():
+    try:
+        with open(last_port_path(), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_last_port(port):
+    try:
+        os.makedirs(csv_cache_dir(), exist_ok=True)
+        with open(last_port_path(), "w", encoding="utf-8") as f:
+            f.write(port)
+    except OSError:
+        pass  # only costs us the fast path next time
+
+
+def probe_port(device, baudrate, serial_factory, timeout=PROBE_TIMEOUT, stop=None):
+    """
+    True if the device streams one complete SYNC-framed packet within
+    timeout seconds. Any error opening or reading it counts as no.
+    stop (a threading.Event) ends the probe early.
+    """
+    from ekg_system.microcontroller import MSP430Interface
+
+    ser = None
+    try:
+        ser = serial_factory(device, baudrate, timeout=0.25)
+
+        try:
+            ser.reset_input_buffer()
+        except Exception:
+            pass
+
+        start = time.monotonic()
+        data = bytearray()
+
+        while time.monotonic() - start < timeout:
+            if stop is not None and stop.is_set():
+                return False
+
+            chunk = ser.read(256)
+            if chunk:
+                data.extend(chunk)
+
+                idx = data.find(MSP430Interface.SYNC)
+                if idx >= 0 and len(data) - idx >= MSP430Interface.PACKET_LEN:
+                    return True
+
+    except Exception:
+        pass
+    finally:
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+
+    return False
+
+
+def probe_many(devices, baudrate, serial_factory, timeout=PROBE_TIMEOUT,
+               max_workers=PROBE_WORKERS, stop=None):
+    """
+    Probe devices concurrently; returns the first one found streaming,
+    or None. Probes still running when a board is found are told to stop.
+    """
+    devices = list(devices)
+    if not devices:
+        return None
+
+    found = threading.Event()
+    halt = _AnyEvent(found, stop)
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(devices)),
+                              thread_name_prefix="ekg-probe")
+    try:
+        futures = {
+            pool.submit(probe_port, d, baudrate, serial_factory, timeout, halt): d
+            for d in devices
+        }
+        for future in as_completed(futures):
+            if future.result():
+                found.set()
+                return futures[future]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return None
+
+
+class _AnyEvent:
+    # is_set() of several threading.Events (None entries ignored)
+    def __init__(self, *events):
+        self.events = [e for e in events if e is not None]
+
+    def is_set(self):
+        return any(e.is_set() for e in self.events)
+
+
+def discover(baudrate=115200, serial_factory=None, devices=None, last_port=None,
+             timeout=PROBE_TIMEOUT, max_workers=PROBE_WORKERS, stop=None):
+    """
+    Port of the streaming board, or None. The last good port (saved one
+    by default) is verified on its own first, then every other candidate
+    is probed concurrently. A port that answers is saved for next time.
+    """
+    if serial_factory is None:
+        import serial
+        serial_factory = serial.Serial
+
+    if devices is None:
+        devices = list_devices()
+    if last_port is None:
+        last_port = load_last_port()
+
+    port = None
+    if last_port and last_port in devices:
+        if probe_port(last_port, baudrate, serial_factory, timeout, stop):
+            port = last_port
+
+    if port is None:
+        others = [d for d in devices if d != last_port]
+        port = probe_many(others, baudrate, serial_factory, timeout, max_workers, stop)
+
+    if port:
+        save_last_port(port)
+    return port
+
+
+class PortWatcher:
+    """
+    Background discovery for one MSP430Interface.
+
+        watcher = PortWatcher(mcu, on_connected, on_disconnected)
+        watcher.start()
+
+    on_connected(port) runs when a board is found (mcu.port is set
+    first), on_disconnected(port) when its port disappears from the port
+    list or the interface's reader thread dies. Both are called from the
+    watcher thread. An interface created with a fixed port (EKG_PORT,
+    the simulator) is reported connected without probing.
+    """
+
+    def __init__(self, mcu, on_connected, on_disconnected, interval=1.0, retry=5.0,
+                 timeout=PROBE_TIMEOUT, max_workers=PROBE_WORKERS):
+        self.mcu = mcu
+        self.on_connected = on_connected
+        self.on_disconnected = on_disconnected
+        self.interval = interval
+        self.retry = retry
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+        self.fixed_port = mcu.port
+        self.port = None            # connected port, None while searching
+        self.last_port = load_last_port()
+
+        self._tried = {}            # device -> monotonic time of its last failed probe
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def connected(self):
+        return self.port is not None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ekg-port-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        if wait and self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1.0)
+        self._thread = None
+
+    def rescan(self):
+        """Probe every port on the next pass instead of waiting for retry."""
+        self._tried.clear()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.port is None:
+                    self._search()
+                else:
+                    self._watch()
+            except Exception:
+                pass  # a bad pass is retried on the next one
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _search(self):
+        # the reader still holds the old port until the UI has stopped it
+        if self.mcu.serial is not None:
+            return
+
+        if self.fixed_port:
+            self._connect(self.fixed_port)
+            return
+
+        devices = list_devices()
+        now = time.monotonic()
+
+        # new (hotplugged) ports go now, known bad ones every `retry` s
+        due = [d for d in devices if now - self._tried.get(d, -self.retry) >= self.retry]
+        self._tried = {d: t for d, t in self._tried.items() if d in devices}
+        if not due:
+            return
+
+        port = discover(
+            self.mcu.baudrate, self.mcu.serial_factory, due, self.last_port,
+            self.timeout, self.max_workers, self._stop,
+        )
+
+        if port is None:
+            now = time.monotonic()
+            self._tried.update(dict.fromkeys(due, now))
+        elif not self._stop.is_set():
+            self.last_port = port
+            self._connect(port)
+
+    def _connect(self, port):
+        self.mcu.port = port
+        self.port = port
+        self._tried.pop(port, None)
+        self.on_connected(port)
+
+    def _watch(self):
+        mcu = self.mcu
+        # only a failed reader sets error; a user stop clears running
+        # before the port is closed, which must not look like a loss
+        reader_died = mcu.serial is not None and mcu.error is not None
+        unplugged = self.port != self.fixed_port and self.port not in list_devices()
+
+        if reader_died or unplugged:
+            port, self.port = self.port, None
+            if not self.fixed_port:
+                mcu.port = None
+            # a reader that died on a still-listed port is worth a quick retry
+            self._tried[port] = time.monotonic() - self.retry + self.interval
+            self.on_disconnected(port)
@@ -0,0 +1,99 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+
+# distinct (fs, cutoffs, order, type) designs kept around; a parameter
+# sweep cycles through more than this and the oldest get evicted
+DESIGN_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=DESIGN_CACHE_SIZE)
+def _design(fs, lowcut, highcut, order, btype, output):
+    nyquist = 0.5 * fs
+
+    if btype in ("band", "bandpass", "bandstop"):
+        wn = [lowcut / nyquist, highcut / nyquist]
+    elif btype in ("low", "lowpass"):
+        wn = highcut / nyquist
+    else:
+        wn = lowcut / nyquist
+
+    coeffs = butter(order, wn, btype=btype, output=output)
+    return (coeffs,) if output == "sos" else tuple(coeffs)
+
+
+def design_filter(fs, lowcut, highcut, order=4, btype="band", output="sos"):
+    """
+    Memoized Butterworth design. Returns the sos array, or (b, a) for
+    output="ba". Callers get copies (scipy's sosfilt wants writable
+    arrays), so editing them never touches the cached design.
+    """
+    coeffs = _design(float(fs), float(lowcut), float(highcut), int(order), btype, output)
+    coeffs = tuple(c.copy() for c in coeffs)
+    return coeffs[0] if output == "sos" else coeffs
+
+
+def butter_bandpass(fs, lowcut, highcut, order=4, output="ba"):
+    """Butterworth band-pass design used by EKGProcessor and the streaming filter."""
+    return design_filter(fs, lowcut, highcut, order, "band", output)
+
+
+class StreamingBandpassFilter:
+    """
+    Causal band-pass for samples that arrive in blocks (MSP430 batch
+    callback, chunked file reads).
+
+    Same Butterworth design as EKGProcessor.filter_signal, run as
+    second-order sections with the filter state carried from one
+    process() call to the next, so splitting a signal into blocks gives
+    exactly the same output as filtering it in one go. Memory is just the
+    (n_sections, 2) state per channel.
+
+    Latency: every input block comes straight back filtered, nothing is
+    buffered. Being causal (one pass, not filtfilt) the output has the
+    filter's phase delay, a few ms in the QRS band at the default
+    1-100 Hz, instead of filtfilt's zero phase.
+
+    Blocks are (n,) for one channel or (n, n_channels). The state starts
+    at the steady state for the first sample, so a DC offset does not
+    ring through the first second. Call reset() after a gap or any other
+    discontinuity in the stream.
+    """
+
+    def __init__(self, fs, lowcut=1.0, highcut=100.0, order=4):
+        self.fs = fs
+        self.lowcut = lowcut
+        self.highcut = highcut
+        self.order = order
+
+        self.sos = butter_bandpass(fs, lowcut, highcut, order, output="sos")
+        self._zi_step = sosfilt_zi(self.sos)
+        self._zi = None
+
+    def reset(self):
+        """Forget the filter state; the next block starts fresh."""
+        self._zi = None
+
+    def process(self, block):
+        x = np.asarray(block, dtype=float)
+        if len(x) == 0:
+            return x.copy()
+
+        if self._zi is None:
+            shape = self._zi_step.shape + (1,) * (x.ndim - 1)
+            self._zi = self._zi_step.reshape(shape) * x[0]
+
+        elif self._zi.shape[2:] != x.shape[1:]:
+            raise ValueError(
+                f"Block has {x.shape[1:]} channels, filter state has {self._zi.shape[2:]}"
+            )
+
+        y, self._zi = sosfilt(self.sos, x, axis=0, zi=self._zi)
+        return y
+
+    def filter_blocks(self, blocks):
+        """Generator version of process() for an iterable of blocks."""
+        for block in blocks:
+            yield self.process(block)
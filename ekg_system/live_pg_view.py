@@ -1,17 +1,33 @@
 import os
-import csv
 from datetime import datetime
 import numpy as np
 import pyqtgraph as pg
-import queue
-
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel, QHBoxLayout
-from PySide6.QtCore import QTimer, Qt, QUrl, QSize
+from PySide6.QtCore import QTimer, Qt, QUrl, QSize, Signal
 from PySide6.QtGui import QDesktopServices
 
 import qtawesome as qta
 
-from ekg_system.microcontroller import MSP430Interface
+from ekg_system.arrhythmia_detector import ArrhythmiaDetector
+from ekg_system.block_queue import BlockQueue
+from ekg_system.capture import CAPTURE_EXT, CaptureWriter
+from ekg_system.discovery import PortWatcher
+from ekg_system.filters import StreamingBandpassFilter
+from ekg_system.live_render import FrameScheduler, YRangeHysteresis, minmax_decimate
+from ekg_system.microcontroller import LinkStats, MSP430Interface
+from ekg_system.online_detector import OnlinePeakDetector
+from ekg_system.ring_buffer import RingBuffer
+
+
+class TimedPlotWidget(pg.PlotWidget):
+    # a PlotWidget that reports each finished paint (see FrameScheduler)
+    def __init__(self, on_painted, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_painted = on_painted
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        self.on_painted()
 
 
 def style_ecg_plot(plot_widget):
@@ -29,29 +45,59 @@ def style_ecg_plot(plot_widget):
 
 class LivePGView(QWidget):
 
-    def __init__(self, parent=None, fs=1000, window_sec=10):
+    # emitted from the PortWatcher thread, delivered on the GUI thread
+    device_found = Signal(str)
+    device_lost = Signal(str)
+    # emitted from the reader thread when it stops on an error
+    reader_failed = Signal(str)
+    # emitted from the reader thread when the capture file can't be written
+    capture_failed = Signal(str)
+
+    QUEUE_SEC = 5
+
+    def __init__(self, parent=None, fs=1000, window_sec=10, save_csv=False, mcu=None):
         super().__init__(parent)
 
         self.fs = fs
+        self.save_csv = save_csv
         self.window_sec = window_sec
         self.display_samples = int(fs * window_sec)
 
         self.samples_seen = 0
 
-        self.sid_data = []
-        self.ch1_data = []
-        self.ch2_data = []
-
-        self._q = queue.SimpleQueue()
-
-        self.mcu = MSP430Interface(mode="binary")
+        # last display_samples of (sample_id, ch1 mV, ch2 mV)
+        self.history = RingBuffer(self.display_samples, n_channels=3)
+
+        # live beat detection on CH1
+        self.ecg_filter = StreamingBandpassFilter(fs)
+        self.peak_detector = OnlinePeakDetector(fs)
+        self.rhythm = ArrhythmiaDetector(sampling_rate=fs).streaming()
+        self.beats_seen = 0
+        # sample id the detection expects next, None before the first block
+        self._next_sid = None
+        self.arrhythmias_seen = 0
+
+        # reader -> plot timer hand-off, bounded to QUEUE_SEC of samples.
+        # A stalled GUI loses the oldest display data, never the capture
+        # (that is written on the reader thread)
+        self._q = BlockQueue(int(fs * self.QUEUE_SEC), policy="drop_oldest")
+
+        # drawing: adaptive frame rate, per-pixel decimation, lazy y axis
+        self.frames = FrameScheduler(interval=0.04, budget=0.25)
+        self.y_range1 = YRangeHysteresis()
+        self.y_range2 = YRangeHysteresis()
+        self._dirty = False
+
+        # pass an interface to read from something else than the real
+        # board, e.g. simulator.simulated_interface()
+        self.mcu = mcu or MSP430Interface(mode="binary")
         self.device_connected = False
         self.collecting = False
         self.want_collecting = False
 
+        self.capture_path = None
         self.csv_path = None
-        self._csv_f = None
-        self._csv_w = None
+        self._writer = None
 
         layout = QVBoxLayout(self)
 
@@ -59,19 +105,31 @@ class LivePGView(QWidget):
         self.status.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.status)
 
+        self.hr_label = QLabel("HR: --- BPM")
+        self.hr_label.setAlignment(Qt.AlignCenter)
+        self.hr_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        layout.addWidget(self.hr_label)
+
+        self.frame_label = QLabel("")
+        self.frame_label.setAlignment(Qt.AlignRight)
+        self.frame_label.setStyleSheet("color: gray; font-size: 11px;")
+        layout.addWidget(self.frame_label)
+
         # CH1 plot
-        self.plot1 = pg.PlotWidget()
+        self.plot1 = TimedPlotWidget(self.frames.painted)
         self.plot1.setLabel("bottom", "Sample ID")
         self.plot1.setLabel("left", "CH1 (mV)")
         style_ecg_plot(self.plot1)
+        self.plot1.disableAutoRange()
         self.curve1 = self.plot1.plot([], [], pen=pg.mkPen(color="black", width=2))
         layout.addWidget(self.plot1)
 
         # CH2 plot
-        self.plot2 = pg.PlotWidget()
+        self.plot2 = TimedPlotWidget(self.frames.painted)
         self.plot2.setLabel("bottom", "Sample ID")
         self.plot2.setLabel("left", "CH2 (mV)")
         style_ecg_plot(self.plot2)
+        self.plot2.disableAutoRange()
         self.curve2 = self.plot2.plot([], [], pen=pg.mkPen(color="black", width=2))
         layout.addWidget(self.plot2)
 
@@ -90,36 +148,63 @@ class LivePGView(QWidget):
         self.open_btn.setIconSize(QSize(18, 18))
         self.open_btn.setFixedSize(170, 38)
         self.open_btn.setEnabled(False)
-        self.open_btn.clicked.connect(self.open_csv_file)
+        self.open_btn.clicked.connect(self.open_data_file)
         controls.addWidget(self.open_btn)
 
         layout.addLayout(controls)
 
+        # ticks drain the queue and run detection; frames are drawn only
+        # as often as the FrameScheduler allows
         self.plot_timer = QTimer(self)
         self.plot_timer.timeout.connect(self.update_plot)
-        self.plot_timer.start(40)
+        self.plot_timer.start(20)
 
-        self.detect_timer = QTimer(self)
-        self.detect_timer.timeout.connect(self.check_device)
-        self.detect_timer.start(1000)
+        # port discovery runs on its own thread and reports back through
+        # the signals, the GUI thread never waits on a serial port
+        self.device_found.connect(self._on_device_found)
+        self.device_lost.connect(self._on_device_lost)
+        self.reader_failed.connect(self._on_reader_failed)
+        self.capture_failed.connect(self._on_capture_failed)
+        self.watcher = PortWatcher(self.mcu, self.device_found.emit, self.device_lost.emit)
+        self.watcher.start()
 
     def reset_view(self):
-        self.plot1.enableAutoRange(x=True, y=True)
-        self.plot2.enableAutoRange(x=True, y=True)
-        self.plot1.autoRange()
-        self.plot2.autoRange()
+        # refit the y axes on the next frame, x follows the data anyway
+        self.y_range1.reset()
+        self.y_range2.reset()
+        self._dirty = True
 
     def check_device(self):
+        # ask for an immediate re-probe of every port, returns right away
         if not self.device_connected:
-            port = self.mcu.detect_port()
+            self.watcher.rescan()
 
-            if port:
-                self.device_connected = True
-                self.button.setEnabled(True)
-                self.status.setText(f"MSP430 detected ({port})")
+    def _on_device_found(self, port):
+        self.device_connected = True
+        self.button.setEnabled(True)
+        self.status.setText(f"MSP430 detected ({port})")
+
+        if self.want_collecting:
+            self.start_hardware()
+
+    def _on_device_lost(self, port):
+        # want_collecting is kept, so collection resumes on reconnect
+        error = self.mcu.error
+        self.stop_hardware()
+        self.device_connected = False
+        self.button.setEnabled(self.want_collecting)
 
-                if self.want_collecting:
-                    self.start_hardware()
+        reason = f": {type(error).__name__}: {error}" if error else ""
+        self.status.setText(f"MSP430 disconnected ({port}){reason}, waiting for device…")
+
+    def _on_reader_failed(self, message):
+        self.status.setText(f"Acquisition stopped: {message}")
+        # the watcher reports the device lost on its next pass, make that now
+        self.watcher.rescan()
+
+    def _on_capture_failed(self, message):
+        # the writer is already dropped, streaming and display go on
+        self.status.setText(f"Capture stopped, live view continues: {message}")
 
     def _update_collect_button(self):
         if self.want_collecting:
@@ -141,105 +226,202 @@ class LivePGView(QWidget):
         else:
             self.stop_hardware()
 
-    def _start_csv(self):
+    def _start_capture(self):
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
         # create folder if it doesn't exist
         folder = os.path.join(os.getcwd(), "Live Data")
         os.makedirs(folder, exist_ok=True)
 
-        # full csv path inside folder
-        self.csv_path = os.path.join(folder, f"ekg_capture_{ts}.csv")
-
-        self._csv_f = open(self.csv_path, "w", newline="")
-        self._csv_w = csv.writer(self._csv_f)
-        self._csv_w.writerow(["sample_id", "ch1", "ch2"])
+        # binary capture (and optional csv copy) inside folder
+        self.capture_path = os.path.join(folder, f"ekg_capture_{ts}{CAPTURE_EXT}")
+        self.csv_path = (
+            os.path.join(folder, f"ekg_capture_{ts}.csv") if self.save_csv else None
+        )
+
+        self._writer = CaptureWriter(
+            self.capture_path,
+            fs=self.fs,
+            gain=self.mcu.GAIN,
+            vref=self.mcu.VREF,
+            full_scale=self.mcu.FS,
+            csv_path=self.csv_path,
+        )
+        self._writer.start()
 
         self.open_btn.setEnabled(True)
 
-    def _stop_csv(self):
-        if self._csv_f:
-            self._csv_f.close()
+    def _stop_capture(self):
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
 
-        self._csv_f = None
-        self._csv_w = None
+        writer.close()
+        if writer.error is not None:
+            self.status.setText(
+                f"Capture file incomplete: {type(writer.error).__name__}: {writer.error}"
+            )
 
-    def open_csv_file(self):
+    def open_data_file(self):
+        # the binary capture has no default app, open the csv or its folder
         if self.csv_path:
             QDesktopServices.openUrl(QUrl.fromLocalFile(self.csv_path))
+        elif self.capture_path:
+            folder = os.path.dirname(self.capture_path)
+            QDesktopServices.openUrl(QUrl.fromLocalFile(folder))
 
     def start_hardware(self):
         if self.collecting:
             return
 
         self._reset_buffers()
-        self._start_csv()
-        self.mcu.start(self.on_sample)
+        self._start_capture()
+        self.mcu.start(
+            batch_callback=self.on_block,
+            error_callback=lambda err: self.reader_failed.emit(f"{type(err).__name__}: {err}"),
+        )
         self.collecting = True
 
     def stop_hardware(self):
+        # mcu.stop() waits for the reader thread, so no on_block is still
+        # writing when the capture is closed below
         if self.collecting:
             self.mcu.stop()
 
         self.collecting = False
-        self._stop_csv()
+        self._stop_capture()
 
     def _reset_buffers(self):
-        self.sid_data = []
-        self.ch1_data = []
-        self.ch2_data = []
+        self.history.clear()
         self.samples_seen = 0
 
+        self.ecg_filter.reset()
+        self.peak_detector.reset()
+        self.rhythm.reset()
+        self.beats_seen = 0
+        self.arrhythmias_seen = 0
+        self._next_sid = None
+        self.hr_label.setText("HR: --- BPM")
+
         self.curve1.setData([], [])
         self.curve2.setData([], [])
 
-        while not self._q.empty():
-            self._q.get()
-
-    def on_sample(self, sid, ch1, ch2, t_wall):
-        self._q.put((sid, ch1, ch2))
+        self.frames.reset()
+        self.y_range1.reset()
+        self.y_range2.reset()
+        self._dirty = False
+        self.frame_label.setText("")
 
-    def update_plot(self):
-        drained = 0
+        self._q.clear()
 
-        while True:
+    def on_block(self, sids, ch1, ch2, t_wall):
+        # runs on the reader thread: capture is fed from here so it keeps
+        # going even when the plot timer stalls
+        writer = self._writer
+        if writer:
             try:
-                sid, ch1, ch2 = self._q.get_nowait()
-            except Exception:
-                break
+                writer.write(sids, ch1, ch2)
+            except RuntimeError as err:
+                # a full disk etc. ends the capture, not the acquisition
+                self._writer = None
+                self.capture_failed.emit(str(err))
 
-            if self._csv_w:
-                self._csv_w.writerow([sid, ch1, ch2])
+        self._q.put(sids, ch1, ch2)
 
-            self.samples_seen += 1
-            self.sid_data.append(sid)
-            self.ch1_data.append(ch1)
-            self.ch2_data.append(ch2)
-            drained += 1
+    def update_plot(self):
+        blocks = self._q.drain()
 
-        if drained == 0:
+        if not blocks:
+            # a frame skipped earlier may be due by now
+            self.render()
             return
 
-        x = np.asarray(self.sid_data)
-        y1 = np.asarray(self.ch1_data)
-        y2 = np.asarray(self.ch2_data)
-
-        if len(x) > self.display_samples:
-            x = x[-self.display_samples:]
-            y1 = y1[-self.display_samples:]
-            y2 = y2[-self.display_samples:]
-
-        self.curve1.setData(x, y1)
-        self.curve2.setData(x, y2)
-
-        self.plot1.setXRange(x[0], x[-1], padding=0)
-        self.plot2.setXRange(x[0], x[-1], padding=0)
+        for sids, ch1, ch2 in blocks:
+            ch1_mv = MSP430Interface.code_to_mv(ch1)
+            ch2_mv = MSP430Interface.code_to_mv(ch2)
+
+            self.history.append(sids, ch1_mv, ch2_mv)
+            self.samples_seen += len(sids)
+
+            self._detect(sids, ch1_mv)
+
+        bpm = self.peak_detector.heart_rate()
+        if bpm is not None:
+            self.hr_label.setText(
+                f"HR: {bpm:.0f} BPM | Beats: {self.beats_seen} | Arrhythmias: {self.arrhythmias_seen}"
+            )
+
+        self._dirty = True
+        self.render()
+
+    def _detect(self, sids, ch1_mv):
+        # beat detection follows the sample ids: where they jump (samples
+        # lost on the link or dropped from the queue) the filter restarts
+        # and the detector skips the missing samples instead of joining
+        # both sides, which would skew RR / HR and fake beats
+        ids = sids.astype(np.int64)
+        expected = np.empty_like(ids)
+        expected[0] = ids[0] if self._next_sid is None else self._next_sid
+        expected[1:] = ids[:-1] + 1
+        jump = (ids - expected) % (1 << 32)
+
+        bounds = np.unique(np.concatenate([[0], np.flatnonzero(jump), [len(ids)]]))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if jump[start]:
+                self._stream_gap(int(jump[start]))
+
+            peaks = self.peak_detector.process(self.ecg_filter.process(ch1_mv[start:stop]))
+            self.beats_seen += len(peaks)
+            self.arrhythmias_seen += len(self.rhythm.add_peaks(peaks))
+
+        self._next_sid = (int(ids[-1]) + 1) % (1 << 32)
+
+    def _stream_gap(self, missing):
+        self.ecg_filter.reset()
+        self.rhythm.skip()
+        if missing <= LinkStats.MAX_GAP:
+            self.peak_detector.skip(missing)
+        else:
+            # ids went backwards (board reset) or jumped absurdly: start over
+            self.peak_detector.reset()
 
-        self.plot1.enableAutoRange(axis="y")
-        self.plot2.enableAutoRange(axis="y")
+    def render(self):
+        # draw the newest window if a frame is due; everything that came
+        # in since the last frame is merged into this one
+        if not self._dirty or len(self.history) == 0 or not self.frames.due():
+            return
 
-        if self.csv_path:
-            self.status.setText(f"Saving to {os.path.basename(self.csv_path)}")
+        self.frames.begin()
+
+        x, y1, y2 = self.history.latest()
+        pixels = max(int(self.plot1.getViewBox().width()), 200)
+
+        for plot, curve, y_range, y in (
+            (self.plot1, self.curve1, self.y_range1, y1),
+            (self.plot2, self.curve2, self.y_range2, y2),
+        ):
+            dx, dy = minmax_decimate(x, y, pixels)
+            curve.setData(dx, dy, skipFiniteCheck=True)
+            plot.setXRange(x[0], x[-1], padding=0)
+
+            new_range = y_range.update(dy.min(), dy.max())
+            if new_range is not None:
+                plot.setYRange(*new_range, padding=0)
+
+        self._dirty = False
+        self.frames.end()
+
+        if self._writer is not None:
+            self.status.setText(f"Saving to {os.path.basename(self.capture_path)}")
+
+        f = self.frames
+        link = self.mcu.stats
+        q = self._q
+        self.frame_label.setText(
+            f"frame {f.frame_time * 1000:.1f} ms | {f.fps:.0f} fps | redraw every {f.interval * 1000:.0f} ms"
+            f" | lost {link.dropped_samples} | resyncs {link.resyncs}"
+            f" | queue peak {q.high_water}/{q.max_samples}, dropped {q.dropped_samples}"
+        )
 
     def stop(self):
         self.want_collecting = False
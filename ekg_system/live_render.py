@@ -0,0 +1,142 @@
+# Helpers that keep LivePGView's drawing cost bounded: per-pixel min/max
+# decimation of the visible window, a frame scheduler that stretches the
+# redraw interval when frames get slow, and a y-range with hysteresis so
+# the axes are not rescaled every frame.
+
+import time
+
+import numpy as np
+
+
+def minmax_decimate(x, y, pixels):
+    """
+    Reduce (x, y) to one (min, max) pair per pixel column. Peaks survive
+    because every column keeps its extremes; short inputs (at most two
+    points per column) come back unchanged.
+    """
+    n = len(y)
+    pixels = max(1, int(pixels))
+    if n <= 2 * pixels:
+        return x, y
+
+    edges = (np.arange(pixels) * n) // pixels
+    lo = np.minimum.reduceat(y, edges)
+    hi = np.maximum.reduceat(y, edges)
+
+    out_x = np.repeat(x[edges], 2)
+    out_y = np.empty(2 * pixels, dtype=float)
+    out_y[0::2] = lo
+    out_y[1::2] = hi
+    return out_x, out_y
+
+
+class YRangeHysteresis:
+    """
+    Y range that only moves when it has to: it grows as soon as the data
+    leaves it (with `margin` headroom added) and shrinks only once the
+    data has used less than `shrink` of the range for `hold` updates.
+    update() returns the new (lo, hi), or None when nothing changed.
+    """
+
+    def __init__(self, margin=0.15, shrink=0.4, hold=25):
+        self.margin = margin
+        self.shrink = shrink
+        self.hold = hold
+        self.reset()
+
+    def reset(self):
+        self.range = None
+        self._small = 0
+
+    def _fit(self, lo, hi):
+        pad = max(hi - lo, 1e-6) * self.margin
+        self.range = (lo - pad, hi + pad)
+        self._small = 0
+        return self.range
+
+    def update(self, lo, hi):
+        lo, hi = float(lo), float(hi)
+
+        if self.range is None or lo < self.range[0] or hi > self.range[1]:
+            return self._fit(lo, hi)
+
+        used = (hi - lo) / (self.range[1] - self.range[0])
+        if used < self.shrink:
+            self._small += 1
+            if self._small >= self.hold:
+                return self._fit(lo, hi)
+        else:
+            self._small = 0
+
+        return None
+
+
+class FrameScheduler:
+    """
+    Decides when the next frame is drawn. A frame runs from begin() to
+    the last painted() call after end(): Qt paints the new curves later,
+    on the event loop, so painted() (called from the plots' paintEvent)
+    is what brings the actual rendering into the frame time. Without
+    painted() calls a frame only counts begin() to end().
+
+    The redraw interval is stretched so that drawing takes at most
+    `budget` of the time (e.g. 0.25 = a quarter of one core), between
+    min_interval and max_interval seconds. Data that arrives in between
+    is simply merged into the next frame.
+    """
+
+    def __init__(self, interval=0.04, budget=0.25, min_interval=0.02, max_interval=0.5):
+        self.target = interval
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.reset()
+
+    def due(self, now=None):
+        # by the next tick the previous frame has been painted
+        if self._pending:
+            self._finish()
+
+        now = time.perf_counter() if now is None else now
+        if self._last_frame is None or now - self._last_frame >= self.interval:
+            return True
+
+        self.skipped += 1
+        return False
+
+    def begin(self):
+        now = time.perf_counter()
+        if self._pending:
+            self._finish()
+
+        if self._last_frame is not None:
+            gap = now - self._last_frame
+            self.fps = 1.0 / gap if self.fps == 0.0 else 0.8 * self.fps + 0.2 / gap
+        self._last_frame = now
+
+    def end(self):
+        # the curves are updated; the frame lasts until its last paint
+        self._done = time.perf_counter()
+        self._pending = True
+
+    def painted(self):
+        if self._pending:
+            self._done = time.perf_counter()
+
+    def _finish(self):
+        self._pending = False
+        took = self._done - self._last_frame
+
+        self.frame_time = took if self.frame_time == 0.0 else 0.8 * self.frame_time + 0.2 * took
+        wanted = max(self.target, self.frame_time / self.budget)
+        self.interval = min(self.max_interval, max(self.min_interval, wanted))
+
+    def reset(self):
+        self.interval = self.target
+        self.frame_time = 0.0    # smoothed seconds per frame, paint included
+        self.fps = 0.0
+        self.skipped = 0         # ticks merged into a later frame
+
+        self._last_frame = None  # perf_counter() at begin() of the last frame
+        self._done = None
+        self._pending = False
@@ -0,0 +1,273 @@
+# File readers shared by EKGProcessor.load_data and the test scripts.
+
+import hashlib
+import io
+import os
+
+import numpy as np
+
+
+TXT_CHUNK_BYTES = 1 << 23  # ~8 MB of text per parse call
+
+# bump when read_csv_samples changes what it returns, invalidates sidecars
+CSV_CACHE_VERSION = 1
+CSV_DELIMITERS = (",", ";", "\t")
+
+
+def find_txt_data_offset(path):
+    """
+    Byte offset where samples start in a dashed-header TXT file, i.e.
+    just after the second line that is only "---":
+
+        ---
+        Mammal:            mouse
+        Fs:                1000
+        ---
+        0.0123
+        ...
+
+    Returns None if the file has no second marker.
+    """
+    dash_count = 0
+
+    with open(path, "rb") as f:
+        for line in iter(f.readline, b""):
+            if line.strip() == b"---":
+                dash_count += 1
+                if dash_count >= 2:
+                    return f.tell()
+
+    return None
+
+
+def _parse_txt_lines(block, dtype):
+    # slow path, identical to the old per-line loop: skip blank lines,
+    # extra "---" markers and anything that does not parse
+    convert = int if np.issubdtype(dtype, np.integer) else float
+    values = []
+
+    for line in block.decode("utf-8", errors="ignore").splitlines():
+        s = line.strip()
+        if not s or s == "---":
+            continue
+        try:
+            values.append(convert(s))
+        except ValueError:
+            continue
+
+    return np.array(values, dtype=dtype)
+
+
+def _parse_txt_block(block, dtype):
+    import pandas as pd
+
+    # fast path: one number per line, parsed by pandas' C reader. The
+    # separator never occurs in numbers, so a line holding anything else
+    # fails the whole block and we fall back to the line loop.
+    if np.issubdtype(dtype, np.integer) and any(c in block for c in (b".", b"e", b"E")):
+        # pandas would accept "1e5" as an int, int() does not
+        return _parse_txt_lines(block, dtype)
+
+    try:
+        df = pd.read_csv(
+            io.BytesIO(block),
+            header=None,
+            names=["value"],
+            sep="\x1f",
+            dtype=dtype,
+            engine="c",
+            skip_blank_lines=True,
+        )
+        return df["value"].to_numpy()
+    except ValueError:
+        return _parse_txt_lines(block, dtype)
+
+
+def iter_txt_samples(path, dtype=float, chunk_bytes=TXT_CHUNK_BYTES):
+    """
+    Stream the samples of a dashed-header TXT file as numpy arrays, one
+    per ~chunk_bytes of text, so big exports never sit in memory twice.
+    """
+    dtype = np.dtype(dtype)
+    offset = find_txt_data_offset(path)
+    if offset is None:
+        return
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        carry = b""
+
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+
+            data = carry + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                carry = data
+                continue
+
+            carry = data[cut:]
+            values = _parse_txt_block(data[:cut], dtype)
+            if len(values):
+                yield values
+
+        if carry.strip():
+            values = _parse_txt_block(carry, dtype)
+            if len(values):
+                yield values
+
+
+def read_txt_samples(path, dtype=float, chunk_bytes=TXT_CHUNK_BYTES):
+    """All samples of a dashed-header TXT file as one array."""
+    chunks = list(iter_txt_samples(path, dtype, chunk_bytes))
+    if not chunks:
+        return np.empty(0, dtype=dtype)
+    return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+def _is_number(token):
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
+
+def sniff_csv(path, max_lines=20):
+    """
+    Work out the layout of a CSV from its first few lines.
+
+    Returns a dict with the delimiter, whether the first line is a header,
+    whether rows end in a trailing delimiter (the lab exports do:
+    "16.45,3.740625,") and which column holds the signal. The column
+    follows the old pandas rule: the second numeric column if there are
+    two or more (time, value, ...), otherwise the first. signal_columns
+    lists every lead: all numeric columns after the time column.
+    """
+    lines = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            s = line.strip()
+            if not s or s.startswith("#"):
+                continue
+            lines.append(s)
+            if len(lines) >= max_lines:
+                break
+
+    if not lines:
+        raise ValueError("Empty CSV file")
+
+    delimiter = max(CSV_DELIMITERS, key=lambda d: sum(l.count(d) for l in lines))
+
+    first = [t.strip() for t in lines[0].split(delimiter)]
+    header = not all(_is_number(t) for t in first if t)
+
+    data_line = lines[1] if header and len(lines) > 1 else lines[0]
+    tokens = [t.strip() for t in data_line.split(delimiter)]
+    trailing = data_line.endswith(delimiter)
+
+    numeric = [i for i, t in enumerate(tokens) if t and _is_number(t)]
+    if not numeric:
+        raise ValueError("No numeric columns found")
+
+    return {
+        "delimiter": delimiter,
+        "header": header,
+        "trailing_delimiter": trailing,
+        "value_column": numeric[1] if len(numeric) >= 2 else numeric[0],
+        "signal_columns": numeric[1:] if len(numeric) >= 2 else numeric[:1],
+    }
+
+
+def read_csv_samples(path, layout=None, multichannel=False):
+    """
+    Read only the signal column of a CSV as a float64 array, or with
+    multichannel=True every lead as an (n_samples, n_leads) array.
+    """
+    import pandas as pd
+
+    if layout is None:
+        layout = sniff_csv(path)
+
+    columns = layout["signal_columns"] if multichannel else [layout["value_column"]]
+
+    df = pd.read_csv(
+        path,
+        sep=layout["delimiter"],
+        header=0 if layout["header"] else None,
+        usecols=columns,
+        dtype="float64",
+        comment="#",
+        engine="c",
+    )
+    return df.to_numpy() if multichannel else df.iloc[:, 0].to_numpy()
+
+
+def csv_cache_dir():
+    return os.environ.get(
+        "EKG_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "ekg_system"),
+    )
+
+
+def csv_cache_path(path, multichannel=False):
+    """
+    Sidecar .npy for a CSV, keyed by absolute path, size and mtime so an
+    edited or replaced file never hits a stale entry. The single-lead and
+    all-leads versions of a file are cached separately.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+
+    key = path + "|leads" if multichannel else path
+    path_key = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    state = f"{st.st_size}|{st.st_mtime_ns}|{CSV_CACHE_VERSION}"
+    state_key = hashlib.sha1(state.encode("utf-8")).hexdigest()[:16]
+
+    return os.path.join(csv_cache_dir(), "csv", f"{path_key}-{state_key}.npy")
+
+
+def _write_csv_cache(cache_path, data):
+    folder = os.path.dirname(cache_path)
+    os.makedirs(folder, exist_ok=True)
+
+    # drop sidecars left behind by older versions of the same file
+    prefix = os.path.basename(cache_path).split("-")[0] + "-"
+    for name in os.listdir(folder):
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+
+    tmp = cache_path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp, cache_path)
+
+
+def load_csv(path, cache=True, mmap=False, multichannel=False):
+    """
+    Signal column of a CSV (all leads with multichannel=True), served
+    from the .npy sidecar cache when the file is unchanged. With
+    mmap=True a cached signal is memory-mapped instead of read.
+    """
+    cache_path = csv_cache_path(path, multichannel) if cache else None
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            return np.load(cache_path, mmap_mode="r" if mmap else None)
+        except (OSError, ValueError):
+            pass
+
+    data = read_csv_samples(path, multichannel=multichannel)
+
+    if cache_path:
+        try:
+            _write_csv_cache(cache_path, data)
+        except OSError:
+            pass  # a read-only cache dir only costs us the speedup
+
+    return data
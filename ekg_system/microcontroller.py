@@ -2,7 +2,108 @@ import os
 import serial
 import threading
 import time
-from serial.tools import list_ports
+import numpy as np
+
+
+class LinkStats:
+    """
+    Reader-side counters for one acquisition. Sample-id continuity is
+    tracked like testing/msp430_logger.py does with expected_sid / drops:
+    a forward jump counts the skipped ids as dropped samples, a backward
+    jump (board reset) just resyncs the expected id. Ids wrap at 2**32.
+    A couple of corrupted ids are not mistaken for a huge gap.
+    """
+
+    MAX_GAP = 1 << 20        # larger forward jumps are resets, not losses
+    HOLD = 2                 # corrupted ids in a row that are still repaired
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.packets = 0          # packets decoded
+        self.dropped_samples = 0  # sample ids that never arrived
+        self.gaps = 0             # places where ids jumped forward
+        self.resyncs = 0          # times the framer had to hunt for SYNC
+        self.skipped_bytes = 0    # bytes thrown away while hunting
+        self.expected_sid = None
+
+        self._prev = None         # last id accounted for (repaired)
+        self._tail = np.empty(0, dtype=np.int64)
+
+    def track(self, sample_ids):
+        if len(sample_ids) == 0:
+            return
+        self.packets += len(sample_ids)
+
+        # A corrupted id byte (the SYNC survived) would look like a gap
+        # of millions followed by a reset. Ids are checked through a
+        # running median of (id - position) over 2 * HOLD + 1 packets:
+        # in-order ids, gaps and resets pass through it unchanged, up to
+        # HOLD corrupted ids in a row are replaced by what they should
+        # have been. The last HOLD ids wait for the next block.
+        ids = np.concatenate([self._tail, sample_ids.astype(np.int64)])
+        n = len(ids)
+        width = 2 * self.HOLD + 1
+        if n < width:
+            self._tail = ids
+            return
+
+        offsets = ids - np.arange(n)
+        median = np.median(np.lib.stride_tricks.sliding_window_view(offsets, width), axis=1)
+        fixed = median.astype(np.int64) + np.arange(self.HOLD, n - self.HOLD)
+
+        if self._prev is None:
+            # the first HOLD ids of an acquisition have less context: each
+            # is checked against the widest centred window there is (the
+            # very first id as it is), so a gap right at the start counts
+            head = [int(np.median(offsets[:2 * i + 1])) + i for i in range(self.HOLD)]
+            fixed = np.concatenate([np.asarray(head, dtype=np.int64), fixed])
+
+        self._account(fixed)
+
+        self._tail = ids[n - 2 * self.HOLD:]
+        self.expected_sid = (int(ids[-1]) + 1) % (1 << 32)
+
+    def flush(self):
+        """
+        Account for the ids track() still holds back, at the end of an
+        acquisition. Nothing follows them to repair them against, so they
+        are taken as they are (an absurd jump still only resyncs).
+        """
+        ids = self._tail
+        first = 0 if self._prev is None else self.HOLD
+        if len(ids) <= first:
+            return
+
+        self._account(ids[first:])
+
+        self._tail = ids[:0]
+        self.expected_sid = (int(ids[-1]) + 1) % (1 << 32)
+
+    def _account(self, fixed):
+        # count the ids missing in front of each repaired id
+        prev = np.empty_like(fixed)
+        prev[0] = fixed[0] - 1 if self._prev is None else self._prev
+        prev[1:] = fixed[:-1]
+        step = (fixed - prev) % (1 << 32)  # 1 = next sample in order
+
+        # backward jumps (board reset) and absurd forward ones just resync
+        missing = step - 1
+        missing[(step == 0) | (missing > self.MAX_GAP)] = 0
+
+        self.dropped_samples += int(missing.sum())
+        self.gaps += int(np.count_nonzero(missing))
+        self._prev = int(fixed[-1])
+
+    def as_dict(self):
+        return {
+            "packets": self.packets,
+            "dropped_samples": self.dropped_samples,
+            "gaps": self.gaps,
+            "resyncs": self.resyncs,
+            "skipped_bytes": self.skipped_bytes,
+        }
 
 
 class MSP430Interface:
@@ -19,101 +120,84 @@ class MSP430Interface:
             [6:9]   ch1 (24-bit BE signed)
             [9:12]  ch2 (24-bit BE signed)
 
-    callback signature (binary):
+    callback signature (binary, one call per sample):
         callback(sample_id: int, ch1: int, ch2: int, t_wall: float)
+
+    batch_callback signature (binary, one call per decoded block):
+        batch_callback(sample_ids: np.ndarray, ch1: np.ndarray,
+                       ch2: np.ndarray, t_wall: float)
+        sample_ids are uint32, ch1/ch2 are raw int32 ADC codes
+        (use code_to_mv to convert, it works on arrays too).
+
+    error_callback(err) is called (from the reader thread) if the reader
+    stops on an exception; the exception is also kept in `error`.
+    `stats` (LinkStats) counts packets, missing sample ids and resyncs.
     """
 
     SYNC = b"\xA5\x5A"
     PACKET_LEN = 12
 
+    # numpy view of one packet, same layout as above
+    PACKET_DTYPE = np.dtype([
+        ("sync", ">u2"),
+        ("sample_id", "<u4"),
+        ("ch1", "u1", (3,)),
+        ("ch2", "u1", (3,)),
+    ])
+
     VREF = 2.42
     GAIN = 6
     FS = (2**23 - 1)
 
-    def __init__(self, baudrate=115200, mode="binary"):
+    STOP_TIMEOUT = 3.0       # seconds stop() waits for the reader thread
+
+    def __init__(self, baudrate=115200, mode="binary", serial_factory=None, port=None):
         self.baudrate = baudrate
         self.mode = mode  # "binary"
-        self.port = os.getenv("EKG_PORT")  # optional override
+        self.port = port or os.getenv("EKG_PORT")  # optional override
+
+        # opens a port: serial_factory(port, baudrate, timeout=...). Defaults
+        # to pyserial; the simulator passes its FakeSerial here
+        self.serial_factory = serial_factory or serial.Serial
 
         self.serial = None
         self.thread = None
         self.running = False
         self.callback = None
+        self.batch_callback = None
+        self.error_callback = None
+
+        # why the reader thread died, None unless it stopped on an error
+        self.error = None
+        self.stats = LinkStats()
 
         # internal buffer for packet framing
         self._buf = bytearray()
 
     def detect_port(self):
         """
-        Try to find the MSP430 CDC device by opening candidate ports and
-        checking which one is actually streaming valid packet sync bytes.
+        Find the MSP430 CDC device: the port that is actually streaming
+        valid packet sync bytes. Blocks for up to one probe timeout per
+        pass; candidate ports are probed concurrently (see discovery),
+        the last port that worked first. The UI uses discovery.PortWatcher
+        instead so it never waits on this.
         """
         # If user manually set EKG_PORT, honor that first
         if self.port:
             return self.port
 
-        ports = list(list_ports.comports())
-
-        # First pass: prefer likely USB serial / TI / MSP430 devices
-        preferred = []
-        others = []
+        from ekg_system.discovery import discover
 
-        for p in ports:
-            desc = (p.description or "").lower()
-            hwid = (p.hwid or "").lower()
+        self.port = discover(self.baudrate, self.serial_factory)
+        return self.port
 
-            if (
-                "usb serial" in desc
-                or "msp" in desc
-                or "ti" in desc
-                or "texas instruments" in desc
-                or "1cbe" in hwid
-                or "2047" in hwid
-            ):
-                preferred.append(p)
-            else:
-                others.append(p)
-
-        candidates = preferred + others
-
-        for p in candidates:
-            ser = None
-            try:
-                ser = serial.Serial(p.device, self.baudrate, timeout=0.25)
-
-                try:
-                    ser.reset_input_buffer()
-                except Exception:
-                    pass
-
-                # Give device a brief moment to stream
-                start = time.time()
-                data = bytearray()
-
-                while time.time() - start < 1.5:
-                    chunk = ser.read(256)
-                    if chunk:
-                        data.extend(chunk)
-
-                        idx = data.find(self.SYNC)
-                        if idx >= 0 and len(data) - idx >= self.PACKET_LEN:
-                            self.port = p.device
-                            return self.port
-
-                # No valid packet seen on this port
-            except Exception:
-                pass
-            finally:
-                if ser is not None:
-                    try:
-                        ser.close()
-                    except Exception:
-                        pass
-
-        return None
+    def start(self, callback=None, batch_callback=None, error_callback=None):
+        """
+        Open port and start background reader thread.
 
-    def start(self, callback):
-        """Open port and start background reader thread."""
+        Either callback (per sample) or batch_callback (per block of
+        samples) can be given; both are called if both are set.
+        """
         if self.serial and self.serial.is_open:
             return
 
@@ -123,13 +207,17 @@ class MSP430Interface:
         if not self.port:
             raise RuntimeError("No MSP430 port detected (and EKG_PORT not set)")
 
-        self.serial = serial.Serial(self.port, self.baudrate, timeout=1)
+        self.serial = self.serial_factory(self.port, self.baudrate, timeout=1)
         try:
             self.serial.reset_input_buffer()
         except Exception:
             pass
 
         self.callback = callback
+        self.batch_callback = batch_callback
+        self.error_callback = error_callback
+        self.error = None
+        self.stats.reset()
         self.running = True
         self._buf = bytearray()
 
@@ -144,11 +232,96 @@ class MSP430Interface:
             v -= 1 << 24
         return v
 
+    @staticmethod
+    def _s24_from_be3_array(b) -> np.ndarray:
+        """Vectorized _s24_from_be3 for an (n, 3) uint8 array."""
+        v = (
+            (b[:, 0].astype(np.int32) << 16)
+            | (b[:, 1].astype(np.int32) << 8)
+            | b[:, 2].astype(np.int32)
+        )
+        return (v ^ 0x800000) - 0x800000
+
     @classmethod
-    def code_to_mv(cls, code: int) -> float:
-        """Convert ADS1292R ADC code to millivolts."""
+    def code_to_mv(cls, code):
+        """Convert ADS1292R ADC code (scalar or array) to millivolts."""
         return (1000.0 * code * cls.VREF) / (cls.GAIN * cls.FS)
 
+    @classmethod
+    def decode_block(cls, buf, stats=None):
+        """
+        Decode every aligned packet in buf at once.
+
+        Framing matches the old one-packet-at-a-time loop: look for SYNC,
+        drop anything before it, then take consecutive 12-byte packets
+        for as long as each one still starts with SYNC. Only a corrupted
+        packet sends us back to searching.
+
+        Returns (sample_ids, ch1, ch2, consumed) where consumed is the
+        number of leading bytes of buf that can be discarded. With a
+        LinkStats as stats, every SYNC hunt that skipped bytes counts as
+        a resync.
+        """
+        n = len(buf)
+        resyncs = 0
+        # one copy of the read so numpy views never pin the bytearray
+        raw = np.frombuffer(bytes(buf), dtype=np.uint8)
+
+        runs = []
+        pos = 0
+
+        while n - pos >= cls.PACKET_LEN:
+            idx = buf.find(cls.SYNC, pos)
+            if idx < 0:
+                # keep last 1 byte in case it's 0xA5
+                resyncs += 1
+                pos = n - 1
+                break
+
+            if idx > pos:
+                resyncs += 1
+
+            if n - idx < cls.PACKET_LEN:
+                pos = idx
+                break
+
+            count = (n - idx) // cls.PACKET_LEN
+            rows = raw[idx: idx + count * cls.PACKET_LEN].reshape(count, cls.PACKET_LEN)
+            good = (rows[:, 0] == 0xA5) & (rows[:, 1] == 0x5A)
+            run = count if good.all() else int(np.argmin(good))
+
+            runs.append(rows[:run])
+            pos = idx + run * cls.PACKET_LEN
+
+        if stats is not None:
+            stats.resyncs += resyncs
+            stats.skipped_bytes += pos - cls.PACKET_LEN * sum(len(r) for r in runs)
+
+        if not runs:
+            empty = np.empty(0, dtype=np.int32)
+            return np.empty(0, dtype=np.uint32), empty, empty.copy(), pos
+
+        rows = runs[0] if len(runs) == 1 else np.concatenate(runs)
+        pkts = np.ascontiguousarray(rows).view(cls.PACKET_DTYPE).reshape(-1)
+
+        sample_ids = pkts["sample_id"].astype(np.uint32)
+        ch1 = cls._s24_from_be3_array(pkts["ch1"])
+        ch2 = cls._s24_from_be3_array(pkts["ch2"])
+
+        return sample_ids, ch1, ch2, pos
+
+    def _dispatch(self, sample_ids, ch1, ch2, t_wall):
+        if self.batch_callback:
+            self.batch_callback(sample_ids, ch1, ch2, t_wall)
+
+        if self.callback:
+            # per-sample compatibility path (same int mV values as before)
+            ch1_mv = self.code_to_mv(ch1).astype(int)
+            ch2_mv = self.code_to_mv(ch2).astype(int)
+
+            for sid, c1, c2 in zip(sample_ids.tolist(), ch1_mv.tolist(), ch2_mv.tolist()):
+                self.callback(sid, c1, c2, t_wall)
+
     def _read_loop(self):
         if self.mode != "binary":
             raise RuntimeError(f"Unsupported mode: {self.mode}")
@@ -159,47 +332,39 @@ class MSP430Interface:
                 if chunk:
                     self._buf.extend(chunk)
 
-                while True:
-                    if len(self._buf) < self.PACKET_LEN:
-                        break
-
-                    idx = self._buf.find(self.SYNC)
-                    if idx < 0:
-                        # keep last 1 byte in case it's 0xA5
-                        self._buf[:] = self._buf[-1:]
-                        break
-
-                    if idx > 0:
-                        del self._buf[:idx]
-
-                    if len(self._buf) < self.PACKET_LEN:
-                        break
+                if len(self._buf) < self.PACKET_LEN:
+                    continue
 
-                    pkt = self._buf[: self.PACKET_LEN]
-                    del self._buf[: self.PACKET_LEN]
+                sample_ids, ch1, ch2, consumed = self.decode_block(self._buf, self.stats)
+                if consumed:
+                    del self._buf[:consumed]
 
-                    sid = (
-                        pkt[2]
-                        | (pkt[3] << 8)
-                        | (pkt[4] << 16)
-                        | (pkt[5] << 24)
-                    )
-                    ch1 = self._s24_from_be3(pkt[6], pkt[7], pkt[8])
-                    ch2 = self._s24_from_be3(pkt[9], pkt[10], pkt[11])
+                if len(sample_ids):
+                    self.stats.track(sample_ids)
+                    self._dispatch(sample_ids, ch1, ch2, time.time())
 
-                    # Optional mV conversions available for UI or debugging if needed
-                    ch1_mv = self.code_to_mv(ch1)
-                    ch2_mv = self.code_to_mv(ch2)
+            except Exception as err:
+                # stop() closing the port under a blocked read is expected
+                if not self.running:
+                    break
 
-                    if self.callback:
-                        self.callback(int(sid), int(ch1_mv), int(ch2_mv), time.time())
-
-            except Exception:
+                # a lost device or a failing callback: keep the reason
+                # (PortWatcher then reports the reader as gone) instead
+                # of just going quiet
+                self.error = err
                 self.running = False
+                if self.error_callback:
+                    try:
+                        self.error_callback(err)
+                    except Exception:
+                        pass
                 break
 
     def stop(self):
-        """Stop reader thread and close serial port."""
+        """
+        Stop the reader thread and close the serial port. Returns once the
+        reader has finished, so no callback runs after stop().
+        """
         self.running = False
         if self.serial:
             try:
@@ -207,4 +372,13 @@ class MSP430Interface:
                     self.serial.close()
             except Exception:
                 pass
-        self.serial = None
\ No newline at end of file
+
+        # closing the port ends a blocked read; a callback calling stop()
+        # can't wait for itself
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.STOP_TIMEOUT)
+        self.serial = None
+
+        # ids held back for repair were never followed by another block
+        self.stats.flush()
\ No newline at end of file
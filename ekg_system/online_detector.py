@@ -0,0 +1,140 @@
+from collections import deque
+
+import numpy as np
+
+
+class OnlinePeakDetector:
+    """
+    Incremental R-peak detector for filtered sample blocks (e.g. the
+    output of StreamingBandpassFilter on the live MSP430 stream).
+
+    Same idea as EKGProcessor.detect_r_peaks, with the whole-signal
+    statistics replaced by running ones:
+      - threshold = height_factor * running mean of |signal|
+        (exponential average over tau_sec)
+      - samples above clip_factor * the running R amplitude are treated
+        as artefacts and zeroed, like the 99th percentile clip offline
+      - of two peaks closer than distance_ms the larger one wins
+
+    Latency: a peak is reported once distance_ms of signal has arrived
+    after it without a larger peak, i.e. a fixed distance_ms (+1 sample)
+    after the R wave, delivered by the first process() call that covers
+    that point. The first warmup_sec of signal only trains the threshold.
+
+    process() costs O(len(block)) and memory is constant.
+    """
+
+    def __init__(self, fs, height_factor=1.2, distance_ms=80, tau_sec=2.0,
+                 clip_factor=3.0, warmup_sec=1.0, hr_beats=8):
+        self.fs = fs
+        self.height_factor = height_factor
+        self.distance = max(1, int((distance_ms / 1000.0) * fs))
+        self.tau = tau_sec * fs
+        self.clip_factor = clip_factor
+        self.warmup = int(warmup_sec * fs)
+        self.latency_samples = self.distance + 1
+
+        self._recent = deque(maxlen=hr_beats + 1)
+        self.reset()
+
+    def reset(self):
+        """Start over, e.g. after a gap in the stream."""
+        self.samples_seen = 0
+        self.mean_level = 0.0
+        self.peak_level = None
+        self.threshold = None
+
+        self._tail = np.empty(0)
+        self._pending = None  # (index, amplitude) waiting for confirmation
+        self._last_peak = None
+        self._recent.clear()
+
+    def skip(self, n):
+        """
+        Account for n samples that never arrived (a gap in the stream), so
+        sample indices keep matching the sample ids. The peak waiting for
+        confirmation and the RR history are dropped, beats inside the gap
+        were missed; the running levels and threshold are kept.
+        """
+        self.samples_seen += int(n)
+        self._tail = np.empty(0)
+        self._pending = None
+        self._last_peak = None
+        self._recent.clear()
+
+    def process(self, block):
+        """Feed one block; returns absolute sample indices of newly confirmed peaks."""
+        x = np.abs(np.asarray(block, dtype=float))
+        n = len(x)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+
+        if self.peak_level is not None:
+            x[x > self.clip_factor * self.peak_level] = 0
+
+        # running mean of the envelope: plain mean while warming up,
+        # exponential with time constant tau afterwards
+        block_mean = float(np.mean(x))
+        if self.samples_seen < self.warmup:
+            seen = self.samples_seen + n
+            self.mean_level += (block_mean - self.mean_level) * (n / seen)
+        else:
+            alpha = 1.0 - np.exp(-n / self.tau)
+            self.mean_level += (block_mean - self.mean_level) * alpha
+
+        base = self.samples_seen
+        self.samples_seen += n
+
+        if self.samples_seen < self.warmup:
+            self._tail = x[-2:]
+            return np.empty(0, dtype=np.int64)
+
+        self.threshold = self.height_factor * self.mean_level
+
+        # local maxima above threshold; the carried tail lets a peak on the
+        # last sample of the previous block be judged now
+        ext = np.concatenate([self._tail, x])
+        offset = base - len(self._tail)
+        self._tail = ext[-2:]
+
+        mid = ext[1:-1]
+        is_peak = (mid > ext[:-2]) & (mid >= ext[2:]) & (mid >= self.threshold)
+        cand = np.flatnonzero(is_peak) + 1
+
+        confirmed = []
+        for i, v in zip((cand + offset).tolist(), ext[cand].tolist()):
+            if self._pending is not None:
+                p_i, p_v = self._pending
+                if i - p_i < self.distance:
+                    if v > p_v:
+                        self._pending = (i, v)
+                    continue
+                confirmed.append(self._confirm())
+
+            if self._last_peak is not None and i - self._last_peak < self.distance:
+                continue
+            self._pending = (i, v)
+
+        # nothing larger can show up within distance of the pending peak
+        if self._pending is not None:
+            if (self.samples_seen - 1) - self._pending[0] > self.distance:
+                confirmed.append(self._confirm())
+
+        return np.asarray(confirmed, dtype=np.int64)
+
+    def _confirm(self):
+        i, v = self._pending
+        self._pending = None
+        self._last_peak = i
+        self._recent.append(i)
+
+        self.peak_level = v if self.peak_level is None else 0.9 * self.peak_level + 0.1 * v
+        return i
+
+    def heart_rate(self):
+        """BPM from the median of the last few RR intervals, or None."""
+        if len(self._recent) < 2:
+            return None
+
+        rr = np.diff(np.asarray(self._recent))
+        return 60.0 * self.fs / float(np.median(rr))
@@ -0,0 +1,218 @@
+# Offline engine for multi-hour recordings: band-pass filtering and R-peak
+# detection split into overlapping chunks on a process pool.
+#
+# The signal and intermediate results live in .npy files in a temp
+# directory, memory-mapped by the parent and every worker, so nothing large
+# is pickled between processes and a 24 h recording never has to fit in
+# one worker's memory.
+
+import os
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+from scipy.signal import find_peaks, sosfilt, sosfiltfilt
+
+from ekg_system.chunked import chunked_abs_percentile, iter_chunks, resolve_peak_seams
+from ekg_system.filters import design_filter
+
+
+def filter_margin(sos, fs, tol=1e-12, max_sec=60):
+    """
+    Samples of overlap needed on each side of a chunk so that its
+    sosfiltfilt output matches a single pass to within tol (relative):
+    the point where the filter's impulse response has decayed below tol.
+    """
+    n = int(max_sec * fs)
+    impulse = np.zeros(n)
+    impulse[0] = 1.0
+
+    h = np.abs(sosfilt(sos, impulse))
+    above = np.flatnonzero(h > tol * h.max())
+    return int(above[-1]) + 1 if len(above) else 0
+
+
+def _filter_chunk(task):
+    # worker: filter one chunk plus margins, keep the core, store |y| too
+    paths, sos, start, stop, margin = task
+
+    x = np.load(paths["input"], mmap_mode="r")
+    filtered = np.load(paths["filtered"], mmap_mode="r+")
+    envelope = np.load(paths["envelope"], mmap_mode="r+")
+
+    lo = max(0, start - margin)
+    hi = min(len(x), stop + margin)
+
+    y = sosfiltfilt(sos, np.asarray(x[lo:hi], dtype=float))[start - lo:stop - lo]
+    filtered[start:stop] = y
+    envelope[start:stop] = np.abs(y)
+
+    filtered.flush()
+    envelope.flush()
+
+
+def _peaks_chunk(task):
+    # worker: find_peaks on one chunk of the clipped envelope plus margins
+    paths, start, stop, margin, limit, threshold, distance = task
+
+    envelope = np.load(paths["envelope"], mmap_mode="r")
+    lo = max(0, start - margin)
+    hi = min(len(envelope), stop + margin)
+
+    signal_abs = np.array(envelope[lo:hi])
+    signal_abs[signal_abs > limit] = 0
+
+    peaks, _ = find_peaks(signal_abs, height=threshold, distance=distance)
+    peaks = peaks + lo
+    return peaks[(peaks >= start) & (peaks < stop)]
+
+
+def _clipped_envelope(paths, limit):
+    # envelope(start, stop) of the clipped |signal| for resolve_peak_seams
+    envelope = np.load(paths["envelope"], mmap_mode="r")
+
+    def read(start, stop):
+        part = np.array(envelope[start:stop])
+        part[part > limit] = 0
+        return part
+
+    return read
+
+
+def _results(futures, cancel=None, poll=0.1):
+    # results of futures in order; cancel.check() runs while waiting
+    pending = set(futures)
+    while pending:
+        if cancel is not None:
+            cancel.check()
+        _, pending = wait(pending, timeout=poll)
+    return [future.result() for future in futures]
+
+
+class ParallelPipeline:
+    """
+    filter_signal + detect_r_peaks over a long recording on a process pool.
+
+    The recording is cut into chunk_sec chunks. Each worker filters its
+    chunk with filter_margin() extra samples on both sides, so chunk edges
+    match the single-pass sosfiltfilt to ~1e-12. The detection statistics
+    (99th percentile of |signal|, mean of the clipped envelope) are
+    computed once over the whole filtered signal, then peaks are found
+    per chunk with 4 * distance extra samples on both sides; the parent
+    re-checks every chunk boundary (chunked.resolve_peak_seams), so the
+    peaks come out the same as in EKGProcessor.detect_r_peaks.
+
+        filtered, peaks = ParallelPipeline(sampling_rate=1000).run(signal)
+    """
+
+    def __init__(self, sampling_rate=1000, lowcut=1.0, highcut=100.0,
+                 height_factor=1.2, distance_ms=80, chunk_sec=600,
+                 workers=None, tol=1e-12):
+        self.sampling_rate = sampling_rate
+        self.lowcut = lowcut
+        self.highcut = highcut
+        self.height_factor = height_factor
+        self.distance_ms = distance_ms
+        self.chunk_sec = chunk_sec
+        self.workers = workers or os.cpu_count() or 1
+
+        self.sos = design_filter(sampling_rate, lowcut, highcut)
+        self.margin = filter_margin(self.sos, sampling_rate, tol)
+        self.distance = int((distance_ms / 1000.0) * sampling_rate)
+
+    def run(self, signal, cancel=None):
+        """
+        Returns (filtered, peaks). filtered is a read-only memmap; its temp
+        directory is removed once the last reference to it is gone.
+        cancel.check() (see workers.CancelToken) runs between chunks and
+        while waiting on the workers; whatever it raises ends the run,
+        queued chunks are dropped and the temp directory removed.
+        """
+        n = len(signal)
+        chunk = max(1, int(self.chunk_sec * self.sampling_rate))
+
+        tmpdir = tempfile.mkdtemp(prefix="ekg_pipeline_")
+        paths = {
+            name: os.path.join(tmpdir, f"{name}.npy")
+            for name in ("input", "filtered", "envelope")
+        }
+
+        try:
+            for name in ("filtered", "envelope"):
+                np.lib.format.open_memmap(paths[name], mode="w+", dtype=float, shape=(n,)).flush()
+
+            spans = list(iter_chunks(n, chunk))
+
+            peak_margin = 4 * max(1, self.distance)
+
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(spans))) as pool:
+                try:
+                    self._filter(signal, paths, spans, pool, cancel)
+
+                    limit, threshold = self._statistics(paths["envelope"], chunk, cancel)
+
+                    found = _results([
+                        pool.submit(_peaks_chunk, (paths, start, stop, peak_margin, limit,
+                                                   threshold, self.distance))
+                        for start, stop in spans
+                    ], cancel)
+                except BaseException:
+                    # don't wait for chunks nobody wants any more
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+
+            peaks = np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+            peaks = resolve_peak_seams(
+                peaks, [start for start, _ in spans[1:]], _clipped_envelope(paths, limit),
+                n, threshold, self.distance, peak_margin,
+            )
+
+            filtered = np.load(paths["filtered"], mmap_mode="r")
+
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+        # Windows can't delete a mapped file, so the directory goes when
+        # the mapping itself is closed (every view of filtered released)
+        weakref.finalize(filtered.base, shutil.rmtree, tmpdir, True)
+        return filtered, peaks
+
+    def _filter(self, signal, paths, spans, pool, cancel=None):
+        # copy the input to disk chunk by chunk, handing each chunk to the
+        # pool as soon as its right margin is written, so filtering runs
+        # alongside the copy instead of after it
+        n = len(signal)
+        x = np.lib.format.open_memmap(paths["input"], mode="w+", dtype=float, shape=(n,))
+
+        futures = []
+        submitted = 0
+        for start, stop in spans:
+            if cancel is not None:
+                cancel.check()
+            x[start:stop] = signal[start:stop]
+            x.flush()
+
+            while submitted < len(spans) and min(n, spans[submitted][1] + self.margin) <= stop:
+                lo, hi = spans[submitted]
+                futures.append(pool.submit(_filter_chunk, (paths, self.sos, lo, hi, self.margin)))
+                submitted += 1
+
+        del x
+        _results(futures, cancel)
+
+    def _statistics(self, envelope_path, chunk, cancel=None):
+        envelope = np.load(envelope_path, mmap_mode="r")
+        n = len(envelope)
+
+        limit = chunked_abs_percentile(envelope, 99, chunk, cancel=cancel)
+
+        total = 0.0
+        for start, stop in iter_chunks(n, chunk, cancel):
+            part = envelope[start:stop]
+            total += float(np.sum(part, where=part <= limit))
+
+        threshold = (total / n) * self.height_factor
+        return limit, threshold
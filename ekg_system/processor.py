@@ -1,19 +1,61 @@
 import numpy as np
-from scipy.signal import butter, filtfilt, find_peaks
+from scipy.signal import find_peaks, sosfiltfilt
+
+from ekg_system.capture import CAPTURE_EXT, codes_to_mv, lead_codes, mv_per_code, read_capture
+from ekg_system.chunked import (
+    DEFAULT_CHUNK,
+    LazyArray,
+    chunked_abs_percentile,
+    chunked_sosfiltfilt,
+    chunked_find_peaks,
+    empty_like_on_disk,
+    is_lazy,
+    iter_chunks,
+)
+from ekg_system.filters import StreamingBandpassFilter, butter_bandpass
+from ekg_system.loaders import load_csv, read_txt_samples
 
 
 class EKGProcessor:
-    def __init__(self, sampling_rate: int = 1000):
+    def __init__(self, sampling_rate: int = 1000, chunk_size: int = DEFAULT_CHUNK):
         self.sampling_rate = sampling_rate
+        # samples per block when raw_data is memory-mapped (mmap=True)
+        self.chunk_size = chunk_size
         self.raw_data = None
         self.filtered_data = None
         self.peaks = None
+        # per-lead peaks for (n_samples, n_leads) data, see detect_r_peaks
+        self.lead_peaks = None
 
-    def load_data(self, data_or_path):
-        import pandas as pd
+    @property
+    def n_leads(self):
+        if self.raw_data is None:
+            return 0
+        return 1 if self.raw_data.ndim == 1 else self.raw_data.shape[1]
+
+    def load_data(self, data_or_path, mmap=False, cache=True, multichannel=False):
+        """
+        Load a recording from an array or a .csv/.txt/.npy/.ekgb file.
+
+        raw_data is (n_samples,) for one lead or (n_samples, n_leads).
+        2D arrays and .npy files are taken as they are; with
+        multichannel=True captures load ch1 and ch2 and CSVs every signal
+        column, instead of only the first lead.
+
+        With mmap=True, .npy files and binary captures are memory-mapped
+        and raw_data becomes a LazyArray; filter_signal, detect_r_peaks
+        and segment_waveforms then work through it chunk by chunk.
+
+        CSV signals are cached as .npy sidecars (see loaders.load_csv),
+        pass cache=False to always re-parse.
+        """
         import numpy as np
 
+        self.lead_peaks = None
+
         if isinstance(data_or_path, np.ndarray):
+            if data_or_path.ndim not in (1, 2):
+                raise ValueError("Expected (n_samples,) or (n_samples, n_leads) data")
             self.raw_data = data_or_path.astype(float)
             self.filtered_data = None
             self.peaks = None
@@ -22,68 +64,52 @@ class EKGProcessor:
         path = str(data_or_path)
 
         if path.endswith(".npy"):
-            self.raw_data = np.load(path).astype(float)
+            if mmap:
+                self.raw_data = LazyArray(np.load(path, mmap_mode="r"))
+            else:
+                self.raw_data = np.asarray(np.load(path), dtype=float)
             self.filtered_data = None
             self.peaks = None
             return
 
-        if path.endswith(".txt"):
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
-
-            values = []
-            dash_count = 0
-            data_started = False
-
-            for line in lines:
-                s = line.strip()
-                if not s:
-                    continue
+        if path.endswith(CAPTURE_EXT):
+            header, records = read_capture(path, mmap=mmap)
+            if len(records) == 0:
+                raise RuntimeError("No samples found in capture file")
 
-                if s == "---":
-                    dash_count += 1
-                    if dash_count >= 2:
-                        data_started = True
-                    continue
+            # the capture knows the rate it was recorded at
+            fs = header["fs"]
+            self.sampling_rate = int(fs) if fs.is_integer() else fs
 
-                if not data_started:
-                    continue
-
-                try:
-                    values.append(float(s))
-                except ValueError:
-                    continue
-
-            if not values:
-                raise RuntimeError("No numeric ECG samples found in TXT file")
-
-            self.raw_data = np.array(values, dtype=float)
+            codes = lead_codes(records) if multichannel else records["ch1"]
+            if mmap:
+                self.raw_data = LazyArray(codes, scale=mv_per_code(header))
+            else:
+                self.raw_data = codes_to_mv(codes, header)
             self.filtered_data = None
             self.peaks = None
             return
 
-        try:
-            df = pd.read_csv(path, comment="#")
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-
-            if not numeric_cols:
-                raise ValueError("No numeric columns found")
+        if path.endswith(".txt"):
+            data = read_txt_samples(path)
 
-            if len(numeric_cols) >= 2:
-                data = df[numeric_cols[1]].to_numpy(dtype=float)
-            else:
-                data = df[numeric_cols[0]].to_numpy(dtype=float)
+            if len(data) == 0:
+                raise RuntimeError("No numeric ECG samples found in TXT file")
 
             self.raw_data = data
             self.filtered_data = None
             self.peaks = None
             return
 
+        try:
+            data = load_csv(path, cache=cache, mmap=mmap, multichannel=multichannel)
+            self.raw_data = LazyArray(data) if isinstance(data, np.memmap) else data
+
         except Exception:
             try:
                 data = np.genfromtxt(path, delimiter=",", comments="#", skip_header=1)
                 if data.ndim > 1 and data.shape[1] >= 2:
-                    data = data[:, 1]
+                    data = data[:, 1:] if multichannel else data[:, 1]
                 self.raw_data = np.array(data, dtype=float)
             except Exception as err:
                 raise RuntimeError(f"Failed to load file: {err}")
@@ -91,44 +117,171 @@ class EKGProcessor:
         self.filtered_data = None
         self.peaks = None
 
-    def butter_bandpass(self, lowcut, highcut, order=4):
-        nyquist = 0.5 * self.sampling_rate
-        low = lowcut / nyquist
-        high = highcut / nyquist
-        return butter(order, [low, high], btype="band")
+    def butter_bandpass(self, lowcut, highcut, order=4, output="ba"):
+        return butter_bandpass(self.sampling_rate, lowcut, highcut, order, output)
 
-    def filter_signal(self, lowcut=1.0, highcut=100.0):
+    def streaming_filter(self, lowcut=1.0, highcut=100.0):
+        """Causal block-by-block version of filter_signal, for live or chunked data."""
+        return StreamingBandpassFilter(self.sampling_rate, lowcut, highcut)
+
+    def filter_signal(self, lowcut=1.0, highcut=100.0, cancel=None):
+        """
+        Zero-phase band-pass of raw_data into filtered_data. cancel (e.g.
+        a workers.CancelToken) is checked between chunks; in-memory data
+        is then filtered a chunk at a time too, which matches the single
+        sosfiltfilt call to ~1e-12.
+        """
         if self.raw_data is None:
             raise ValueError("No data loaded")
 
-        b, a = self.butter_bandpass(lowcut, highcut)
-        self.filtered_data = filtfilt(b, a, self.raw_data)
-
-    def detect_r_peaks(self, height_factor=1.2, distance_ms=80):
+        # second-order sections: the 1 Hz corner at fs=1000 is too close
+        # to the unit circle for a stable single (b, a) polynomial.
+        # Multi-lead data is filtered down axis 0, all leads in one call
+        sos = self.butter_bandpass(lowcut, highcut, output="sos")
+
+        if is_lazy(self.raw_data):
+            self.filtered_data = chunked_sosfiltfilt(sos, self.raw_data, self.chunk_size, cancel=cancel)
+        elif cancel is not None:
+            self.filtered_data = chunked_sosfiltfilt(
+                sos, self.raw_data, self.chunk_size, out=np.empty(self.raw_data.shape), cancel=cancel
+            )
+        else:
+            self.filtered_data = sosfiltfilt(sos, self.raw_data, axis=0)
+
+    def detect_r_peaks(self, height_factor=1.2, distance_ms=80, fuse=False, cancel=None):
+        """
+        R-peaks of the filtered signal: |signal| with the top 1% zeroed,
+        peaks above height_factor * its mean, at least distance_ms apart.
+
+        With several leads the statistics are computed for all leads at
+        once and peaks are found per lead (self.lead_peaks); self.peaks
+        is lead 0. fuse=True instead averages the leads' envelopes, each
+        normalized by its own mean, and detects once on the result:
+        a beat that is weak on one lead is still carried by the other,
+        for one find_peaks pass however many leads there are.
+
+        cancel.check() runs between chunks of memory-mapped data and
+        between the steps of the in-memory detection.
+        """
         if self.filtered_data is None:
             raise ValueError("Signal not filtered yet")
 
-        signal = self.filtered_data.copy()
+        if is_lazy(self.filtered_data):
+            return self._detect_r_peaks_chunked(height_factor, distance_ms, fuse, cancel)
 
-        limit = np.percentile(np.abs(signal), 99)
-        signal[np.abs(signal) > limit] = 0
+        # one |signal| buffer does all the work: zeroing the top 1% there
+        # is what the old copy / clip / polarity flip / abs steps added up to
+        signal_abs = np.abs(self.filtered_data)
 
-        if abs(np.min(signal)) > abs(np.max(signal)):
-            signal = -signal
+        limit = np.percentile(signal_abs, 99, axis=0)
+        signal_abs[signal_abs > limit] = 0
+        if cancel is not None:
+            cancel.check()
 
-        signal_abs = np.abs(signal)
-        threshold = np.mean(signal_abs) * height_factor
+        level = np.mean(signal_abs, axis=0)
         distance_samples = int((distance_ms / 1000.0) * self.sampling_rate)
 
-        peaks, _ = find_peaks(
-            signal_abs,
-            height=threshold,
-            distance=distance_samples
-        )
+        if signal_abs.ndim == 1:
+            peaks, _ = find_peaks(signal_abs, height=level * height_factor, distance=distance_samples)
+            self.lead_peaks = [peaks]
+
+        elif fuse:
+            fused, threshold = _fuse_envelopes(signal_abs, level, height_factor)
+            peaks, _ = find_peaks(fused, height=threshold, distance=distance_samples)
+            self.lead_peaks = None
+
+        else:
+            self.lead_peaks = [
+                find_peaks(signal_abs[:, j], height=level[j] * height_factor,
+                           distance=distance_samples)[0]
+                for j in range(signal_abs.shape[1])
+            ]
+            peaks = self.lead_peaks[0]
 
         self.peaks = peaks
         return peaks
 
+    def _detect_r_peaks_chunked(self, height_factor, distance_ms, fuse=False, cancel=None):
+        # same rules as detect_r_peaks, with the whole-signal statistics
+        # gathered in passes over chunks of the on-disk filtered signal
+        signal = self.filtered_data
+        n = len(signal)
+        chunk = self.chunk_size
+
+        if signal.ndim == 1:
+            limit = chunked_abs_percentile(signal, 99, chunk, cancel=cancel)
+        else:
+            limit = np.array([
+                chunked_abs_percentile(signal[:, j], 99, chunk, cancel=cancel)
+                for j in range(signal.shape[1])
+            ])
+
+        def clipped(start, stop):
+            signal_abs = np.abs(signal[start:stop])
+            signal_abs[signal_abs > limit] = 0
+            return signal_abs
+
+        total = 0.0
+        for start, stop in iter_chunks(n, chunk, cancel):
+            total = total + np.sum(clipped(start, stop), axis=0)
+
+        level = total / n
+        distance_samples = int((distance_ms / 1000.0) * self.sampling_rate)
+
+        if signal.ndim == 1:
+            peaks = chunked_find_peaks(
+                clipped, n, level * height_factor, distance_samples, chunk, cancel=cancel
+            )
+            self.lead_peaks = [peaks]
+
+        elif fuse:
+            _, threshold = _fuse_envelopes(None, level, height_factor)
+
+            def envelope(start, stop):
+                return _fuse_envelopes(clipped(start, stop), level, height_factor)[0]
+
+            peaks = chunked_find_peaks(envelope, n, threshold, distance_samples, chunk, cancel=cancel)
+            self.lead_peaks = None
+
+        else:
+            self.lead_peaks = [
+                chunked_find_peaks(
+                    lambda start, stop, j=j: clipped(start, stop)[:, j],
+                    n, level[j] * height_factor, distance_samples, chunk, cancel=cancel,
+                )
+                for j in range(signal.shape[1])
+            ]
+            peaks = self.lead_peaks[0]
+
+        self.peaks = peaks
+        return peaks
+
+    def process_parallel(self, lowcut=1.0, highcut=100.0, height_factor=1.2,
+                         distance_ms=80, workers=None, chunk_sec=600, cancel=None):
+        """
+        filter_signal + detect_r_peaks for long recordings, split into
+        overlapping chunks on a process pool (see pipeline.ParallelPipeline).
+        """
+        from ekg_system.pipeline import ParallelPipeline
+
+        if self.raw_data is None:
+            raise ValueError("No data loaded")
+        if self.raw_data.ndim != 1:
+            raise ValueError("process_parallel handles one lead; use filter_signal/detect_r_peaks")
+
+        pipeline = ParallelPipeline(
+            sampling_rate=self.sampling_rate,
+            lowcut=lowcut,
+            highcut=highcut,
+            height_factor=height_factor,
+            distance_ms=distance_ms,
+            chunk_sec=chunk_sec,
+            workers=workers,
+        )
+        self.filtered_data, self.peaks = pipeline.run(self.raw_data, cancel=cancel)
+        self.lead_peaks = [self.peaks]
+        return self.peaks
+
     def calculate_heart_rate(self):
         if self.peaks is None or len(self.peaks) < 2:
             raise ValueError("Not enough peaks")
@@ -143,13 +296,53 @@ class EKGProcessor:
             "max": np.max(heart_rates)
         }
 
-    def segment_waveforms(self, window_before=50, window_after=100):
+    def segment_waveforms(self, window_before=50, window_after=100, lead=0, cancel=None):
+        """
+        Beats as one (n_beats, window_before + window_after) masked
+        array, row i = raw_data[peak_i - window_before : peak_i + window_after]
+        (of the given lead for multi-lead data).
+        Near either end of the recording the part of the window that runs
+        off the signal is masked. Built with a single gather; for
+        memory-mapped data the matrix goes to a temp file, a chunk of
+        beats at a time (cancel.check() runs between chunks).
+        """
         if self.peaks is None:
             raise ValueError("No peaks detected")
 
-        waveforms = []
-        for peak in self.peaks:
-            start = max(0, peak - window_before)
-            end = min(len(self.raw_data), peak + window_after)
-            waveforms.append(self.raw_data[start:end])
-        return waveforms
\ No newline at end of file
+        n = len(self.raw_data)
+        peaks = np.asarray(self.peaks, dtype=np.intp)
+        offsets = np.arange(-window_before, window_after)
+
+        def gather(p):
+            idx = p[:, None] + offsets
+            data = self.raw_data[np.clip(idx, 0, n - 1)]
+            if data.ndim == 3:
+                data = data[:, :, lead]
+            return data, (idx < 0) | (idx >= n)
+
+        if not is_lazy(self.raw_data):
+            data, mask = gather(peaks)
+            return np.ma.MaskedArray(data, mask=mask)
+
+        shape = (len(peaks), len(offsets))
+        data = empty_like_on_disk(shape)
+        mask = np.zeros(shape, dtype=bool)
+        rows = max(1, self.chunk_size // max(1, len(offsets)))
+
+        for start, stop in iter_chunks(len(peaks), rows, cancel):
+            data[start:stop], mask[start:stop] = gather(peaks[start:stop])
+
+        return np.ma.MaskedArray(data, mask=mask)
+
+
+def _fuse_envelopes(signal_abs, level, height_factor):
+    # mean of the per-lead envelopes, each scaled to a mean of 1 so one
+    # high-amplitude lead can't drown the others. Flat leads (mean 0) are
+    # left out. Returns (fused envelope, detection threshold); the fused
+    # mean is just the share of leads that count, no extra pass needed
+    active = level > 0
+    weight = np.where(active, 1.0 / np.where(active, level, 1.0), 0.0) / len(level)
+    threshold = height_factor * (np.count_nonzero(active) / len(level))
+
+    fused = None if signal_abs is None else signal_abs @ weight
+    return fused, threshold
@@ -0,0 +1,196 @@
+# Min/max decimation pyramid for drawing long recordings.
+#
+# Level 0 holds the min and max of every BASE-sample block, each level
+# above halves the number of blocks. To draw a time range at a given
+# pixel width, view() picks the level with about one block per pixel and
+# returns only the blocks in range as (min, max) pairs, so a 24 h trace
+# costs a few thousand points at any zoom and no R wave is ever skipped
+# (every block keeps its extremes). Zoomed in far enough, the raw
+# samples are returned instead.
+#
+# Multi-lead recordings are drawn from lead 0. A pyramid can be saved
+# in the cache dir (keyed by the recording's path) and is reused as long
+# as the recording is unchanged.
+
+import hashlib
+import os
+
+import numpy as np
+
+from ekg_system.chunked import DEFAULT_CHUNK, LazyArray, iter_chunks
+from ekg_system.loaders import csv_cache_dir
+
+
+PYRAMID_VERSION = 1
+PYRAMID_SUFFIX = ".pyr.npz"
+
+
+def pyramid_path(recording_path):
+    """Where the pyramid of a recording is saved: the cache dir, never the data folder."""
+    key = hashlib.sha1(os.path.abspath(recording_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(csv_cache_dir(), "pyramid", key + PYRAMID_SUFFIX)
+
+
+def first_lead(signal):
+    """Lead 0 of (n_samples, n_leads) data as a view (nothing is read); 1-D passes through."""
+    if signal.ndim == 1:
+        return signal
+    if isinstance(signal, LazyArray):
+        return LazyArray(signal.base[:, 0], signal.scale, signal.dtype)
+    return signal[:, 0]
+
+
+def file_stamp(path):
+    """Identifies one version of a file (size + mtime), to validate a saved pyramid."""
+    st = os.stat(path)
+    return f"{st.st_size}|{st.st_mtime_ns}|{PYRAMID_VERSION}"
+
+
+class MinMaxPyramid:
+    """
+    levels[k] = (mins, maxs) over blocks of base * factor**k samples,
+    stored as float32 (about 1/4 of the signal's size for all levels).
+    The signal itself is only read again for zoomed-in raw views.
+    """
+
+    def __init__(self, signal, levels, base=16, factor=2):
+        self.signal = first_lead(signal)
+        self.levels = levels
+        self.base = base
+        self.factor = factor
+
+    def __len__(self):
+        return len(self.signal)
+
+    def block_size(self, level):
+        return self.base * self.factor ** level
+
+    @property
+    def min(self):
+        return float(self.levels[-1][0].min()) if len(self.signal) else 0.0
+
+    @property
+    def max(self):
+        return float(self.levels[-1][1].max()) if len(self.signal) else 0.0
+
+    @classmethod
+    def build(cls, signal, base=16, factor=2, top_blocks=512, chunk=DEFAULT_CHUNK, cancel=None):
+        """
+        Build from a signal (array, memmap or LazyArray), one chunk at a
+        time. Multi-lead data is drawn from lead 0. cancel.check() runs
+        before every chunk.
+        """
+        signal = first_lead(signal)
+        n = len(signal)
+        n_blocks = -(-n // base)
+        mins = np.empty(n_blocks, dtype=np.float32)
+        maxs = np.empty(n_blocks, dtype=np.float32)
+
+        # chunks start on block boundaries so no block is split
+        chunk = max(base, chunk - chunk % base)
+        for start, stop in iter_chunks(n, chunk, cancel):
+            x = np.asarray(signal[start:stop], dtype=float)
+            edges = np.arange(0, len(x), base)
+            b = start // base
+            mins[b:b + len(edges)] = np.minimum.reduceat(x, edges)
+            maxs[b:b + len(edges)] = np.maximum.reduceat(x, edges)
+
+        levels = [(mins, maxs)]
+        while len(levels[-1][0]) > top_blocks:
+            lo, hi = levels[-1]
+            edges = np.arange(0, len(lo), factor)
+            levels.append((np.minimum.reduceat(lo, edges), np.maximum.reduceat(hi, edges)))
+
+        return cls(signal, levels, base, factor)
+
+    def view(self, start, stop, pixels):
+        """
+        Samples start..stop (floats are fine) for a plot `pixels` wide.
+        Returns (x in samples, y): raw samples when there are at most
+        base per pixel, otherwise one (min, max) pair per block of the
+        level closest to one block per pixel.
+        """
+        n = len(self.signal)
+        pixels = max(1, int(pixels))
+        start = max(0, int(np.floor(start)))
+        stop = min(n, int(np.ceil(stop)) + 1)
+        if stop <= start:
+            return np.empty(0), np.empty(0)
+
+        span = stop - start
+        if span <= pixels * self.base:
+            return np.arange(start, stop, dtype=float), np.asarray(self.signal[start:stop], dtype=float)
+
+        per_pixel = span / pixels
+        level = 0
+        while level < len(self.levels) - 1 and self.block_size(level) < per_pixel:
+            level += 1
+
+        size = self.block_size(level)
+        lo, hi = self.levels[level]
+        b0 = start // size
+        b1 = min(len(lo), -(-stop // size))
+
+        centers = (np.arange(b0, b1) * size + size / 2).clip(0, n - 1)
+        x = np.repeat(centers, 2)
+        y = np.empty(2 * (b1 - b0))
+        y[0::2] = lo[b0:b1]
+        y[1::2] = hi[b0:b1]
+        return x, y
+
+    def save(self, path, stamp=""):
+        """Write the levels to an .npz (atomically); stamp identifies the source."""
+        arrays = {"meta": np.array([len(self.signal), self.base, self.factor], dtype=np.int64),
+                  "stamp": np.array(stamp)}
+        for k, (lo, hi) in enumerate(self.levels):
+            arrays[f"min{k}"] = lo
+            arrays[f"max{k}"] = hi
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, signal, stamp=""):
+        """A saved pyramid for this signal, or None if missing or out of date."""
+        try:
+            with np.load(path) as data:
+                n, base, factor = (int(v) for v in data["meta"])
+                if n != len(signal) or str(data["stamp"]) != stamp:
+                    return None
+
+                levels = []
+                while f"min{len(levels)}" in data:
+                    k = len(levels)
+                    levels.append((data[f"min{k}"], data[f"max{k}"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return cls(signal, levels, base, factor) if levels else None
+
+
+def load_or_build(signal, recording_path=None, persist=True, cancel=None):
+    """
+    Pyramid for a recording's signal: the one saved in the cache dir when
+    it is still valid, otherwise built (and saved when persist=True).
+    """
+    if recording_path is None:
+        return MinMaxPyramid.build(signal, cancel=cancel)
+
+    path = pyramid_path(recording_path)
+    stamp = file_stamp(recording_path)
+
+    pyramid = MinMaxPyramid.load(path, signal, stamp)
+    if pyramid is not None:
+        return pyramid
+
+    pyramid = MinMaxPyramid.build(signal, cancel=cancel)
+    if persist:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pyramid.save(path, stamp)
+        except OSError:
+            pass  # no writable cache dir, just rebuild next time
+
+    return pyramid
@@ -0,0 +1,204 @@
+# On-disk cache of finished analyses (filtered signal, R-peaks, report),
+# so re-analyzing or reopening a recording with the same settings is a
+# lookup instead of a full filter/detect/report pass.
+#
+# Entries are keyed by a hash of the signal samples plus every setting
+# that changes the result, and live next to the CSV sidecars:
+#
+#   <cache dir>/results/<key>/
+#       filtered.npy   float64, memory-mapped on load
+#       peaks.npy      R-peak sample indices
+#       events.npy     rhythm event table (arrhythmia_detector.EVENT_DTYPE)
+#       waveforms.npy  per-beat WAVEFORM_TYPES codes
+#       report.json    the scalar part of generate_report's result, plus
+#                      the sampling rate the event descriptions need
+#
+# The cache is bounded in bytes; the least recently used entries (by the
+# mtime of report.json, touched on every hit) are evicted first.
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from ekg_system.arrhythmia_detector import EventDetails, WaveformDetails
+from ekg_system.chunked import iter_chunks
+from ekg_system.loaders import csv_cache_dir
+
+
+# bump when filtering/detection/report logic changes what gets stored
+RESULT_CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GB
+
+# report entries rebuilt from the .npy files instead of report.json
+_ARRAY_KEYS = ("arrhythmia_events", "arrhythmia_details", "waveform_codes", "waveform_details")
+
+
+def signal_digest(signal, chunk=1 << 20, cancel=None):
+    """Content hash of a signal's samples (and shape), read chunk by chunk."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(tuple(signal.shape)).encode("ascii"))
+
+    for start, stop in iter_chunks(len(signal), chunk, cancel):
+        block = np.ascontiguousarray(signal[start:stop], dtype=np.float64)
+        h.update(block.tobytes())
+
+    return h.hexdigest()
+
+
+def analysis_params(processor, detector, lowcut=1.0, highcut=100.0, order=4,
+                    height_factor=1.2, distance_ms=80):
+    """Every setting that changes an analysis result, as a plain dict."""
+    return {
+        "version": RESULT_CACHE_VERSION,
+        "fs": float(processor.sampling_rate),
+        "lowcut": float(lowcut),
+        "highcut": float(highcut),
+        "order": int(order),
+        "height_factor": float(height_factor),
+        "distance_ms": float(distance_ms),
+        "tachycardia_threshold": float(detector.tachycardia_threshold),
+        "bradycardia_threshold": float(detector.bradycardia_threshold),
+        "detector_fs": float(detector.sampling_rate),
+    }
+
+
+def _to_json(obj):
+    if isinstance(obj, dict):
+        return {str(k): _to_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_json(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _dir_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False):
+            total += entry.stat().st_size
+    return total
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of analysis results.
+
+        cache = ResultCache()
+        key = cache.key(signal_digest(raw), analysis_params(proc, det))
+        hit = cache.get(key)        # (filtered, peaks, report) or None
+        cache.put(key, filtered, peaks, report, sampling_rate=1000)
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or os.path.join(csv_cache_dir(), "results")
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(digest, params):
+        blob = json.dumps(params, sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(digest.encode("ascii") + blob, digest_size=16).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """(filtered, peaks, report) for a key, or None. filtered is memory-mapped."""
+        folder = self._entry(key)
+        report_path = os.path.join(folder, "report.json")
+
+        try:
+            with open(report_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+
+            filtered = np.load(os.path.join(folder, "filtered.npy"), mmap_mode="r")
+            peaks = np.load(os.path.join(folder, "peaks.npy"))
+            events = np.load(os.path.join(folder, "events.npy"))
+            codes = np.load(os.path.join(folder, "waveforms.npy"))
+
+            os.utime(report_path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+
+        report = stored["report"]
+        report["arrhythmia_events"] = events
+        report["arrhythmia_details"] = EventDetails(events, stored["sampling_rate"])
+        report["waveform_codes"] = codes
+        report["waveform_details"] = WaveformDetails(codes)
+
+        return filtered, peaks, report
+
+    def put(self, key, filtered, peaks, report, sampling_rate):
+        """Store one analysis, then evict old entries down to max_bytes."""
+        os.makedirs(self.root, exist_ok=True)
+        folder = self._entry(key)
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+
+        try:
+            os.makedirs(tmp)
+
+            # copied chunk by chunk, filtered may itself be an on-disk array
+            out = np.lib.format.open_memmap(
+                os.path.join(tmp, "filtered.npy"), mode="w+", dtype=np.float64, shape=filtered.shape
+            )
+            for start, stop in iter_chunks(len(filtered)):
+                out[start:stop] = filtered[start:stop]
+            out.flush()
+            del out
+
+            np.save(os.path.join(tmp, "peaks.npy"), np.asarray(peaks, dtype=np.int64))
+            np.save(os.path.join(tmp, "events.npy"), report["arrhythmia_events"])
+            np.save(os.path.join(tmp, "waveforms.npy"), report["waveform_codes"])
+
+            scalars = {k: v for k, v in report.items() if k not in _ARRAY_KEYS}
+            with open(os.path.join(tmp, "report.json"), "w", encoding="utf-8") as f:
+                json.dump(_to_json({"sampling_rate": sampling_rate, "report": scalars}), f)
+
+            if os.path.exists(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+            os.replace(tmp, folder)
+
+        except OSError:
+            # a full or read-only disk only costs us the speedup
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+
+        self.evict(keep=key)
+        return True
+
+    def entries(self):
+        """(last used, size, key) of every complete entry, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+
+        found = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name.startswith(".tmp-"):
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, "report.json")).st_mtime
+                found.append((used, _dir_size(entry.path), entry.name))
+            except OSError:
+                continue
+
+        return sorted(found)
+
+    def evict(self, keep=None):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
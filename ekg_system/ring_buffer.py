@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity circular buffer for several channels of samples.
+
+    Storage is one (n_channels, 2 * capacity) array. Every sample is
+    written twice, at its slot and at slot + capacity, so the most recent
+    `capacity` samples are always one contiguous slice. That keeps appends
+    O(block) and lets latest() return views instead of copies.
+
+        buf = RingBuffer(10000, n_channels=3)
+        buf.append(sample_ids, ch1, ch2)
+        sid, ch1, ch2 = buf.latest()
+    """
+
+    def __init__(self, capacity, n_channels=1, dtype=float):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+
+        self.capacity = int(capacity)
+        self.n_channels = int(n_channels)
+        self._data = np.zeros((self.n_channels, 2 * self.capacity), dtype=dtype)
+        self._head = 0  # next write slot, always in [0, capacity)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def append(self, *columns):
+        """Append one block; pass one equal-length 1-D array per channel."""
+        if len(columns) != self.n_channels:
+            raise ValueError(
+                f"Expected {self.n_channels} columns, got {len(columns)}"
+            )
+
+        block = np.asarray(columns, dtype=self._data.dtype)
+        if block.ndim == 1:
+            block = block[:, None]
+
+        n = block.shape[1]
+        if n == 0:
+            return
+
+        # only the tail of an oversized block can survive
+        if n > self.capacity:
+            block = block[:, -self.capacity:]
+            n = self.capacity
+
+        cap = self.capacity
+        head = self._head
+        first = min(n, cap - head)
+        rest = n - first
+
+        self._data[:, head:head + first] = block[:, :first]
+        self._data[:, head + cap:head + cap + first] = block[:, :first]
+
+        if rest:
+            self._data[:, :rest] = block[:, first:]
+            self._data[:, cap:cap + rest] = block[:, first:]
+
+        self._head = (head + n) % cap
+        self._size = min(self._size + n, cap)
+
+    def latest(self, n=None):
+        """
+        Return the most recent n samples (all held samples by default) as
+        an (n_channels, n) view. The view is only valid until the next
+        append, copy it if it needs to outlive that.
+        """
+        if n is None or n > self._size:
+            n = self._size
+
+        end = self._head + self.capacity
+        return self._data[:, end - n:end]
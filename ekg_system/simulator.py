@@ -0,0 +1,412 @@
+# MSP430 stand-in for working without the board: turns a recording or a
+# synthetic mouse ECG into the same A5 5A 12-byte packets the firmware
+# sends, and serves them either in-process (FakeSerial, plugged into
+# MSP430Interface through serial_factory) or on a pseudo-terminal that
+# pyserial, and so the whole UI, can open like a real port.
+#
+#     python -m ekg_system.simulator ekg_system/lab_data/ECE.csv --loop
+#     EKG_PORT=/dev/pts/7 python ui_main.py      # port printed above
+#
+# Streams can be played at real time or N x speed and can have faults
+# injected: corrupted bytes, dropped sample_ids and bursty delivery.
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from ekg_system.microcontroller import MSP430Interface
+
+
+CODE_MIN = -(1 << 23)
+CODE_MAX = (1 << 23) - 1
+
+
+def mv_to_code(mv):
+    """Millivolts to ADS1292R codes, the inverse of MSP430Interface.code_to_mv."""
+    m = MSP430Interface
+    codes = np.rint(np.asarray(mv, dtype=float) * (m.GAIN * m.FS) / (1000.0 * m.VREF))
+    return np.clip(codes, CODE_MIN, CODE_MAX).astype(np.int32)
+
+
+def _be24(codes):
+    v = np.asarray(codes, dtype=np.int64) & 0xFFFFFF
+    return np.stack([(v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF], axis=1).astype(np.uint8)
+
+
+def encode_packets(sample_ids, ch1, ch2):
+    """Packets for arrays of sample ids and ch1/ch2 ADC codes, as bytes."""
+    pkts = np.empty(len(sample_ids), dtype=MSP430Interface.PACKET_DTYPE)
+    pkts["sync"] = 0xA55A
+    pkts["sample_id"] = np.asarray(sample_ids, dtype=np.uint64) & 0xFFFFFFFF
+    pkts["ch1"] = _be24(ch1)
+    pkts["ch2"] = _be24(ch2)
+    return pkts.tobytes()
+
+
+def synthetic_ecg(fs=1000, seconds=10.0, hr_bpm=500.0, amplitude_mv=1.0,
+                  noise_mv=0.02, hr_jitter=0.02, seed=None):
+    """
+    Mouse-like ECG in mV: P, QRS and T waves as Gaussian bumps at hr_bpm
+    with a little beat-to-beat jitter and white noise. Returns
+    (signal, r_peak_indices) so detection can be checked against it.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * fs)
+    t = np.arange(n) / fs
+
+    rr = 60.0 / hr_bpm
+    beats = []
+    beat = rr / 2
+    while beat < seconds:
+        beats.append(beat)
+        beat += rr * (1.0 + hr_jitter * rng.standard_normal())
+    beats = np.array(beats)
+
+    # (offset s, width s, height) of each wave relative to the R peak
+    waves = [(-0.025, 0.004, 0.12), (-0.003, 0.002, -0.15), (0.0, 0.0025, 1.0),
+             (0.004, 0.002, -0.3), (0.030, 0.008, 0.2)]
+
+    signal = np.zeros(n)
+    for offset, width, height in waves:
+        centers = beats + offset
+        # each bump only touches +-5 widths around its center
+        half = int(5 * width * fs) + 1
+        idx = np.rint(centers * fs).astype(np.int64)[:, None] + np.arange(-half, half + 1)
+        valid = (idx >= 0) & (idx < n)
+        shape = height * np.exp(-0.5 * ((t[np.clip(idx, 0, n - 1)] - centers[:, None]) / width) ** 2)
+        np.add.at(signal, idx[valid], shape[valid])
+
+    signal = amplitude_mv * signal + noise_mv * rng.standard_normal(n)
+    return signal, np.rint(beats * fs).astype(np.int64)
+
+
+def load_recording(path, fs=1000):
+    """A recording file as (ch1, ch2) in mV; single-lead files repeat ch1."""
+    from ekg_system.processor import EKGProcessor
+
+    processor = EKGProcessor(sampling_rate=fs)
+    processor.load_data(path, multichannel=True)
+    data = np.asarray(processor.raw_data, dtype=float)
+
+    if data.ndim == 1:
+        return data, data
+    return data[:, 0], data[:, 1] if data.shape[1] > 1 else data[:, 0]
+
+
+class PacketStream:
+    """
+    A recording as timed chunks of packet bytes, see chunks().
+
+    Faults (all off by default, `seed` makes them repeatable):
+      drop_rate     fraction of samples never sent (gaps in sample_id)
+      corrupt_rate  fraction of packets with one random byte overwritten
+      burst_ms      hold data back and deliver it in bursts this far apart
+                    instead of every block_ms (USB / scheduler hiccups)
+
+    sent / dropped / corrupted count what was actually produced.
+    """
+
+    def __init__(self, ch1_mv, ch2_mv=None, fs=1000, block_ms=10, loop=False,
+                 drop_rate=0.0, corrupt_rate=0.0, burst_ms=0, seed=None, start_id=0):
+        self.ch1 = mv_to_code(ch1_mv)
+        self.ch2 = mv_to_code(ch1_mv if ch2_mv is None else ch2_mv)
+        if len(self.ch1) != len(self.ch2):
+            raise ValueError("ch1 and ch2 must have the same length")
+
+        self.fs = fs
+        self.block = max(1, int(fs * block_ms / 1000))
+        self.loop = loop
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.burst_ms = burst_ms
+        self.seed = seed
+        self.start_id = start_id
+
+        self.sent = 0
+        self.dropped = 0
+        self.corrupted = 0
+
+    @classmethod
+    def synthetic(cls, seconds=60.0, fs=1000, hr_bpm=500.0, seed=None, **kwargs):
+        signal, _ = synthetic_ecg(fs, seconds, hr_bpm, seed=seed)
+        return cls(signal, 0.5 * signal, fs=fs, seed=seed, **kwargs)
+
+    @classmethod
+    def from_file(cls, path, fs=1000, **kwargs):
+        ch1, ch2 = load_recording(path, fs)
+        return cls(ch1, ch2, fs=fs, **kwargs)
+
+    def _blocks(self, rng):
+        n = len(self.ch1)
+        sid = self.start_id
+        t = 0
+
+        while True:
+            for start in range(0, n, self.block):
+                stop = min(n, start + self.block)
+                sids = sid + np.arange(stop - start)
+                sid += stop - start
+                t += stop - start
+
+                keep = slice(None)
+                if self.drop_rate:
+                    keep = rng.random(len(sids)) >= self.drop_rate
+                    self.dropped += int(len(sids) - keep.sum())
+
+                data = encode_packets(sids[keep], self.ch1[start:stop][keep], self.ch2[start:stop][keep])
+                if self.corrupt_rate and data:
+                    data = self._corrupt(data, rng)
+
+                self.sent += len(data) // MSP430Interface.PACKET_LEN
+                yield t / self.fs, data
+
+            if not self.loop:
+                return
+
+    def _corrupt(self, data, rng):
+        raw = np.frombuffer(data, dtype=np.uint8).copy().reshape(-1, MSP430Interface.PACKET_LEN)
+        hit = np.flatnonzero(rng.random(len(raw)) < self.corrupt_rate)
+        if len(hit):
+            raw[hit, rng.integers(0, MSP430Interface.PACKET_LEN, len(hit))] = rng.integers(0, 256, len(hit))
+            self.corrupted += len(hit)
+        return raw.tobytes()
+
+    def chunks(self):
+        """Yield (stream time in s at which the bytes are due, bytes)."""
+        rng = np.random.default_rng(self.seed)
+
+        if not self.burst_ms:
+            yield from self._blocks(rng)
+            return
+
+        pending = []
+        released = 0.0
+        for t, data in self._blocks(rng):
+            pending.append(data)
+            if t - released >= self.burst_ms / 1000.0:
+                yield t, b"".join(pending)
+                pending = []
+                released = t
+
+        if pending:
+            yield t, b"".join(pending)
+
+
+class _Clock:
+    # stream time -> wall time at `speed` x real time (speed <= 0: no waiting)
+    def __init__(self, speed):
+        self.speed = speed
+        self.t0 = time.monotonic()
+
+    def now(self):
+        if self.speed <= 0:
+            return float("inf")
+        return (time.monotonic() - self.t0) * self.speed
+
+    def wait_for(self, t, limit):
+        if self.speed <= 0:
+            return
+        delay = min(limit, t / self.speed - (time.monotonic() - self.t0))
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeSerial:
+    """
+    The bits of serial.Serial that MSP430Interface uses (read, is_open,
+    in_waiting, reset_input_buffer, close), fed from a PacketStream at
+    `speed` x real time, so the interface's reader thread, decoder and
+    callbacks run exactly as with the board.
+    """
+
+    def __init__(self, stream, speed=1.0, timeout=1.0):
+        self.stream = stream
+        self.timeout = timeout
+        self.is_open = True
+
+        self._chunks = stream.chunks()
+        self._next = None
+        self._done = False
+        self._buf = bytearray()
+        self._clock = _Clock(speed)
+
+    @classmethod
+    def factory(cls, stream, speed=1.0):
+        """serial_factory for MSP430Interface: every open starts the stream over."""
+        def open_port(port, baudrate=115200, timeout=1.0):
+            return cls(stream, speed=speed, timeout=timeout)
+        return open_port
+
+    def _pull(self, size=None):
+        # move due chunks into the buffer, stopping once it holds `size`
+        # bytes. With no waiting (speed <= 0) everything is due, so
+        # without a limit a looping stream would never end; there only
+        # what is asked for (at least one chunk) is generated
+        now = self._clock.now()
+        if size is None and self._clock.speed <= 0:
+            size = 1
+
+        while not self._done:
+            if size is not None and len(self._buf) >= size:
+                break
+            if self._next is None:
+                self._next = next(self._chunks, None)
+                if self._next is None:
+                    self._done = True
+                    break
+
+            t, data = self._next
+            if t > now:
+                break
+            self._buf.extend(data)
+            self._next = None
+
+    @property
+    def in_waiting(self):
+        self._pull()
+        return len(self._buf)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+
+        while self.is_open:
+            self._pull(size)
+            left = deadline - time.monotonic()
+            if self._buf or self._done or left <= 0:
+                break
+            self._clock.wait_for(self._next[0], left)
+
+        out = bytes(self._buf[:size])
+        del self._buf[:size]
+        return out
+
+    def reset_input_buffer(self):
+        # only drops what was already delivered, so an as-fast-as-possible
+        # stream is not thrown away whole
+        self._buf.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def simulated_interface(stream, speed=1.0, **kwargs):
+    """MSP430Interface reading from a PacketStream instead of a serial port."""
+    return MSP430Interface(serial_factory=FakeSerial.factory(stream, speed), port="sim://", **kwargs)
+
+
+class PtyStreamer:
+    """
+    Plays a PacketStream into a pseudo-terminal (Linux/macOS); `port` is
+    the device path to give pyserial, e.g. via EKG_PORT. Like a real
+    device, bytes nobody reads in time are dropped once the tty buffer
+    is full (counted in `overflowed`).
+    """
+
+    def __init__(self, stream, speed=1.0):
+        self.stream = stream
+        self.speed = speed
+        self.port = None
+        self.overflowed = 0
+
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        import pty
+        import tty
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def _run(self):
+        clock = _Clock(self.speed)
+
+        for t, data in self.stream.chunks():
+            while self._running and t > clock.now():
+                clock.wait_for(t, 0.1)
+            if not self._running:
+                break
+
+            try:
+                written = os.write(self._master, data)
+            except (BlockingIOError, OSError):
+                written = 0
+            self.overflowed += len(data) - written
+
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ekg_system.simulator",
+        description="Stream a recording or a synthetic ECG as MSP430 packets on a pseudo-terminal.",
+    )
+    parser.add_argument("recording", nargs="?", help=".csv/.txt/.npy/.ekgb file (default: synthetic ECG)")
+    parser.add_argument("--fs", type=float, default=1000, help="sampling rate in Hz (default: %(default)s)")
+    parser.add_argument("--hr", type=float, default=500, help="synthetic heart rate in BPM (default: %(default)s)")
+    parser.add_argument("--seconds", type=float, default=60, help="synthetic signal length (default: %(default)s)")
+    parser.add_argument("--speed", type=float, default=1.0, help="x real time, 0 = as fast as possible (default: %(default)s)")
+    parser.add_argument("--loop", action="store_true", help="start over at the end")
+    parser.add_argument("--block-ms", type=float, default=10, help="packet batch size (default: %(default)s)")
+    parser.add_argument("--drop", type=float, default=0.0, help="fraction of samples to drop")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of packets to corrupt")
+    parser.add_argument("--burst-ms", type=float, default=0, help="deliver in bursts this far apart")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for noise and faults")
+    args = parser.parse_args(argv)
+
+    options = dict(block_ms=args.block_ms, loop=args.loop, drop_rate=args.drop,
+                   corrupt_rate=args.corrupt, burst_ms=args.burst_ms, seed=args.seed)
+    if args.recording:
+        stream = PacketStream.from_file(args.recording, fs=args.fs, **options)
+    else:
+        stream = PacketStream.synthetic(args.seconds, fs=args.fs, hr_bpm=args.hr, **options)
+
+    streamer = PtyStreamer(stream, speed=args.speed)
+    port = streamer.start()
+    print(f"Streaming on {port}  (EKG_PORT={port} python ui_main.py), Ctrl-C to stop", flush=True)
+
+    try:
+        while streamer.running:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        streamer.stop()
+
+    print(f"{stream.sent} packets sent, {stream.dropped} samples dropped, "
+          f"{stream.corrupted} packets corrupted, {streamer.overflowed} bytes overflowed",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
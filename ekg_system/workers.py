@@ -0,0 +1,170 @@
+# Background jobs for the desktop UI: load / filter / detect / report run
+# on a QThreadPool thread, and progress and results come back to the GUI
+# thread as Qt signals, so the window stays responsive on long files.
+
+import threading
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+class Cancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+
+class CancelToken:
+    """
+    Cooperative cancel flag shared between the GUI and one job. The job
+    checks it between stages, and every stage gets it to pass on to the
+    chunked loops (processor, pyramid, pipeline), which check it before
+    each chunk.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+
+class WorkerSignals(QObject):
+    # every signal carries the job id so stale jobs can be told apart
+    progress = Signal(int, int, str)     # job id, percent, stage label
+    finished = Signal(int, object)       # job id, state dict
+    failed = Signal(int, str)            # job id, error message
+    cancelled = Signal(int)              # job id
+
+
+class StageJob(QRunnable):
+    """
+    Runs a list of (label, fn) stages in order on a pool thread. Each fn
+    is called as fn(state, token): it stores its results in the shared
+    state dict (what `finished` delivers) and hands the CancelToken to
+    anything long it runs.
+    """
+
+    def __init__(self, job_id, stages, token):
+        super().__init__()
+        self.job_id = job_id
+        self.stages = stages
+        self.token = token
+        self.signals = WorkerSignals()
+
+    def run(self):
+        state = {}
+        n = len(self.stages)
+
+        try:
+            for i, (label, fn) in enumerate(self.stages):
+                self.token.check()
+                self.signals.progress.emit(self.job_id, int(100 * i / n), label)
+                fn(state, self.token)
+            self.token.check()
+
+        except Cancelled:
+            self.signals.cancelled.emit(self.job_id)
+            return
+
+        except Exception as err:
+            self.signals.failed.emit(self.job_id, str(err))
+            return
+
+        self.signals.progress.emit(self.job_id, 100, "Done")
+        self.signals.finished.emit(self.job_id, state)
+
+
+class JobRunner(QObject):
+    """
+    Runs one StageJob at a time for a widget. Starting a job cancels the
+    one before it; anything the old job still emits after that is
+    dropped, so only the newest job ever reaches the UI. An old job stops
+    at its next chunk or stage boundary, in the background.
+
+        self.jobs = JobRunner(self)
+        self.jobs.progress.connect(self.show_progress)
+        self.jobs.start([("Loading", load), ("Filtering", filt)], self.on_loaded)
+    """
+
+    progress = Signal(int, str)     # percent, stage label
+    failed = Signal(str)
+    cancelled = Signal()
+    busy_changed = Signal(bool)
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+
+        self._job_id = 0
+        self._token = None
+        self._on_finished = None
+        # jobs still running, kept alive until their last signal arrives
+        self._jobs = {}
+
+    @property
+    def busy(self):
+        return self._token is not None
+
+    def start(self, stages, on_finished):
+        """Cancel the current job and run `stages`; on_finished(state) on success."""
+        self.cancel()
+
+        self._job_id += 1
+        self._token = CancelToken()
+        self._on_finished = on_finished
+
+        job = StageJob(self._job_id, stages, self._token)
+        job.signals.progress.connect(self._progress)
+        job.signals.finished.connect(self._finished)
+        job.signals.failed.connect(self._failed)
+        job.signals.cancelled.connect(self._cancelled)
+        self._jobs[self._job_id] = job
+
+        self.busy_changed.emit(True)
+        self.pool.start(job)
+        return self._token
+
+    def cancel(self):
+        """Ask the current job to stop; the UI forgets it right away."""
+        if self._token is None:
+            return
+
+        self._token.cancel()
+        self._token = None
+        self._on_finished = None
+        self.busy_changed.emit(False)
+        self.cancelled.emit()
+
+    def _current(self, job_id):
+        return job_id == self._job_id and self._token is not None
+
+    def _done(self, job_id):
+        self._jobs.pop(job_id, None)
+        if job_id == self._job_id and self._token is not None:
+            self._token = None
+            self.busy_changed.emit(False)
+
+    def _progress(self, job_id, percent, label):
+        if self._current(job_id):
+            self.progress.emit(percent, label)
+
+    def _finished(self, job_id, state):
+        callback = self._on_finished if self._current(job_id) else None
+        self._done(job_id)
+        if callback is not None:
+            callback(state)
+
+    def _failed(self, job_id, message):
+        current = self._current(job_id)
+        self._done(job_id)
+        if current:
+            self.failed.emit(message)
+
+    def _cancelled(self, job_id):
+        self._done(job_id)
@@ -1,52 +1,16 @@
 import numpy as np
 from ekg_system.processor import EKGProcessor  # adjust if your path is different
+from ekg_system.loaders import read_txt_samples
+from ekg_system import evaluation
 
 
 def load_ground_truth_peaks(path):
-    peaks = []
-    data_started = False
-    dash_count = 0
-
-    with open(path, "r") as f:
-        for line in f:
-            s = line.strip()
-            if not s:
-                continue
-
-            if s == "---":
-                dash_count += 1
-                if dash_count >= 2:
-                    data_started = True
-                continue
-
-            if not data_started:
-                continue
-
-            try:
-                peaks.append(int(s))
-            except:
-                continue
-
-    return np.array(peaks)
+    return read_txt_samples(path, dtype=int)
 
 
 def match_peaks(detected, truth, tolerance=10):
-    detected = list(detected)
-    truth = list(truth)
-
-    matched = 0
-    used = set()
-
-    for t in truth:
-        for i, d in enumerate(detected):
-            if i in used:
-                continue
-            if abs(d - t) <= tolerance:
-                matched += 1
-                used.add(i)
-                break
-
-    return matched
+    matched, _ = evaluation.match_peaks(detected, truth, tolerance)
+    return len(matched)
 
 
 def main():
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    # one offscreen QApplication for every widget test
+    pytest.importorskip("PySide6")
+    pytest.importorskip("pyqtgraph")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def live_view(qapp, monkeypatch):
+    # a LivePGView without the port watcher thread
+    from ekg_system import discovery
+    from ekg_system.live_pg_view import LivePGView
+
+    monkeypatch.setattr(discovery.PortWatcher, "start", lambda self: None)
+    view = LivePGView()
+    view.plot_timer.stop()
+    yield view
+    view.deleteLater()
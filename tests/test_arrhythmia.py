@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from ekg_system.arrhythmia_detector import WAVEFORM_TYPES, ArrhythmiaDetector, ArrhythmiaType
+from ekg_system.processor import EKGProcessor
+
+
+def steady_rr(n, rr=120.0, jitter=1.0, seed=0):
+    return rr + np.random.default_rng(seed).uniform(-jitter, jitter, n)
+
+
+def test_streaming_stats_are_the_rolling_window():
+    analyzer = ArrhythmiaDetector(1000).streaming(window=16)
+    rr = steady_rr(200, jitter=20)
+    for i, r in enumerate(rr):
+        analyzer.add(r)
+        window = rr[max(0, i - 15):i + 1]
+        mean, std = analyzer.stats()
+        assert mean == pytest.approx(window.mean(), abs=1e-9)
+        assert std == pytest.approx(window.std(), abs=1e-6)
+
+
+def test_streaming_pause_and_premature_beat():
+    rr = steady_rr(40)
+    rr[20] = 250.0               # pause
+    rr[30], rr[31] = 70.0, 170.0  # early beat, then the compensatory pause
+
+    analyzer = ArrhythmiaDetector(1000).streaming()
+    by_beat = {}
+    for i, r in enumerate(rr):
+        for arr_type, beat, _ in analyzer.add(r):
+            by_beat.setdefault(beat, set()).add(arr_type)
+            if arr_type == ArrhythmiaType.PREMATURE_BEAT:
+                assert i == beat + 1  # reported once the pause is seen
+
+    assert ArrhythmiaType.PAUSE in by_beat[20]
+    assert ArrhythmiaType.BRADYCARDIA in by_beat[20]
+    assert ArrhythmiaType.PREMATURE_BEAT in by_beat[30]
+    assert all(not by_beat.get(i) for i in range(20) if i != 20)
+
+
+def test_streaming_from_peaks_matches_rr():
+    rr = steady_rr(50, jitter=30, seed=1)
+    peaks = np.concatenate([[0], np.cumsum(rr)])
+
+    a = ArrhythmiaDetector(1000).streaming().add_many(rr)
+    b = ArrhythmiaDetector(1000).streaming().add_peaks(peaks)
+    assert [(t, beat) for t, beat, _ in a] == [(t, beat) for t, beat, _ in b]
+
+
+def naive_rhythm(detector, rr):
+    # the old per-beat loop, rule by rule for each beat
+    rr = np.asarray(rr, dtype=float)
+    mean, std = rr.mean(), rr.std()
+    events = []
+    for i, r in enumerate(rr):
+        hr = 60.0 * detector.sampling_rate / r
+        if hr > detector.tachycardia_threshold:
+            events.append((ArrhythmiaType.TACHYCARDIA, i))
+        elif hr < detector.bradycardia_threshold:
+            events.append((ArrhythmiaType.BRADYCARDIA, i))
+        if abs(r - mean) > 2 * std:
+            events.append((ArrhythmiaType.IRREGULAR, i))
+        if i + 1 < len(rr) and r < 0.7 * mean and rr[i + 1] > 1.3 * mean:
+            events.append((ArrhythmiaType.PREMATURE_BEAT, i))
+        if r > 1.5 * mean:
+            events.append((ArrhythmiaType.PAUSE, i))
+    return events
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_rhythm_table_matches_per_beat_loop(seed):
+    rng = np.random.default_rng(seed)
+    rr = steady_rr(500, seed=seed)
+    rr[rng.choice(500, 20, replace=False)] *= rng.choice([0.5, 0.6, 1.4, 1.8], 20)
+
+    detector = ArrhythmiaDetector(1000)
+    events = detector.analyze_rhythm(rr)
+    assert [(t, beat) for t, beat, _ in events] == naive_rhythm(detector, rr)
+
+    table = detector.analyze_rhythm_table(rr)
+    assert len(table) == len(events)
+    assert np.all(np.diff(table["beat"]) >= 0)
+
+
+def test_rhythm_table_empty():
+    assert len(ArrhythmiaDetector(1000).analyze_rhythm_table([])) == 0
+
+
+@pytest.mark.parametrize("peak_idx", [5, 10, 50])
+def test_classify_waveforms_matches_per_beat(peak_idx):
+    rng = np.random.default_rng(peak_idx)
+    waves = [rng.normal(0, 1, n) + rng.uniform(-1, 1) for n in rng.integers(20, 200, 300)]
+
+    detector = ArrhythmiaDetector(1000)
+    codes = detector.classify_waveforms(waves, peak_idx)
+    expected = [detector.classify_waveform(w, peak_idx) for w in waves]
+    assert [WAVEFORM_TYPES[c] for c in codes] == expected
+
+
+def test_classify_segmented_matrix_matches_slices():
+    rng = np.random.default_rng(3)
+    processor = EKGProcessor(sampling_rate=1000)
+    processor.raw_data = rng.normal(0, 1, 5000)
+    processor.peaks = np.array([10, 500, 1200, 2500, 4000, 4960])
+
+    matrix = processor.segment_waveforms(window_before=20, window_after=100)
+    assert matrix.shape == (6, 120)
+    assert matrix.mask[0, :10].all() and not matrix.mask[0, 10:].any()
+    assert matrix.mask[-1, 60:].all() and not matrix.mask[-1, :60].any()
+
+    slices = [processor.raw_data[max(0, p - 20):p + 100] for p in processor.peaks]
+    for row, s in zip(matrix, slices):
+        np.testing.assert_array_equal(row.compressed(), s)
+
+    detector = ArrhythmiaDetector(1000)
+    np.testing.assert_array_equal(
+        detector.classify_waveforms(matrix, 15), detector.classify_waveforms(slices, 15)
+    )
+
+
+def test_streaming_constant_rhythm_after_a_change():
+    # the running sums cancel to a zero variance while rr - mean keeps
+    # a rounding error: no division by zero, no irregular beat
+    analyzer = ArrhythmiaDetector(1000).streaming(window=8)
+    analyzer.add(182.88851319050832)
+    events = analyzer.add_many([84.03026903665572] * 20)
+    assert analyzer.stats()[1] == 0.0
+    assert all(t != ArrhythmiaType.IRREGULAR for t, _, _ in events)
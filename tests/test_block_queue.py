@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ekg_system.block_queue import BlockQueue
+
+
+def block(start, n):
+    ids = np.arange(start, start + n)
+    return ids, -ids
+
+
+def queued_ids(q):
+    return np.concatenate([b[0] for b in q.drain()]).tolist()
+
+
+def test_drop_oldest_keeps_the_newest_samples():
+    q = BlockQueue(10, policy="drop_oldest")
+    for i in range(0, 16, 4):
+        q.put(*block(i, 4))
+
+    assert q.dropped_blocks == 2 and q.dropped_samples == 8
+    assert queued_ids(q) == list(range(8, 16))
+
+
+def test_drop_oldest_oversized_block_keeps_its_tail():
+    q = BlockQueue(10, policy="drop_oldest")
+    assert q.put(*block(0, 25)) == 15
+
+    sids, neg = q.get()
+    assert sids.tolist() == list(range(15, 25))
+    assert neg.tolist() == [-i for i in range(15, 25)]
+
+
+def test_drop_newest_keeps_what_is_queued():
+    q = BlockQueue(10, policy="drop_newest")
+    for i in range(0, 16, 4):
+        q.put(*block(i, 4))
+
+    assert q.dropped_blocks == 2 and q.dropped_samples == 8
+    assert queued_ids(q) == list(range(0, 8))
+
+
+def test_block_policy_waits_for_the_consumer():
+    q = BlockQueue(8, policy="block", put_timeout=2.0)
+    q.put(*block(0, 8))
+    threading.Timer(0.1, q.get).start()
+
+    t0 = time.monotonic()
+    assert q.put(*block(8, 4)) == 0
+    assert time.monotonic() - t0 >= 0.05
+    assert queued_ids(q) == list(range(8, 12))
+
+
+def test_block_policy_gives_up_after_timeout():
+    q = BlockQueue(8, policy="block", put_timeout=0.05)
+    q.put(*block(0, 8))
+
+    assert q.put(*block(8, 4)) == 4
+    assert q.dropped_samples == 4
+
+
+def test_counters_and_clear():
+    q = BlockQueue(100)
+    q.put(*block(0, 30))
+    q.put(*block(30, 50))
+    q.drain(max_samples=40)
+
+    stats = q.stats()
+    assert stats["samples_in"] == 80 and stats["samples_out"] == 30
+    assert stats["queued"] == 50 and stats["high_water"] == 80
+
+    q.clear()
+    assert len(q) == 0 and q.stats()["samples_in"] == 0
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        BlockQueue(0)
+    with pytest.raises(ValueError):
+        BlockQueue(10, policy="lifo")
@@ -0,0 +1,105 @@
+import time
+
+import numpy as np
+import pytest
+
+from ekg_system.capture import CaptureWriter, codes_to_mv, export_csv, read_capture
+from ekg_system.microcontroller import MSP430Interface
+from ekg_system.processor import EKGProcessor
+from ekg_system.simulator import PacketStream, simulated_interface
+
+
+def write_capture(path, blocks, fs=500):
+    writer = CaptureWriter(str(path), fs=fs, gain=6, vref=2.42)
+    writer.start()
+    for block in blocks:
+        writer.write(*block)
+    writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "c.ekgb"
+    rng = np.random.default_rng(0)
+    blocks = [
+        (np.arange(i, i + 100, dtype=np.uint32), rng.integers(-1000, 1000, 100), rng.integers(-1000, 1000, 100))
+        for i in range(0, 1000, 100)
+    ]
+    writer = write_capture(path, blocks)
+
+    for mmap in (False, True):
+        header, records = read_capture(str(path), mmap=mmap)
+        assert header["fs"] == 500
+        assert header["gain"] == 6
+        assert len(records) == writer.samples_written == 1000
+        np.testing.assert_array_equal(records["sample_id"], np.arange(1000))
+        np.testing.assert_array_equal(records["ch1"], np.concatenate([b[1] for b in blocks]))
+        np.testing.assert_array_equal(records["ch2"], np.concatenate([b[2] for b in blocks]))
+
+    csv_path = tmp_path / "c.csv"
+    export_csv(str(path), str(csv_path))
+    rows = np.loadtxt(csv_path, delimiter=",", skiprows=1)
+    np.testing.assert_allclose(rows[:, 1], codes_to_mv(records["ch1"], header), atol=1e-6)
+
+
+def test_partial_trailing_record_is_ignored(tmp_path):
+    path = tmp_path / "c.ekgb"
+    write_capture(path, [(np.arange(10), np.zeros(10), np.zeros(10))])
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    _, records = read_capture(str(path))
+    assert len(records) == 10
+
+
+def test_load_data_uses_the_capture_rate(tmp_path):
+    path = tmp_path / "c.ekgb"
+    write_capture(path, [(np.arange(10), np.arange(10), np.zeros(10))], fs=250)
+
+    processor = EKGProcessor(sampling_rate=1000)
+    processor.load_data(str(path))
+    assert processor.sampling_rate == 250
+    assert len(processor.raw_data) == 10
+
+
+def test_write_after_close_raises(tmp_path):
+    writer = write_capture(tmp_path / "c.ekgb", [])
+    with pytest.raises(RuntimeError):
+        writer.write(np.arange(3), np.zeros(3), np.zeros(3))
+
+
+def test_failed_writer_raises(tmp_path):
+    writer = CaptureWriter(str(tmp_path / "c.ekgb"), fs=1000, gain=6, vref=2.42)
+    writer.start()
+    writer.write(np.arange(3), np.zeros(3), np.zeros(3))
+    writer._f.close()  # the disk goes away under the writer thread
+    writer.close()
+
+    assert writer.error is not None
+    with pytest.raises(RuntimeError):
+        writer.write(np.arange(3), np.zeros(3), np.zeros(3))
+
+
+def test_stop_waits_for_the_reader(tmp_path):
+    # every block the reader handed out is in the capture once stop() returns
+    path = tmp_path / "c.ekgb"
+    writer = CaptureWriter(str(path), fs=1000, gain=MSP430Interface.GAIN, vref=MSP430Interface.VREF)
+    writer.start()
+    received = []
+
+    def on_block(sids, ch1, ch2, t_wall):
+        time.sleep(0.002)
+        writer.write(sids, ch1, ch2)
+        received.append(len(sids))
+
+    mcu = simulated_interface(PacketStream.synthetic(60, seed=1), speed=20)
+    mcu.start(batch_callback=on_block)
+    time.sleep(0.3)
+    mcu.stop()
+    writer.close()
+
+    assert not mcu.thread.is_alive()
+    assert writer.error is None
+    _, records = read_capture(str(path))
+    assert sum(received) > 0
+    assert len(records) == sum(received)
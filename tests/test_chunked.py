@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks, sosfiltfilt
+
+from ekg_system.chunked import (
+    LazyArray,
+    chunked_abs_percentile,
+    chunked_find_peaks,
+    chunked_sosfiltfilt,
+)
+from ekg_system.filters import design_filter
+from ekg_system.processor import EKGProcessor
+from ekg_system.simulator import synthetic_ecg
+
+
+@pytest.fixture(scope="module")
+def ecg():
+    signal, _ = synthetic_ecg(1000, 30, seed=4)
+    return signal
+
+
+@pytest.mark.parametrize("chunk", [777, 4096, 1 << 20])
+def test_sosfiltfilt_matches_single_pass(ecg, chunk):
+    sos = design_filter(1000, 1.0, 100.0)
+    expected = sosfiltfilt(sos, ecg)
+
+    out = chunked_sosfiltfilt(sos, LazyArray(ecg), chunk=chunk)
+    np.testing.assert_allclose(out, expected, rtol=0, atol=1e-9)
+
+
+def test_sosfiltfilt_two_leads(ecg):
+    sos = design_filter(1000, 1.0, 100.0)
+    x = np.column_stack([ecg, -0.5 * ecg])
+
+    out = chunked_sosfiltfilt(sos, x, chunk=1000)
+    np.testing.assert_allclose(out, sosfiltfilt(sos, x, axis=0), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("chunk", [500, 2048, 100000])
+def test_find_peaks_matches_single_pass(ecg, chunk):
+    envelope = np.abs(ecg)
+    height = envelope.mean() * 1.2
+    expected, _ = find_peaks(envelope, height=height, distance=80)
+
+    got = chunked_find_peaks(lambda lo, hi: envelope[lo:hi], len(envelope), height, 80, chunk=chunk)
+    np.testing.assert_array_equal(got, expected)
+
+
+@pytest.mark.parametrize("q", [0, 50, 99, 99.9, 100])
+def test_abs_percentile_is_exact(ecg, q):
+    assert chunked_abs_percentile(ecg, q, chunk=1000) == pytest.approx(np.percentile(np.abs(ecg), q), abs=1e-12)
+
+
+def test_memory_mapped_processing_matches_in_memory(ecg, tmp_path):
+    path = str(tmp_path / "ecg.npy")
+    np.save(path, ecg)
+
+    in_memory = EKGProcessor(sampling_rate=1000)
+    in_memory.load_data(path)
+    in_memory.filter_signal()
+
+    mapped = EKGProcessor(sampling_rate=1000, chunk_size=3000)
+    mapped.load_data(path, mmap=True)
+    mapped.filter_signal()
+
+    np.testing.assert_allclose(np.asarray(mapped.filtered_data), in_memory.filtered_data, atol=1e-9)
+    np.testing.assert_array_equal(mapped.detect_r_peaks(), in_memory.detect_r_peaks())
+
+
+@pytest.mark.parametrize("chunk", [9, 300, 777])
+def test_find_peaks_resolves_suppression_chains_across_chunks(chunk):
+    # rising peaks just under `distance` apart: every kept peak decides
+    # the next one, far past any fixed overlap
+    envelope = np.zeros(2000)
+    positions = np.arange(200, 1800, 9)
+    envelope[positions] = np.linspace(1, 2, len(positions))
+    expected, _ = find_peaks(envelope, height=0.5, distance=10)
+
+    got = chunked_find_peaks(lambda lo, hi: envelope[lo:hi], len(envelope), 0.5, 10, chunk=chunk)
+    np.testing.assert_array_equal(got, expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_find_peaks_on_noise(seed):
+    rng = np.random.default_rng(seed)
+    envelope = np.abs(rng.standard_normal(20_000))
+    expected, _ = find_peaks(envelope, height=0.5, distance=40)
+
+    got = chunked_find_peaks(lambda lo, hi: envelope[lo:hi], len(envelope), 0.5, 40, chunk=1000)
+    np.testing.assert_array_equal(got, expected)
@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ekg_system import cli
+from ekg_system.simulator import synthetic_ecg
+
+
+def test_find_recordings_skips_annotations(tmp_path):
+    for name in ("a.csv", "b.npy", "peaks_b.txt", "c.peaks.npy", "c.txt", "notes.md"):
+        (tmp_path / name).write_text("")
+
+    found = [os.path.basename(p) for p in cli.find_recordings([str(tmp_path)])]
+    assert found == ["a.csv", "b.npy", "c.txt"]
+
+
+def test_report_names_are_unique():
+    paths = ["x/rec.csv", "y/rec.csv", "y/other.npy"]
+    names = cli.report_names(paths)
+
+    assert len(set(names)) == 3
+    assert names[2] == "other"
+    assert all(n.startswith("rec-") for n in names[:2])
+
+
+@pytest.mark.filterwarnings("ignore:genfromtxt")
+def test_batch_run(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    signal, truth = synthetic_ecg(1000, 20, hr_bpm=500, seed=6)
+    np.save(data / "rec.npy", signal)
+    np.save(data / "rec.peaks.npy", truth)
+    (data / "broken.csv").write_text("time,value\n")
+
+    out = tmp_path / "out"
+    status = cli.main([str(data), "-o", str(out), "-j", "1", "-q"])
+
+    assert status == 1  # broken.csv fails, rec.npy does not
+    summary = pd.read_csv(out / "summary.csv").set_index("status")
+    assert list(summary.index.sort_values()) == ["error", "ok"]
+    with open(out / "rec.json") as f:
+        report = json.load(f)
+    assert abs(report["mean_heart_rate"] - 500) < 10
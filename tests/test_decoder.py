@@ -0,0 +1,82 @@
+import numpy as np
+
+from ekg_system.microcontroller import LinkStats, MSP430Interface
+from ekg_system.simulator import encode_packets
+
+
+def be24(b):
+    v = (b[0] << 16) | (b[1] << 8) | b[2]
+    return v - (1 << 24) if v & 0x800000 else v
+
+
+def decode_naive(buf):
+    # the old one-packet-at-a-time framing loop
+    out = []
+    while len(buf) >= 12:
+        idx = buf.find(MSP430Interface.SYNC)
+        if idx < 0:
+            del buf[:-1]
+            break
+        if idx:
+            del buf[:idx]
+            continue
+        if len(buf) < 12:
+            break
+        pkt = bytes(buf[:12])
+        del buf[:12]
+        out.append((int.from_bytes(pkt[2:6], "little"), be24(pkt[6:9]), be24(pkt[9:12])))
+    return out
+
+
+def stream(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1000, 1000 + n)
+    ch1 = rng.integers(-(1 << 23), 1 << 23, n)
+    ch2 = rng.integers(-(1 << 23), 1 << 23, n)
+    return ids, ch1, ch2
+
+
+def decode_in_reads(data, read_size, stats=None):
+    buf = bytearray()
+    out = []
+    for start in range(0, len(data), read_size):
+        buf.extend(data[start:start + read_size])
+        sids, ch1, ch2, consumed = MSP430Interface.decode_block(buf, stats)
+        del buf[:consumed]
+        out.extend(zip(sids.tolist(), ch1.tolist(), ch2.tolist()))
+    return out
+
+
+def test_clean_stream_round_trips():
+    ids, ch1, ch2 = stream(500)
+    sids, d1, d2, consumed = MSP430Interface.decode_block(bytearray(encode_packets(ids, ch1, ch2)))
+
+    assert consumed == 500 * MSP430Interface.PACKET_LEN
+    assert sids.dtype == np.uint32
+    np.testing.assert_array_equal(sids, ids)
+    np.testing.assert_array_equal(d1, ch1)
+    np.testing.assert_array_equal(d2, ch2)
+
+
+def test_packets_split_across_reads():
+    ids, ch1, ch2 = stream(300)
+    data = encode_packets(ids, ch1, ch2)
+
+    for read_size in (1, 5, 12, 13, 4096):
+        assert decode_in_reads(data, read_size) == list(zip(ids.tolist(), ch1.tolist(), ch2.tolist()))
+
+
+def test_garbage_and_corruption_match_naive_framing():
+    ids, ch1, ch2 = stream(400, seed=1)
+    data = bytearray(encode_packets(ids, ch1, ch2))
+    rng = np.random.default_rng(2)
+    for pos in rng.choice(len(data), 40, replace=False):
+        data[pos] = int(rng.integers(256))
+    data = bytes(b"\x00\xA5\x13") + bytes(data)
+
+    stats = LinkStats()
+    got = decode_in_reads(data, 97, stats)
+
+    assert got == decode_naive(bytearray(data))
+    assert stats.resyncs > 0
+    assert stats.skipped_bytes > 0
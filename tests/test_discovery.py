@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pytest
+
+from ekg_system import discovery
+from ekg_system.simulator import FakeSerial, PacketStream
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("EKG_CACHE_DIR", str(tmp_path))
+
+
+def serial_factory(board):
+    # `board` streams packets, every other port opens but stays silent
+    def open_port(device, baudrate=115200, timeout=1.0):
+        stream = PacketStream(np.zeros(10_000) if device == board else np.zeros(0))
+        return FakeSerial(stream, speed=1.0, timeout=timeout)
+    return open_port
+
+
+def test_discover_finds_the_streaming_port():
+    devices = [f"/dev/tty{i}" for i in range(8)]
+    port = discovery.discover(serial_factory=serial_factory("/dev/tty5"), devices=devices, timeout=0.5)
+
+    assert port == "/dev/tty5"
+    assert discovery.load_last_port() == "/dev/tty5"
+
+
+def test_discover_none():
+    assert discovery.discover(serial_factory=serial_factory(None), devices=["a", "b"], timeout=0.2) is None
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class SlowClose(FakeSerial):
+    # closing a real port can take a while
+    def close(self):
+        time.sleep(0.3)
+        super().close()
+
+
+def test_watcher_reports_a_failed_reader_but_not_a_stop():
+    from ekg_system.microcontroller import MSP430Interface
+
+    mcu = MSP430Interface(
+        serial_factory=lambda *args, **kw: SlowClose(PacketStream(np.zeros(100_000)), speed=1.0),
+        port="sim://",
+    )
+    events = []
+    watcher = discovery.PortWatcher(
+        mcu, lambda port: events.append("up"), lambda port: events.append("lost"), interval=0.02,
+    )
+    watcher.start()
+    try:
+        assert wait_for(lambda: events == ["up"])
+
+        mcu.start(batch_callback=lambda *block: None)
+        time.sleep(0.1)
+        mcu.stop()
+        time.sleep(0.1)
+        assert events == ["up"]
+
+        def fail(*block):
+            raise OSError("device unplugged")
+
+        mcu.start(batch_callback=fail)
+        assert wait_for(lambda: "lost" in events)
+        assert isinstance(mcu.error, OSError)
+    finally:
+        watcher.stop()
+        mcu.stop()
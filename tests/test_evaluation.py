@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from ekg_system import evaluation
+
+
+def match_naive(detected, truth, tolerance):
+    # the original nested loop from test_ecg.py
+    pairs = []
+    used = set()
+    for j, t in enumerate(truth):
+        for i, d in enumerate(detected):
+            if i in used:
+                continue
+            if abs(d - t) <= tolerance:
+                pairs.append((j, i))
+                used.add(i)
+                break
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_match_peaks_matches_the_nested_loop(seed):
+    rng = np.random.default_rng(seed)
+    truth = np.sort(rng.choice(5000, rng.integers(1, 200), replace=False))
+    # jittered detections, some missed, some extra, some crowded together
+    kept = truth[rng.random(len(truth)) > 0.1]
+    detected = kept + rng.integers(-15, 16, len(kept))
+    detected = np.concatenate([detected, rng.integers(0, 5000, rng.integers(0, 40))])
+    detected = np.sort(detected)
+    tolerance = int(rng.integers(0, 30))
+
+    t_idx, d_idx = evaluation.match_peaks(detected, truth, tolerance)
+    assert sorted(zip(t_idx.tolist(), d_idx.tolist())) == match_naive(detected, truth, tolerance)
+
+
+def test_peak_metrics():
+    truth = np.array([100, 200, 300, 400])
+    detected = np.array([102, 199, 350, 401, 500])
+
+    m = evaluation.peak_metrics(detected, truth, tolerance=5, sampling_rate=1000)
+    assert (m["tp"], m["fp"], m["fn"]) == (3, 2, 1)
+    assert m["sensitivity"] == pytest.approx(0.75)
+    assert m["ppv"] == pytest.approx(0.6)
+
+
+def test_find_pairs_reports_unpaired(tmp_path):
+    for name in ("ecg_Mouse_01.csv", "peaks_Mouse_01.txt", "rec.npy", "rec.peaks.npy",
+                 "peaks_Mouse_02.txt", "lonely.peaks.txt"):
+        (tmp_path / name).write_text("")
+
+    pairs, unpaired = evaluation.find_pairs(str(tmp_path))
+    assert [(os.path.basename(s), os.path.basename(a)) for s, a in pairs] == [
+        ("ecg_Mouse_01.csv", "peaks_Mouse_01.txt"),
+        ("rec.npy", "rec.peaks.npy"),
+    ]
+    assert sorted(os.path.basename(p) for p in unpaired) == ["lonely.peaks.txt", "peaks_Mouse_02.txt"]
+
+
+def test_repo_corpus_is_reported_not_silently_empty(capsys):
+    corpus = os.path.join(os.path.dirname(__file__), "..", "R-peak test")
+    assert evaluation.main([corpus, "-q"]) == 2
+    assert "peaks_Mouse_01.txt: no signal file found" in capsys.readouterr().err
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scipy.signal import butter, sosfilt, sosfilt_zi, sosfiltfilt
+
+from ekg_system.filters import StreamingBandpassFilter, design_filter
+from ekg_system.processor import EKGProcessor
+from ekg_system.simulator import synthetic_ecg
+
+
+@pytest.fixture(scope="module")
+def ecg():
+    signal, _ = synthetic_ecg(1000, 10, seed=7)
+    return signal + 0.3  # a DC offset, like the raw ADC signal
+
+
+@pytest.mark.parametrize("block", [1, 13, 1000])
+def test_streaming_blocks_equal_one_pass(ecg, block):
+    f = StreamingBandpassFilter(1000)
+    out = np.concatenate([f.process(ecg[i:i + block]) for i in range(0, len(ecg), block)])
+
+    expected, _ = sosfilt(f.sos, ecg, zi=sosfilt_zi(f.sos) * ecg[0])
+    np.testing.assert_allclose(out, expected, rtol=0, atol=1e-12)
+
+
+def test_streaming_two_channels_and_reset(ecg):
+    f = StreamingBandpassFilter(1000)
+    both = f.process(np.column_stack([ecg, 2 * ecg]))
+    np.testing.assert_allclose(both[:, 1], 2 * both[:, 0], atol=1e-12)
+
+    with pytest.raises(ValueError):
+        f.process(ecg[:10])
+    f.reset()
+    assert f.process(ecg[:10]).shape == (10,)
+
+
+def test_designs_are_memoized_copies():
+    a = design_filter(1000, 1.0, 100.0)
+    a[:] = 0
+    b = design_filter(1000.0, 1, 100)
+
+    assert np.any(b != 0)
+    np.testing.assert_array_equal(b, butter(4, [1 / 500, 100 / 500], btype="band", output="sos"))
+
+
+def test_offline_filter_matches_sos_filtfilt(ecg):
+    processor = EKGProcessor(sampling_rate=1000)
+    processor.load_data(ecg)
+    processor.filter_signal()
+
+    expected = sosfiltfilt(butter(4, [1 / 500, 100 / 500], btype="band", output="sos"), ecg)
+    np.testing.assert_allclose(processor.filtered_data, expected, atol=1e-12)
+    # the slow drift is removed, not amplified
+    assert abs(processor.filtered_data.mean()) < 0.01
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import pytest
+
+from ekg_system.microcontroller import LinkStats
+from ekg_system.simulator import PacketStream, simulated_interface
+
+
+def track_all(ids, blocks):
+    stats = LinkStats()
+    for part in np.array_split(np.asarray(ids, dtype=np.uint32), blocks):
+        stats.track(part)
+    stats.flush()
+    return stats
+
+
+@pytest.mark.parametrize("blocks", [1, 3, 17, 100])
+def test_gaps_are_counted_at_any_block_size(blocks):
+    ids = list(range(100)) + list(range(103, 200)) + list(range(210, 300))
+    stats = track_all(ids, blocks)
+
+    assert (stats.dropped_samples, stats.gaps) == (13, 2)
+    assert stats.packets == len(ids)
+    assert stats.expected_sid == 300
+
+
+def test_gap_in_the_last_packets_is_counted_on_flush():
+    ids = np.arange(50, dtype=np.uint32)
+    ids[-1] += 2
+
+    stats = LinkStats()
+    stats.track(ids)
+    assert stats.dropped_samples == 0  # still held back
+
+    stats.flush()
+    assert (stats.dropped_samples, stats.gaps) == (2, 1)
+
+
+def test_corrupted_ids_and_resets_are_not_losses():
+    ids = list(range(1000))
+    ids[500] = 0x7F000000 + 500   # one corrupted high byte
+    ids[501] = 3                  # ... and a low one right after
+    ids += list(range(0, 100))    # board reset
+    ids += [2**32 - 2, 2**32 - 1, 0, 1, 2]
+
+    stats = track_all(ids, 7)
+    assert stats.dropped_samples == 0
+
+
+def test_simulated_drops_are_counted_exactly():
+    stream = PacketStream.synthetic(10, drop_rate=0.01, seed=3)
+    mcu = simulated_interface(stream, speed=0)
+    mcu.start(batch_callback=lambda *block: None)
+
+    deadline = time.monotonic() + 10
+    while mcu.stats.packets + stream.dropped < 10_000 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    mcu.stop()
+
+    assert mcu.stats.packets == stream.sent
+    assert stream.dropped > 0
+    assert mcu.stats.dropped_samples == stream.dropped
+
+
+@pytest.mark.parametrize("ids, dropped", [
+    ([0] + list(range(5, 60)), 4),             # gap right after the first packet
+    ([0, 1] + list(range(5, 60)), 3),          # ... after the second
+    ([0, 999_999] + list(range(2, 60)), 0),    # corrupted second id
+])
+def test_first_packets_are_accounted(ids, dropped):
+    for blocks in (1, 4):
+        stats = track_all(ids, blocks)
+        assert stats.dropped_samples == dropped
+        assert stats.gaps == (1 if dropped else 0)
+        assert stats.expected_sid == 60
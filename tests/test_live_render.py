@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from ekg_system.live_render import FrameScheduler, YRangeHysteresis, minmax_decimate
+
+
+def test_minmax_decimate_keeps_extremes():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 50)
+    y[1234] = 7.0
+
+    dx, dy = minmax_decimate(x, y, 300)
+    assert len(dy) == 600
+    assert dy.max() == 7.0
+    assert dy.min() == y.min()
+
+
+def test_y_range_only_grows_until_held_small():
+    r = YRangeHysteresis(margin=0.1, shrink=0.4, hold=3)
+    assert r.update(-1, 1) is not None
+    assert r.update(-0.5, 0.5) is None
+    assert r.update(-2, 1) is not None
+
+    assert r.update(-0.1, 0.1) is None
+    assert r.update(-0.1, 0.1) is None
+    assert r.update(-0.1, 0.1) is not None
+
+
+def test_frame_time_includes_the_paint():
+    frames = FrameScheduler(interval=0.01, budget=0.5, max_interval=1.0)
+
+    frames.begin()
+    frames.end()
+    time.sleep(0.05)   # Qt paints after the tick that updated the curves
+    frames.painted()
+    frames.painted()   # both plots
+    assert frames.due(time.perf_counter() + 1.0)
+
+    assert frames.frame_time >= 0.05
+    assert frames.interval >= 0.1  # stretched to keep drawing within budget
+
+
+def test_paints_outside_a_frame_are_ignored():
+    frames = FrameScheduler(interval=0.01)
+    frames.begin()
+    frames.end()
+    frames.due()
+    time.sleep(0.02)
+    frames.painted()   # e.g. a resize
+
+    assert frames.frame_time < 0.02
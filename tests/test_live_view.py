@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from ekg_system.arrhythmia_detector import ArrhythmiaType
+from ekg_system.capture import CaptureWriter
+from ekg_system.evaluation import match_peaks
+from ekg_system.simulator import mv_to_code, synthetic_ecg
+
+
+def block(start, n=100):
+    sids = np.arange(start, start + n, dtype=np.uint32)
+    return sids, np.zeros(n, dtype=np.int32), np.zeros(n, dtype=np.int32)
+
+
+def test_capture_failure_keeps_streaming(live_view, qapp, tmp_path):
+    writer = CaptureWriter(str(tmp_path / "c.ekgb"), fs=1000, gain=6, vref=2.42)
+    writer.start()
+    writer.close()  # any later write raises, like after a disk error
+    live_view._writer = writer
+
+    live_view.on_block(*block(0), 0.0)
+    live_view.on_block(*block(100), 0.0)
+    qapp.processEvents()
+
+    assert live_view._writer is None
+    assert live_view._q.stats()["samples_in"] == 200
+    assert "Capture stopped" in live_view.status.text()
+
+
+def feed(view, signal, sids, block_size=50):
+    codes = mv_to_code(signal)
+    for i in range(0, len(sids), block_size):
+        part = slice(i, i + block_size)
+        view.on_block(sids[part], codes[part], codes[part], 0.0)
+        view.update_plot()
+
+
+def test_gaps_in_sample_ids_do_not_fake_beats(live_view):
+    signal, truth = synthetic_ecg(1000, 30, hr_bpm=500, seed=6)
+    # 1.23 s lost on the link and, in the middle of a block, 7 more samples
+    keep = np.ones(len(signal), dtype=bool)
+    keep[12000:13230] = False
+    keep[20003:20010] = False
+    sids = np.flatnonzero(keep).astype(np.uint32)
+
+    events = []
+    add_peaks = live_view.rhythm.add_peaks
+    live_view.rhythm.add_peaks = lambda peaks: events.extend(add_peaks(peaks)) or []
+    feed(live_view, signal[keep], sids)
+
+    # the jitter can look irregular, but nothing spans a gap as a pause
+    assert live_view.beats_seen > 200
+    assert {t for t, _, _ in events} <= {ArrhythmiaType.IRREGULAR}
+    assert live_view.peak_detector.heart_rate() == pytest.approx(500, rel=0.05)
+    # peak indices are sample ids: the last beats line up with the truth
+    recent = np.asarray(live_view.peak_detector._recent)
+    matched, _ = match_peaks(recent, truth, tolerance=10)
+    assert len(matched) == len(recent)
+
+
+def test_queue_drops_are_skipped_by_the_detector(live_view):
+    signal, _ = synthetic_ecg(1000, 4, seed=7)
+    codes = mv_to_code(signal)
+    sids = np.arange(len(signal), dtype=np.uint32)
+
+    live_view.on_block(sids[:2000], codes[:2000], codes[:2000], 0.0)
+    live_view.update_plot()
+
+    # the GUI stalls: the queue only keeps its newest samples
+    live_view._q.max_samples = 1000
+    for i in range(2000, 4000, 100):
+        live_view.on_block(sids[i:i + 100], codes[i:i + 100], codes[i:i + 100], 0.0)
+    live_view.update_plot()
+
+    assert live_view._q.dropped_samples == 1000
+    assert live_view.peak_detector.samples_seen == 4000
+    assert live_view._next_sid == 4000
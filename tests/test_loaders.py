@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from ekg_system.loaders import (
+    csv_cache_path,
+    find_txt_data_offset,
+    iter_txt_samples,
+    load_csv,
+    read_txt_samples,
+    sniff_csv,
+)
+
+
+HEADER = "---\nMammal:            mouse\nFs:                1000\n---\n"
+
+
+@pytest.fixture
+def txt_file(tmp_path):
+    values = np.round(np.random.default_rng(0).normal(size=5000), 6)
+    path = tmp_path / "rec.txt"
+    path.write_text(HEADER + "\n".join(f"{v:.6f}" for v in values) + "\n")
+    return str(path), values
+
+
+def test_txt_data_offset(txt_file):
+    path, _ = txt_file
+    assert find_txt_data_offset(path) == len(HEADER)
+
+
+@pytest.mark.parametrize("chunk_bytes", [64, 1000, 1 << 20])
+def test_txt_samples_across_chunk_boundaries(txt_file, chunk_bytes):
+    path, values = txt_file
+    np.testing.assert_allclose(read_txt_samples(path, chunk_bytes=chunk_bytes), values)
+    assert sum(len(c) for c in iter_txt_samples(path, chunk_bytes=chunk_bytes)) == len(values)
+
+
+def test_txt_integer_samples(tmp_path):
+    path = tmp_path / "peaks.txt"
+    path.write_text(HEADER + "12\n250\r\n\n4096\n")
+    peaks = read_txt_samples(str(path), dtype=int)
+    assert peaks.tolist() == [12, 250, 4096]
+
+
+def test_sniff_lab_export(tmp_path):
+    path = tmp_path / "lab.csv"
+    path.write_text("Time,ECG,\n16.45,3.740625,\n16.451,3.75,\n")
+
+    layout = sniff_csv(str(path))
+    assert layout["delimiter"] == ","
+    assert layout["header"] and layout["trailing_delimiter"]
+    assert layout["value_column"] == 1
+
+
+def test_csv_leads_and_sidecar_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("EKG_CACHE_DIR", str(tmp_path / "cache"))
+    rows = np.random.default_rng(1).normal(size=(200, 3))
+    path = str(tmp_path / "rec.csv")
+    np.savetxt(path, rows, delimiter=";", header="t;a;b", comments="")
+
+    np.testing.assert_allclose(load_csv(path), rows[:, 1])
+    np.testing.assert_allclose(load_csv(path, multichannel=True), rows[:, 1:])
+
+    cached = csv_cache_path(path)
+    assert os.path.exists(cached)
+    assert isinstance(load_csv(path, mmap=True), np.memmap)
+
+    # an edited file never hits the old entry
+    np.savetxt(path, rows[:50], delimiter=";", header="t;a;b", comments="")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert len(load_csv(path)) == 50
@@ -0,0 +1,57 @@
+import numpy as np
+
+from ekg_system.processor import EKGProcessor
+from ekg_system.simulator import synthetic_ecg
+
+
+def two_leads():
+    lead1, beats = synthetic_ecg(1000, 20, seed=2)
+    rng = np.random.default_rng(2)
+    lead2 = -0.6 * lead1 + 0.05 * rng.standard_normal(len(lead1))
+    return np.column_stack([lead1, lead2]), beats
+
+
+def single(signal):
+    p = EKGProcessor(sampling_rate=1000)
+    p.load_data(signal)
+    p.filter_signal()
+    p.detect_r_peaks()
+    return p
+
+
+def test_leads_match_separate_runs():
+    data, _ = two_leads()
+    multi = EKGProcessor(sampling_rate=1000)
+    multi.load_data(data)
+    assert multi.n_leads == 2
+    multi.filter_signal()
+    multi.detect_r_peaks()
+
+    for j in range(2):
+        one = single(data[:, j])
+        np.testing.assert_allclose(multi.filtered_data[:, j], one.filtered_data, atol=1e-12)
+        np.testing.assert_array_equal(multi.lead_peaks[j], one.peaks)
+    np.testing.assert_array_equal(multi.peaks, multi.lead_peaks[0])
+
+
+def test_fused_and_chunked_detection(tmp_path):
+    data, beats = two_leads()
+    path = tmp_path / "leads.npy"
+    np.save(path, data)
+
+    memory = EKGProcessor(sampling_rate=1000)
+    memory.load_data(data)
+    memory.filter_signal()
+    fused = memory.detect_r_peaks(fuse=True)
+    assert len(fused) == len(beats)
+    assert np.abs(fused - beats).max() <= 3
+
+    lazy = EKGProcessor(sampling_rate=1000, chunk_size=3000)
+    lazy.load_data(str(path), mmap=True)
+    lazy.filter_signal()
+    np.testing.assert_allclose(lazy.filtered_data[:], memory.filtered_data, atol=1e-9)
+    np.testing.assert_array_equal(lazy.detect_r_peaks(fuse=True), fused)
+    lazy.detect_r_peaks()
+    memory.detect_r_peaks()
+    for a, b in zip(lazy.lead_peaks, memory.lead_peaks):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from ekg_system.evaluation import match_peaks
+from ekg_system.filters import StreamingBandpassFilter
+from ekg_system.online_detector import OnlinePeakDetector
+from ekg_system.simulator import synthetic_ecg
+
+
+def detect(signal, block, fs=1000):
+    f = StreamingBandpassFilter(fs)
+    detector = OnlinePeakDetector(fs)
+    found = [detector.process(f.process(signal[i:i + block])) for i in range(0, len(signal), block)]
+    return detector, np.concatenate(found)
+
+
+@pytest.mark.parametrize("block", [1, 10, 64, 1000])
+def test_finds_the_r_waves_at_any_block_size(block):
+    signal, truth = synthetic_ecg(1000, 20, hr_bpm=500, seed=8)
+    detector, peaks = detect(signal, block)
+
+    # past the warm-up (how much of it is searched depends on the blocks)
+    start = 2 * detector.warmup
+    truth = truth[(truth >= start) & (truth < len(signal) - detector.latency_samples)]
+    peaks = peaks[peaks >= start]
+    matched, _ = match_peaks(peaks, truth, tolerance=10)
+    assert len(matched) >= 0.98 * len(truth)
+    assert len(peaks) <= len(truth) + 3
+    assert detector.heart_rate() == pytest.approx(500, rel=0.05)
+
+
+def test_same_peaks_whatever_the_blocks():
+    signal, _ = synthetic_ecg(1000, 10, seed=9)
+    _, a = detect(signal, 7)
+    _, b = detect(signal, 500)
+    np.testing.assert_array_equal(a[a >= 2000], b[b >= 2000])
+
+
+def test_skip_keeps_indices_on_sample_ids():
+    signal, truth = synthetic_ecg(1000, 20, hr_bpm=500, seed=3)
+    lost = slice(8000, 9530)  # 1.53 s never arrive
+
+    f = StreamingBandpassFilter(1000)
+    detector = OnlinePeakDetector(1000)
+    peaks = [detector.process(f.process(signal[i:i + 100])) for i in range(0, lost.start, 100)]
+    f.reset()
+    detector.skip(lost.stop - lost.start)
+    assert detector.heart_rate() is None
+    peaks += [detector.process(f.process(signal[i:i + 100])) for i in range(lost.stop, len(signal), 100)]
+    peaks = np.concatenate(peaks)
+
+    after = peaks[peaks >= lost.stop + 200]
+    expected = truth[(truth >= lost.stop + 200) & (truth < len(signal) - detector.latency_samples)]
+    matched, _ = match_peaks(after, expected, tolerance=10)
+    assert len(matched) == len(expected) == len(after)
+    assert detector.heart_rate() == pytest.approx(500, rel=0.05)
@@ -0,0 +1,45 @@
+import gc
+import os
+
+import numpy as np
+
+from ekg_system.pipeline import ParallelPipeline
+from ekg_system.processor import EKGProcessor
+from ekg_system.simulator import synthetic_ecg
+
+
+def test_matches_single_pass_and_cleans_up():
+    signal, _ = synthetic_ecg(1000, 120, seed=5)
+
+    single = EKGProcessor(sampling_rate=1000)
+    single.load_data(signal)
+    single.filter_signal()
+    expected = single.detect_r_peaks()
+
+    filtered, peaks = ParallelPipeline(sampling_rate=1000, chunk_sec=7, workers=2).run(signal)
+    np.testing.assert_allclose(filtered, single.filtered_data, rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(peaks, expected)
+
+    # the temp files live as long as any view of the result
+    tmpdir = os.path.dirname(filtered.filename)
+    view = filtered[100:200]
+    del filtered
+    gc.collect()
+    assert os.path.isdir(tmpdir)
+
+    del view
+    gc.collect()
+    assert not os.path.exists(tmpdir)
+
+
+def test_dense_peaks_match_single_pass():
+    # noise only: detection candidates chain across every chunk boundary
+    signal = np.random.default_rng(1).standard_normal(60_000)
+
+    single = EKGProcessor(sampling_rate=1000)
+    single.load_data(signal)
+    single.filter_signal()
+    expected = single.detect_r_peaks()
+
+    _, peaks = ParallelPipeline(sampling_rate=1000, chunk_sec=3, workers=2).run(signal)
+    np.testing.assert_array_equal(peaks, expected)
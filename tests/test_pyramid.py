@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+
+from ekg_system.chunked import LazyArray
+from ekg_system.pyramid import MinMaxPyramid, file_stamp, load_or_build, pyramid_path
+
+
+def test_view_keeps_every_extreme():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=100_000)
+    x[54_321] = 50.0
+
+    pyramid = MinMaxPyramid.build(x, chunk=4096)
+    vx, vy = pyramid.view(0, len(x), 800)
+
+    assert len(vy) <= 2 * 800 * 2
+    assert vy.max() == np.float32(50.0)
+    assert vy.min() == np.float32(x.min())
+
+
+def test_zoomed_in_view_is_raw():
+    x = np.arange(1000, dtype=float)
+    vx, vy = MinMaxPyramid.build(x).view(100, 200, 800)
+    np.testing.assert_array_equal(vy, x[100:201])
+
+
+def test_multi_lead_draws_lead_0(tmp_path):
+    x = np.random.default_rng(1).normal(size=(20_000, 2))
+    path = str(tmp_path / "two_leads.npy")
+    np.save(path, x)
+
+    for signal in (x, LazyArray(np.load(path, mmap_mode="r"))):
+        pyramid = MinMaxPyramid.build(signal)
+        assert pyramid.max == np.float32(x[:, 0].max())
+        np.testing.assert_array_equal(pyramid.view(0, 100, 800)[1], x[:101, 0])
+
+
+def test_saved_in_the_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("EKG_CACHE_DIR", str(tmp_path / "cache"))
+    data = tmp_path / "data"
+    data.mkdir()
+    path = str(data / "rec.npy")
+    x = np.random.default_rng(2).normal(size=50_000)
+    np.save(path, x)
+
+    built = load_or_build(x, path)
+    assert os.listdir(data) == ["rec.npy"]
+    assert os.path.exists(pyramid_path(path))
+
+    loaded = MinMaxPyramid.load(pyramid_path(path), x, file_stamp(path))
+    assert loaded is not None
+    np.testing.assert_array_equal(loaded.levels[-1][1], built.levels[-1][1])
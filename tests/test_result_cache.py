@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from ekg_system.arrhythmia_detector import ArrhythmiaDetector
+from ekg_system.processor import EKGProcessor
+from ekg_system.result_cache import ResultCache, analysis_params, signal_digest
+
+
+def analysis(seed=0):
+    rng = np.random.default_rng(seed)
+    detector = ArrhythmiaDetector(1000)
+    filtered = rng.normal(0, 1, 20_000)
+    peaks = np.cumsum(rng.integers(100, 160, 100))
+    waves = [filtered[p - 50:p + 100] for p in peaks[1:-1]]
+    report = detector.generate_report(np.diff(peaks), waves, peaks)
+    return filtered, peaks, report
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(root=str(tmp_path))
+    filtered, peaks, report = analysis()
+
+    assert cache.get("missing") is None
+    assert cache.put("k", filtered, peaks, report, 1000)
+
+    got_filtered, got_peaks, got_report = cache.get("k")
+    np.testing.assert_array_equal(got_filtered, filtered)
+    np.testing.assert_array_equal(got_peaks, peaks)
+    np.testing.assert_array_equal(got_report["arrhythmia_events"], report["arrhythmia_events"])
+    np.testing.assert_array_equal(got_report["waveform_codes"], report["waveform_codes"])
+    assert list(got_report["arrhythmia_details"]) == list(report["arrhythmia_details"])
+    assert got_report["mean_heart_rate"] == report["mean_heart_rate"]
+
+
+def test_key_follows_samples_and_settings():
+    signal = np.arange(1000.0)
+    processor = EKGProcessor(sampling_rate=1000)
+    detector = ArrhythmiaDetector(1000)
+    params = analysis_params(processor, detector)
+
+    key = ResultCache.key(signal_digest(signal), params)
+    assert key == ResultCache.key(signal_digest(signal.copy()), dict(params))
+    assert key != ResultCache.key(signal_digest(signal + 1e-9), params)
+    assert key != ResultCache.key(signal_digest(signal), analysis_params(processor, detector, highcut=150))
+    assert signal_digest(signal, chunk=7) == signal_digest(signal)
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    filtered, peaks, report = analysis()
+    cache = ResultCache(root=str(tmp_path), max_bytes=1 << 40)
+    for i, key in enumerate("abc"):
+        cache.put(key, filtered, peaks, report, 1000)
+        os.utime(os.path.join(tmp_path, key, "report.json"), (i, i))
+    cache.get("a")  # now the most recent
+
+    entry = sum(size for _, size, _ in cache.entries()) // 3
+    cache.max_bytes = 2 * entry
+    cache.evict()
+    assert sorted(key for _, _, key in cache.entries()) == ["a", "c"]
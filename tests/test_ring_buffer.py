@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from ekg_system.ring_buffer import RingBuffer
+
+
+@pytest.mark.parametrize("block", [1, 7, 100, 250])
+def test_latest_is_the_most_recent_window(block):
+    buf = RingBuffer(100, n_channels=2)
+    x = np.arange(1000, dtype=float)
+    for start in range(0, len(x), block):
+        buf.append(x[start:start + block], -x[start:start + block])
+
+    ids, neg = buf.latest()
+    np.testing.assert_array_equal(ids, x[-100:])
+    np.testing.assert_array_equal(neg, -x[-100:])
+    np.testing.assert_array_equal(buf.latest(10)[0], x[-10:])
+
+
+def test_partly_filled_and_cleared():
+    buf = RingBuffer(10)
+    buf.append(np.arange(4.0))
+    assert len(buf) == 4
+    np.testing.assert_array_equal(buf.latest()[0], np.arange(4.0))
+
+    buf.clear()
+    assert len(buf) == 0 and buf.latest().shape == (1, 0)
+
+
+def test_wrong_column_count():
+    with pytest.raises(ValueError):
+        RingBuffer(10, n_channels=2).append(np.arange(3.0))
@@ -0,0 +1,35 @@
+import threading
+
+import numpy as np
+
+from ekg_system.microcontroller import MSP430Interface
+from ekg_system.simulator import FakeSerial, PacketStream, synthetic_ecg
+
+
+def test_synthetic_ecg_peaks_are_r_waves():
+    signal, peaks = synthetic_ecg(1000, 10, hr_bpm=500, seed=0)
+    assert len(signal) == 10_000
+    assert abs(len(peaks) - 500 * 10 / 60) <= 2
+    assert np.all(signal[peaks] > 0.5)
+
+
+def test_stream_decodes_to_the_recording():
+    signal, _ = synthetic_ecg(1000, 2, seed=1)
+    stream = PacketStream(signal, start_id=10)
+
+    data = b"".join(chunk for _, chunk in stream.chunks())
+    sids, ch1, _, _ = MSP430Interface.decode_block(bytearray(data))
+
+    np.testing.assert_array_equal(sids, np.arange(10, 10 + len(signal)))
+    np.testing.assert_allclose(MSP430Interface.code_to_mv(ch1), signal, atol=1e-3)
+
+
+def test_unpaced_read_only_generates_what_is_read():
+    port = FakeSerial(PacketStream(np.zeros(1000), loop=True), speed=0)
+    result = []
+    reader = threading.Thread(target=lambda: result.append(port.read(12)), daemon=True)
+    reader.start()
+    reader.join(timeout=5)
+
+    assert result and len(result[0]) == 12
+    assert len(port._buf) < 1000 * MSP430Interface.PACKET_LEN
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from ekg_system import sweep
+from ekg_system.simulator import synthetic_ecg
+
+
+OPTIONS = {"sampling_rate": 1000, "tolerance_ms": 10, "mmap": False, "fuse": False}
+
+
+def test_parse_values():
+    assert sweep.parse_values("1,2,5") == [1.0, 2.0, 5.0]
+    assert sweep.parse_values("1.0:1.6:0.2") == [1.0, 1.2, 1.4, 1.6]
+    assert sweep.parse_values("0.5:3") == (0.5, 3.0)
+    with pytest.raises(ValueError):
+        sweep.parse_values("1:2:0")
+
+
+def test_grid_and_plan_share_filters():
+    settings = sweep.grid({"lowcut": [0.5, 1], "height_factor": [1.0, 1.2, 1.4]})
+    assert len(settings) == 6
+    with pytest.raises(ValueError):
+        sweep.grid({"lowcut": (0.5, 2.0)})
+
+    tasks = sweep.plan(settings, [("a.npy", "a.peaks.npy"), ("b.npy", "b.peaks.npy")])
+    # one task per recording and filter, every detector setting inside it
+    assert len(tasks) == 4
+    assert all(len(detectors) == 3 for *_, detectors in tasks)
+
+
+def test_random_search_stays_in_range():
+    settings = sweep.random_search({"height_factor": (1.0, 2.0), "lowcut": [0.5, 1.0]}, 50, seed=1)
+    assert all(1.0 <= s["height_factor"] <= 2.0 for s in settings)
+    assert {s["lowcut"] for s in settings} == {0.5, 1.0}
+
+
+def test_sweep_ranks_working_settings_first(tmp_path):
+    pairs = []
+    for seed in range(2):
+        signal, beats = synthetic_ecg(1000, 20, seed=seed)
+        np.save(tmp_path / f"rec{seed}.npy", signal)
+        np.save(tmp_path / f"rec{seed}.peaks.npy", beats)
+        pairs.append((str(tmp_path / f"rec{seed}.npy"), str(tmp_path / f"rec{seed}.peaks.npy")))
+
+    settings = sweep.grid({"height_factor": [1.2, 50.0], "distance_ms": [80]})
+    done = []
+    rows = sweep.run_sweep(settings, pairs, OPTIONS, workers=1,
+                           progress=lambda i, total: done.append((i, total)))
+    assert len(rows) == 4
+    assert done[-1] == (2, 2)
+
+    table = sweep.rank(rows)
+    assert list(table["height_factor"]) == [1.2, 50.0]
+    assert table["f1"].iloc[0] > 0.95
+    assert table["tp"].iloc[0] + table["fn"].iloc[0] == sum(len(np.load(a)) for _, a in pairs)
+    assert list(table["rank"]) == [1, 2]
@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+import pytest
+
+from ekg_system.simulator import synthetic_ecg
+
+
+@pytest.fixture
+def ekg_app(qapp, monkeypatch, tmp_path):
+    monkeypatch.setenv("EKG_CACHE_DIR", str(tmp_path / "cache"))
+    from ekg_system import discovery
+    monkeypatch.setattr(discovery.PortWatcher, "start", lambda self: None)
+
+    import ui_main
+    app = ui_main.EKGApp()
+    yield app
+    app.jobs.cancel()
+    app.jobs.pool.waitForDone()
+    app.deleteLater()
+
+
+def open_file(app, monkeypatch, path):
+    import ui_main
+    monkeypatch.setattr(ui_main.QFileDialog, "getOpenFileName", lambda *a, **k: (str(path), ""))
+    app.load_file()
+
+
+def wait(qapp, app, timeout=30):
+    deadline = time.monotonic() + timeout
+    while app.jobs.busy and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.01)
+    qapp.processEvents()
+    assert not app.jobs.busy
+
+
+def test_two_lead_file_loads_analyzes_and_plots(ekg_app, qapp, monkeypatch, tmp_path):
+    lead, beats = synthetic_ecg(1000, 20, seed=1)
+    path = tmp_path / "two_leads.npy"
+    np.save(path, np.column_stack([lead, -0.5 * lead]))
+
+    open_file(ekg_app, monkeypatch, path)
+    wait(qapp, ekg_app)
+    assert ekg_app.data.shape == (20_000, 2)
+    assert ekg_app.label.text().startswith("Loaded")
+
+    ekg_app.analyze_signal()
+    wait(qapp, ekg_app)
+    assert ekg_app.label.text().startswith("HR:"), ekg_app.label.text()
+
+    scatter = ekg_app.plot_widget.listDataItems()[-1]
+    x, y = scatter.getData()
+    assert len(x) == len(ekg_app.processor.peaks)
+    np.testing.assert_array_equal(y, ekg_app.processor.filtered_data[ekg_app.processor.peaks, 0])
+
+    ekg_app.show_clinical_view()
+    ekg_app.show_standard_view()
+    ekg_app.reset_zoom()
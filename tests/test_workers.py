@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ekg_system.chunked import LazyArray
+from ekg_system.processor import EKGProcessor
+from ekg_system.pyramid import MinMaxPyramid
+from ekg_system.simulator import synthetic_ecg
+
+pytest.importorskip("PySide6")
+from PySide6.QtCore import QThreadPool  # noqa: E402
+
+from ekg_system.pipeline import ParallelPipeline  # noqa: E402
+from ekg_system.workers import Cancelled, CancelToken, JobRunner  # noqa: E402
+
+
+@pytest.fixture
+def runner(qapp):
+    runner = JobRunner(pool=QThreadPool())
+    events = {"progress": [], "failed": [], "cancelled": 0}
+    runner.progress.connect(lambda percent, label: events["progress"].append(label))
+    runner.failed.connect(events["failed"].append)
+    runner.cancelled.connect(lambda: events.__setitem__("cancelled", events["cancelled"] + 1))
+    runner.events = events
+    yield runner
+    runner.cancel()
+    runner.pool.waitForDone()
+
+
+def settle(qapp, runner, timeout=10):
+    # let every job finish and deliver its queued signals
+    deadline = time.monotonic() + timeout
+    while (runner.busy or runner._jobs) and time.monotonic() < deadline:
+        runner.pool.waitForDone(10)
+        qapp.processEvents()
+    qapp.processEvents()
+
+
+def test_results_of_a_replaced_job_are_dropped(qapp, runner):
+    release = threading.Event()
+    finished = []
+
+    def slow(state, cancel):
+        release.wait(5)
+        state["job"] = "old"
+
+    runner.start([("Slow", slow)], finished.append)
+    runner.start([("Fast", lambda state, cancel: state.update(job="new"))], finished.append)
+    release.set()
+    settle(qapp, runner)
+
+    assert finished == [{"job": "new"}]
+    assert not runner.busy
+
+
+def test_cancel_stops_before_the_next_stage(qapp, runner):
+    started = threading.Event()
+    release = threading.Event()
+    ran = []
+
+    def first(state, cancel):
+        started.set()
+        release.wait(5)
+        ran.append("first")
+
+    runner.start([("First", first), ("Second", lambda state, cancel: ran.append("second"))],
+                 lambda state: ran.append("finished"))
+    assert started.wait(5)
+    runner.cancel()
+    release.set()
+    settle(qapp, runner)
+
+    assert ran == ["first"]
+    assert runner.events["cancelled"] == 1
+    assert not runner.busy
+
+
+def test_stage_errors_reach_failed(qapp, runner):
+    def broken(state, cancel):
+        raise ValueError("no samples in file")
+
+    finished = []
+    runner.start([("Loading", broken)], finished.append)
+    settle(qapp, runner)
+
+    assert runner.events["failed"] == ["no samples in file"]
+    assert finished == []
+    assert not runner.busy
+
+
+def test_long_stages_stop_inside_their_chunk_loops(tmp_path):
+    signal, _ = synthetic_ecg(1000, 30, seed=2)
+    np.save(tmp_path / "ecg.npy", signal)
+
+    class CancelAfter(CancelToken):
+        # cancels itself once `checks` chunks have gone by
+        def __init__(self, checks):
+            super().__init__()
+            self.checks = checks
+
+        def check(self):
+            self.checks -= 1
+            if self.checks < 0:
+                self.cancel()
+            super().check()
+
+    processor = EKGProcessor(sampling_rate=1000, chunk_size=1000)
+    processor.load_data(str(tmp_path / "ecg.npy"), mmap=True)
+    assert isinstance(processor.raw_data, LazyArray)
+    with pytest.raises(Cancelled):
+        processor.filter_signal(cancel=CancelAfter(3))
+
+    in_memory = EKGProcessor(sampling_rate=1000, chunk_size=1000)
+    in_memory.load_data(signal)
+    with pytest.raises(Cancelled):
+        in_memory.filter_signal(cancel=CancelAfter(3))
+
+    # uncancelled, the chunked in-memory filter gives the usual result
+    in_memory.filter_signal(cancel=CancelToken())
+    reference = EKGProcessor(sampling_rate=1000)
+    reference.load_data(signal)
+    reference.filter_signal()
+    np.testing.assert_allclose(in_memory.filtered_data, reference.filtered_data, atol=1e-9)
+
+    with pytest.raises(Cancelled):
+        in_memory.detect_r_peaks(cancel=CancelAfter(0))
+    with pytest.raises(Cancelled):
+        MinMaxPyramid.build(signal, chunk=1024, cancel=CancelAfter(5))
+
+
+def test_cancelled_pipeline_cleans_up(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    signal, _ = synthetic_ecg(1000, 30, seed=3)
+    token = CancelToken()
+    token.cancel()
+
+    with pytest.raises(Cancelled):
+        ParallelPipeline(sampling_rate=1000, chunk_sec=5, workers=2).run(signal, cancel=token)
+    assert os.listdir(tmp_path) == []
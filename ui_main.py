@@ -1,15 +1,17 @@
-import numpy as np
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QFileDialog, QLabel
+    QPushButton, QFileDialog, QLabel, QProgressBar
 )
 from PySide6.QtCore import Qt
 import pyqtgraph as pg
 
 from ekg_system.processor import EKGProcessor
 from ekg_system.arrhythmia_detector import ArrhythmiaDetector
-from ekg_system.clinical_pg_view import ClinicalPGView
+from ekg_system.clinical_pg_view import ClinicalPGView, DecimatedCurve
 from ekg_system.live_pg_view import LivePGView
+from ekg_system.pyramid import MinMaxPyramid, first_lead, load_or_build
+from ekg_system.result_cache import ResultCache, analysis_params, signal_digest
+from ekg_system.workers import JobRunner
 
 
 def style_ecg_plot(plot_widget):
@@ -36,8 +38,17 @@ class EKGApp(QWidget):
         self.detector = ArrhythmiaDetector(sampling_rate=1000)
 
         self.data = None
+        self.data_digest = None
         self.last_bpm = None
 
+        # min/max pyramids of the raw and filtered signal for plotting
+        self.raw_pyramid = None
+        self.filtered_pyramid = None
+        self.curve = None
+
+        # finished analyses by signal content + settings
+        self.results = ResultCache()
+
         main_layout = QVBoxLayout(self)
 
         row = QHBoxLayout()
@@ -64,12 +75,17 @@ class EKGApp(QWidget):
         self.reset_btn.setFixedSize(200, 50)
         self.reset_btn.clicked.connect(self.reset_zoom)
 
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setFixedSize(200, 50)
+        self.cancel_btn.setEnabled(False)
+
         for btn in (
             self.live_btn,
             self.load_btn,
             self.analyze_btn,
             self.clinical_btn,
-            self.reset_btn
+            self.reset_btn,
+            self.cancel_btn
         ):
             row.addWidget(btn)
 
@@ -80,6 +96,19 @@ class EKGApp(QWidget):
         self.label.setStyleSheet("font-size: 16px; padding: 8px;")
         main_layout.addWidget(self.label)
 
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        self.progress.hide()
+        main_layout.addWidget(self.progress)
+
+        # loading and analysis run off the GUI thread; starting a new job
+        # cancels the old one and its late results are ignored
+        self.jobs = JobRunner(self)
+        self.jobs.progress.connect(self.on_job_progress)
+        self.jobs.failed.connect(self.on_job_failed)
+        self.jobs.busy_changed.connect(self.on_job_busy)
+        self.cancel_btn.clicked.connect(self.cancel_job)
+
         self.plot_widget = pg.PlotWidget()
         self.plot_widget.setLabel("bottom", "Time (s)")
         self.plot_widget.setLabel("left", "Amplitude (mV)")
@@ -101,24 +130,29 @@ class EKGApp(QWidget):
         self.plot_widget.show()
         self.label.show()
 
+        self.clear_plot()
+
         if self.data is None:
-            self.plot_widget.clear()
             return
 
         fs = self.processor.sampling_rate
-        t = np.arange(len(self.data)) / fs
-
-        self.plot_widget.clear()
-        self.plot_widget.plot(
-            t,
-            self.data,
-            pen=pg.mkPen(color="black", width=1.2)
-        )
 
         style_ecg_plot(self.plot_widget)
         self.plot_widget.setXRange(0, min(10, len(self.data) / fs), padding=0)
+        self.curve = DecimatedCurve(
+            self.plot_widget,
+            self.raw_pyramid,
+            fs,
+            pen=pg.mkPen(color="black", width=1.2)
+        )
         self.plot_widget.enableAutoRange(axis="y")
 
+    def clear_plot(self):
+        if self.curve is not None:
+            self.curve.detach()
+            self.curve = None
+        self.plot_widget.clear()
+
     def show_live_view(self):
         if self.clinical_view:
             self.clinical_view.hide()
@@ -146,17 +180,19 @@ class EKGApp(QWidget):
             self.clinical_view.setParent(None)
             self.clinical_view.deleteLater()
 
-        signal_to_show = (
-            self.processor.filtered_data
-            if self.processor.filtered_data is not None
-            else self.data
-        )
+        if self.processor.filtered_data is not None:
+            signal_to_show = self.processor.filtered_data
+            pyramid = self.filtered_pyramid
+        else:
+            signal_to_show = self.data
+            pyramid = self.raw_pyramid
 
         self.clinical_view = ClinicalPGView(
             parent=self,
-            signal=signal_to_show,
+            signal=first_lead(signal_to_show),
             fs=self.processor.sampling_rate,
-            window_sec=10
+            window_sec=10,
+            pyramid=pyramid
         )
 
         self.layout().addWidget(self.clinical_view)
@@ -167,27 +203,48 @@ class EKGApp(QWidget):
 
     def load_file(self):
         path, _ = QFileDialog.getOpenFileName(
-            self, "Select EKG File", "", "CSV/TXT/NPY (*.csv *.txt *.npy)"
+            self, "Select EKG File", "", "CSV/TXT/NPY/EKGB (*.csv *.txt *.npy *.ekgb)"
         )
 
         if not path:
             return
 
-        try:
-            self.processor.load_data(path)
-            self.data = self.processor.raw_data
-            self.last_bpm = None
+        # each job works on its own processor, the current one is only
+        # replaced when the job finishes
+        processor = EKGProcessor(sampling_rate=self.processor.sampling_rate)
+
+        def load(state, cancel):
+            processor.load_data(path)
+            state["processor"] = processor
+            state["path"] = path
 
-            filename = path.split("/")[-1]
-            self.label.setText(f"Loaded: {filename}")
+        def fingerprint(state, cancel):
+            state["digest"] = signal_digest(processor.raw_data, cancel=cancel)
 
-            self.analyze_btn.setEnabled(True)
-            self.clinical_btn.setEnabled(True)
+        def overview(state, cancel):
+            # saved in the cache dir, so reopening the file skips this
+            state["pyramid"] = load_or_build(processor.raw_data, path, cancel=cancel)
 
-            self.show_standard_view()
+        self.jobs.start(
+            [("Loading file", load), ("Fingerprinting", fingerprint), ("Building overview", overview)],
+            self.on_file_loaded,
+        )
+
+    def on_file_loaded(self, state):
+        self.processor = state["processor"]
+        self.data = self.processor.raw_data
+        self.data_digest = state["digest"]
+        self.raw_pyramid = state["pyramid"]
+        self.filtered_pyramid = None
+        self.last_bpm = None
 
-        except Exception as e:
-            self.label.setText(f"Error: {e}")
+        filename = state["path"].split("/")[-1]
+        self.label.setText(f"Loaded: {filename}")
+
+        self.analyze_btn.setEnabled(True)
+        self.clinical_btn.setEnabled(True)
+
+        self.show_standard_view()
 
     def analyze_signal(self):
         if self.data is None:
@@ -202,54 +259,122 @@ class EKGApp(QWidget):
         self.plot_widget.show()
         self.label.show()
 
-        try:
-            self.processor.filter_signal()
-            peaks = self.processor.detect_r_peaks()
-
+        processor = EKGProcessor(sampling_rate=self.processor.sampling_rate)
+        processor.raw_data = self.data
+        detector = self.detector
+        results = self.results
+        digest = self.data_digest
+
+        # defaults of filter_signal / detect_r_peaks below
+        key = results.key(digest, analysis_params(processor, detector)) if digest else None
+
+        def cache_stage(state, cancel):
+            state["processor"] = processor
+            hit = results.get(key) if key else None
+            if hit is not None:
+                processor.filtered_data, processor.peaks, state["report"] = hit
+                state["peaks"] = processor.peaks
+
+        def filter_stage(state, cancel):
+            if "report" not in state:
+                processor.filter_signal(cancel=cancel)
+
+        def detect_stage(state, cancel):
+            if "report" in state:
+                return
+            peaks = processor.detect_r_peaks(cancel=cancel)
             if peaks is None or len(peaks) < 2:
                 raise RuntimeError("Not enough peaks detected to calculate BPM")
+            state["peaks"] = peaks
+
+        def segment_stage(state, cancel):
+            if "report" not in state:
+                state["waves"] = processor.segment_waveforms(cancel=cancel)
 
+        def report_stage(state, cancel):
+            if "report" in state:
+                return
+            peaks = state["peaks"]
             rr = peaks[1:] - peaks[:-1]
-            waves = self.processor.segment_waveforms()
+            state["report"] = detector.generate_report(rr, state.pop("waves"), peaks)
+            if key:
+                results.put(key, processor.filtered_data, peaks, state["report"],
+                            processor.sampling_rate)
+
+        def overview_stage(state, cancel):
+            state["pyramid"] = MinMaxPyramid.build(processor.filtered_data, cancel=cancel)
+
+        self.jobs.start(
+            [
+                ("Checking saved results", cache_stage),
+                ("Filtering", filter_stage),
+                ("Detecting R-peaks", detect_stage),
+                ("Segmenting beats", segment_stage),
+                ("Classifying rhythm", report_stage),
+                ("Building overview", overview_stage),
+            ],
+            self.on_analysis_done,
+        )
 
-            report = self.detector.generate_report(rr, waves, peaks)
+    def on_analysis_done(self, state):
+        self.processor = state["processor"]
+        self.filtered_pyramid = state["pyramid"]
+        report = state["report"]
+        peaks = state["peaks"]
 
-            self.last_bpm = report["mean_heart_rate"]
-            arr = report["arrhythmias_detected"]
+        self.last_bpm = report["mean_heart_rate"]
+        arr = report["arrhythmias_detected"]
 
-            self.label.setText(
-                f"HR: {self.last_bpm:.1f} BPM | Arrhythmias: {arr} | Peaks: {len(peaks)}"
-            )
+        self.label.setText(
+            f"HR: {self.last_bpm:.1f} BPM | Arrhythmias: {arr} | Peaks: {len(peaks)}"
+        )
 
-            fs = self.processor.sampling_rate
-            signal = self.processor.filtered_data
-            t = np.arange(len(signal)) / fs
-            display_signal = signal
+        fs = self.processor.sampling_rate
+        signal = self.processor.filtered_data
+        # multi-lead recordings are shown (and were detected) on lead 0,
+        # like the pyramid behind the curve
+        display_signal = first_lead(signal)
+
+        self.clear_plot()
+
+        self.plot_widget.setXRange(0, min(10, len(signal) / fs), padding=0)
+        self.curve = DecimatedCurve(
+            self.plot_widget,
+            self.filtered_pyramid,
+            fs,
+            pen=pg.mkPen(color="black", width=1.2)
+        )
 
-            self.plot_widget.clear()
+        self.plot_widget.plot(
+            peaks / fs,
+            display_signal[peaks],
+            pen=None,
+            symbol="o",
+            symbolBrush="r",
+            symbolPen="r",
+            symbolSize=5
+        )
 
-            self.plot_widget.plot(
-                t,
-                display_signal,
-                pen=pg.mkPen(color="black", width=1.2)
-            )
+        style_ecg_plot(self.plot_widget)
+        self.plot_widget.setXRange(0, min(10, len(signal) / fs), padding=0)
+        self.plot_widget.enableAutoRange(axis="y")
 
-            self.plot_widget.plot(
-                peaks / fs,
-                display_signal[peaks],
-                pen=None,
-                symbol="o",
-                symbolBrush="r",
-                symbolPen="r",
-                symbolSize=5
-            )
+    def on_job_progress(self, percent, stage):
+        self.progress.setValue(percent)
+        self.progress.setFormat(f"{stage}... %p%")
 
-            style_ecg_plot(self.plot_widget)
-            self.plot_widget.setXRange(0, min(10, len(signal) / fs), padding=0)
-            self.plot_widget.enableAutoRange(axis="y")
+    def on_job_failed(self, message):
+        self.label.setText(f"Error: {message}")
+
+    def on_job_busy(self, busy):
+        self.progress.setVisible(busy)
+        self.cancel_btn.setEnabled(busy)
+        if busy:
+            self.progress.setValue(0)
 
-        except Exception as e:
-            self.label.setText(f"Error analyzing: {e}")
+    def cancel_job(self):
+        self.jobs.cancel()
+        self.label.setText("Cancelled.")
 
     def reset_zoom(self):
         if self.clinical_view and self.clinical_view.isVisible():
@@ -281,8 +406,10 @@ class EKGApp(QWidget):
             self.plot_widget.autoRange()
 
     def closeEvent(self, event):
+        self.jobs.cancel()
         if self.live_view:
             self.live_view.stop()
+            self.live_view.watcher.stop(wait=False)
         event.accept()
 
 